@@ -1,17 +1,73 @@
+from contextlib import suppress
+
+from django.contrib.auth.backends import BaseBackend
 from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import APIException
 
 from apps.chat.helpers import authenticate_user_from_token
+from apps.chat.models import User
 
+# attribute on the django `HttpRequest` holding the memoized authentication result
+REQUEST_AUTH_RESULT_ATTR = "_app_idp_auth_result"
 
-class AppIDPTokenAuthBackend(BaseAuthentication):
-    """App IDP Token Authorization Backend."""
 
-    def authenticate(self, request):
-        """Authenticate user based on IDP / SSO token and return user"""
+def authenticate_request(request):
+    """
+    Authenticate the request based on the IDP / SSO token headers. The result is computed only
+    once per request & memoized on the underlying django `HttpRequest`, so that the middleware
+    and DRF does not validate the same token twice.
+
+    Returns `(user, None)` as expected by DRF or None if the token is not passed. The
+    `AuthenticationFailed` / `IDPServiceUnavailable` is memoized & re-raised on every call.
+    """
 
+    request = getattr(request, "_request", request)  # DRF `Request` wraps the `HttpRequest`
+
+    if not hasattr(request, REQUEST_AUTH_RESULT_ATTR):
+        result, error = None, None
         auth_token = request.headers.get("Token", None)
         auth_host = request.headers.get("Issuer-Url", None)
         issuer = request.headers.get("Issuer", None)
         if auth_token:
-            return authenticate_user_from_token(auth_token, auth_host, issuer)
+            try:
+                result = authenticate_user_from_token(auth_token, auth_host, issuer)
+            except APIException as exc:
+                error = exc
+        setattr(request, REQUEST_AUTH_RESULT_ATTR, (result, error))
+
+    result, error = getattr(request, REQUEST_AUTH_RESULT_ATTR)
+    if error:
+        raise error
+    return result
+
+
+class AppIDPTokenAuthBackend(BaseAuthentication):
+    """App IDP Token Authorization Backend."""
+
+    def authenticate(self, request):
+        """Authenticate user based on IDP / SSO token and return user"""
+
+        return authenticate_request(request)
+
+
+class AppIDPTokenModelBackend(BaseBackend):
+    """
+    Django's version of the `AppIDPTokenAuthBackend`. Used by `django.contrib.auth.authenticate`
+    in the `AppAuthMiddleware`. Shares the memoized result with the DRF backend.
+    """
+
+    def authenticate(self, request, **credentials):
+        """Authenticate only based on the token headers, credential based logins are skipped."""
+
+        if request is None or credentials:
+            return None
+
+        with suppress(APIException):
+            if result := authenticate_request(request):
+                return result[0]
         return None
+
+    def get_user(self, user_id):
+        """Returns the user for the session based flows."""
+
+        return User.objects.get_or_none(pk=user_id)
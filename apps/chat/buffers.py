@@ -0,0 +1,163 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from apps.chat.models import Message
+from apps.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteBuffer:
+    """
+    Write-behind persistence of the chat messages. The consumer assigns the `uuid` & timestamps,
+    broadcasts the message & only queues it here. A writer thread per worker persists the queued
+    messages using `bulk_create`, once `write_behind_batch_size` messages are queued or after
+    `write_behind_flush_interval` seconds.
+
+    Durability -
+        > graceful shutdown : the queued messages are flushed at exit, within `write_behind_shutdown_timeout`
+        > queue full        : the message is written synchronously by the caller, never dropped
+        > write failure     : the batch is retried `write_behind_max_retries` times, then the messages
+                              are written one by one & only the failing ones are logged & dropped(Eg: the
+                              room / user deleted since the broadcast)
+        > killed worker     : the messages queued since the last flush are lost
+
+    Metrics -
+        chat_message_flush_lag_seconds: histogram(queued => persisted), chat_message_flushed,
+        chat_message_flush_failed, chat_message_dropped, chat_message_buffer_full, chat_message_buffer_size
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        metrics.register_collector(self.collect_metrics)
+
+    @property
+    def config(self):
+        """Returns the `CHAT_CONFIG`."""
+
+        return settings.CHAT_CONFIG
+
+    def get_queue(self):
+        """Returns the queue, the writer thread is started on the first call in every process."""
+
+        pid = os.getpid()
+        with self._lock:
+            if self._queue is None or self._pid != pid:
+                self._queue = queue.Queue(maxsize=self.config["write_behind_queue_size"])
+                self._pid = pid
+                self._thread = threading.Thread(target=self.run, args=(self._queue,), daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def add(self, message: Message):
+        """Queue the message without blocking. Returns False if the queue is full."""
+
+        message._queued_at = time.monotonic()
+        try:
+            self.get_queue().put_nowait(message)
+        except queue.Full:
+            metrics.increment("chat_message_buffer_full")
+            return False
+        return True
+
+    async def aadd(self, message: Message):
+        """Queue the message. Written synchronously(thread pool) if the queue is full."""
+
+        if not self.add(message):
+            await database_sync_to_async(self.write)([message])
+
+    def write(self, messages):
+        """
+        Persist the messages with a single `bulk_create`. The timestamps already broadcast are kept,
+        refer `AppPresetDateTimeField`.
+        """
+
+        with transaction.atomic():
+            Message.objects.bulk_create(messages)
+
+        now = time.monotonic()
+        for message in messages:
+            metrics.observe("chat_message_flush_lag_seconds", now - getattr(message, "_queued_at", now))
+        metrics.increment("chat_message_flushed", len(messages))
+
+    def flush(self, messages):
+        """
+        Write the batch with retries. A batch that still fails is written one message at a time, so
+        that a bad row does not take the rest of the batch with it. Called on the writer thread.
+        """
+
+        max_retries = self.config["write_behind_max_retries"]
+        for attempt in range(max_retries + 1):
+            close_old_connections()
+            try:
+                return self.write(messages)
+            except Exception as error:  # noqa
+                metrics.increment("chat_message_flush_failed")
+                logger.warning(f"MessageWriteBuffer: attempt {attempt + 1} to write {len(messages)} failed: {error}")
+                if attempt < max_retries:
+                    time.sleep(self.config["write_behind_flush_interval"])
+
+        for message in messages:
+            try:
+                self.write([message])
+            except Exception as error:  # noqa
+                metrics.increment("chat_message_dropped")
+                logger.error(
+                    f"MessageWriteBuffer: dropped message {message.uuid} of room {message.room_id} "
+                    f"by user {message.user_id}: {error}"
+                )
+
+    def run(self, messages_queue):
+        """Writer loop. A `None` in the queue stops the loop after flushing the queued messages."""
+
+        is_stopped = False
+        while not is_stopped:
+            messages = [messages_queue.get()]
+            deadline = time.monotonic() + self.config["write_behind_flush_interval"]
+            try:
+                while len(messages) < self.config["write_behind_batch_size"]:
+                    messages.append(messages_queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                pass
+
+            if None in messages:
+                is_stopped = True
+                messages = [message for message in messages if message is not None]
+                while not messages_queue.empty():
+                    messages.append(messages_queue.get_nowait())
+            if messages:
+                self.flush(messages)
+
+    def stop(self):
+        """Flush the queued messages & stop the writer. Called at exit of the worker."""
+
+        with self._lock:
+            thread, messages_queue = self._thread, self._queue
+            if not thread or not thread.is_alive() or self._pid != os.getpid():
+                return
+            self._queue = self._thread = None
+
+        messages_queue.put(None)
+        thread.join(timeout=self.config["write_behind_shutdown_timeout"])
+        if thread.is_alive():
+            logger.error("MessageWriteBuffer: unable to flush the queued messages before exit.")
+
+    def collect_metrics(self):
+        """Collector for the `MetricsRegistry`."""
+
+        return {"chat_message_buffer_size": self._queue.qsize() if self._queue else 0}
+
+
+message_buffer = MessageWriteBuffer()
+atexit.register(message_buffer.stop)
@@ -0,0 +1,410 @@
+import copy
+import hashlib
+import logging
+import time
+import uuid
+from contextlib import suppress
+
+import jwt
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from apps.common.caches import MISSING, TwoTierCache, get_redis_client
+from apps.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def get_token_hash(token, host=None, issuer=None):
+    """Returns the hash used to identify a token. The raw token is never used as a cache key."""
+
+    return hashlib.sha256(f"{issuer}|{host}|{token}".encode()).hexdigest()
+
+
+def get_token_expiry(token):
+    """Returns the `exp` claim of the token without verifying it. `None` for opaque tokens."""
+
+    with suppress(jwt.PyJWTError):
+        return jwt.decode(token, options={"verify_signature": False}).get("exp")
+    return None
+
+
+class TokenCache(TwoTierCache):
+    """
+    Cache of the already verified tokens. Maps the token hash to the resolved user & tenant ids,
+    so that repeated calls with the same bearer token does not reach the IDP / KC.
+
+    Entry schema -
+        {
+            "user": <User.pk>, "user_id": <idp user id>, "tenant_id": <idp tenant id>,
+            "exp": <timestamp>, "fresh_until": <timestamp>
+        }
+
+    The entries are never cached beyond the token's own expiry. After `fresh_until` the entry
+    is stale, it is kept for `stale_timeout` more seconds & used only when the IDP is down.
+    """
+
+    def __init__(self, stale_timeout=0, **kwargs):
+        self.stale_timeout = stale_timeout
+        super().__init__(**kwargs)
+
+    def get_user_index_key(self, user_pk):
+        """Key holding the token hashes of an user. Used for invalidation."""
+
+        return f"user:{user_pk}"
+
+    @staticmethod
+    def get_valid_entry(entry, allow_stale=False):
+        """Returns the entry only if the token is not expired. Stale entries only if `allow_stale`."""
+
+        now = time.time()
+        if not entry or (entry["exp"] and entry["exp"] <= now):
+            return None
+        if not allow_stale and entry.get("fresh_until", now + 1) <= now:
+            return None
+        return entry
+
+    def get_entry(self, token, host=None, issuer=None, allow_stale=False):
+        """Returns the cached entry for the token if it is still valid."""
+
+        return self.get_valid_entry(self.get(get_token_hash(token, host, issuer)), allow_stale)
+
+    async def aget_entry(self, token, host=None, issuer=None, allow_stale=False):
+        """Async version of the `get_entry`."""
+
+        return self.get_valid_entry(await self.aget(get_token_hash(token, host, issuer)), allow_stale)
+
+    def set_entry(self, token, host, issuer, user, exp=None):
+        """Cache the resolved user for the token, capped by the token's expiry."""
+
+        now = time.time()
+        timeout = self.timeout + self.stale_timeout
+        if exp:
+            timeout = min(timeout, int(exp - now))
+
+        token_hash = get_token_hash(token, host, issuer)
+        entry = {
+            "user": user.pk,
+            "user_id": user.user_id,
+            "tenant_id": user.tenant.tenant_id,
+            "exp": exp,
+            "fresh_until": now + self.timeout,
+        }
+        self.set(token_hash, entry, timeout=timeout)
+
+        # track the token hashes of the user, to support `invalidate_user`
+        index_key = self.get_user_index_key(user.pk)
+        token_hashes = [_ for _ in (self.get(index_key, track=False) or []) if _ != token_hash][-19:]
+        self.set(index_key, [*token_hashes, token_hash], timeout=self.timeout + self.stale_timeout)
+        return entry
+
+    async def aset_entry(self, token, host, issuer, user, exp=None):
+        """Async version of the `set_entry`."""
+
+        return await sync_to_async(self.set_entry, thread_sensitive=False)(token, host, issuer, user, exp=exp)
+
+    def invalidate(self, token, host=None, issuer=None):
+        """Remove a single token from the cache. Eg: on logout."""
+
+        self.delete(get_token_hash(token, host, issuer))
+
+    async def ainvalidate(self, token, host=None, issuer=None):
+        """Async version of the `invalidate`."""
+
+        await self.adelete(get_token_hash(token, host, issuer))
+
+    def invalidate_user(self, user_pk):
+        """
+        Remove all the cached tokens of the user. Other workers might serve the entry from their
+        local tier till the `local_timeout`.
+        """
+
+        index_key = self.get_user_index_key(user_pk)
+        for token_hash in self.get(index_key, track=False) or []:
+            self.delete(token_hash)
+        self.delete(index_key)
+
+
+class RejectedTokenCache(TwoTierCache):
+    """
+    Negative cache of the tokens rejected by the IDP / KC. Maps the token hash to the failure
+    detail, so that a client retrying a dead token is rejected without any outbound call.
+
+    Only the definitive rejections are cached, not the IDP outages. Kept short lived, as a
+    token can be rejected because of a transient state on the IDP.
+
+    Metrics - auth_token_rejected{issuer}, auth_token_rejected_hit{issuer}
+    """
+
+    @staticmethod
+    def get_issuer_label(issuer):
+        """Metric label of the issuer, the IDP tokens do not have the issuer header."""
+
+        return issuer or "IDP"
+
+    def get_rejection(self, token, host=None, issuer=None):
+        """Returns the failure detail if the token was recently rejected, else None."""
+
+        detail = self.get(get_token_hash(token, host, issuer))
+        if detail is not None:
+            metrics.increment("auth_token_rejected_hit", issuer=self.get_issuer_label(issuer))
+        return detail
+
+    async def aget_rejection(self, token, host=None, issuer=None):
+        """Async version of the `get_rejection`."""
+
+        detail = await self.aget(get_token_hash(token, host, issuer))
+        if detail is not None:
+            metrics.increment("auth_token_rejected_hit", issuer=self.get_issuer_label(issuer))
+        return detail
+
+    def reject(self, token, host, issuer, detail):
+        """Cache the rejection of the token."""
+
+        metrics.increment("auth_token_rejected", issuer=self.get_issuer_label(issuer))
+        self.set(get_token_hash(token, host, issuer), str(detail))
+
+    async def areject(self, token, host, issuer, detail):
+        """Async version of the `reject`."""
+
+        metrics.increment("auth_token_rejected", issuer=self.get_issuer_label(issuer))
+        await self.aset(get_token_hash(token, host, issuer), str(detail))
+
+
+class IdentityCache(TwoTierCache):
+    """
+    Maps the IDP id(`lookup_field`) of a Tenant / User to the model instance. Populated on the
+    upsert from the IDP data & invalidated on the model's save/delete, refer `apps.chat.signals`.
+
+    A copy of the instance is returned, so the callers can not mutate the cached instance.
+    """
+
+    def __init__(self, lookup_field, **kwargs):
+        self.lookup_field = lookup_field
+        super().__init__(**kwargs)
+
+    def get_instance(self, lookup_value):
+        """Returns the cached instance or None."""
+
+        instance = self.get(str(lookup_value), MISSING)
+        return None if instance is MISSING else copy.copy(instance)
+
+    async def aget_instance(self, lookup_value):
+        """Async version of the `get_instance`."""
+
+        instance = await self.aget(str(lookup_value), MISSING)
+        return None if instance is MISSING else copy.copy(instance)
+
+    def set_instance(self, instance):
+        """Cache the instance by its IDP id."""
+
+        self.set(str(getattr(instance, self.lookup_field)), instance)
+        return instance
+
+    async def aset_instance(self, instance):
+        """Async version of the `set_instance`."""
+
+        await self.aset(str(getattr(instance, self.lookup_field)), instance)
+        return instance
+
+    def invalidate_instance(self, instance):
+        """Remove the instance from the cache."""
+
+        self.delete(str(getattr(instance, self.lookup_field)))
+
+
+# loads the member set only if no member was removed since the loader read the version(`ARGV[1]`)
+LOAD_MEMBERS_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+for index = 3, #ARGV, 1000 do
+    redis.call('SADD', KEYS[1], unpack(ARGV, index, math.min(index + 999, #ARGV)))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class RoomMembershipCache(TwoTierCache):
+    """
+    Answers if an user is a member of a room without any query, used to authorize the
+    `ChatConsumer.connect`. The members are the `Room.users` & the experts of the room's course.
+
+        > local  : (room, user) => True, only the members are cached per worker
+        > shared : a redis set per room of the member user pks, checked with `SISMEMBER`. The set is
+                   loaded from the db on the first lookup of the room & marked with the `LOADED_MARKER`.
+
+    Kept consistent on the `Room.users` add/remove/clear & the `CourseExpert` save/delete, refer
+    `apps.chat.signals`. A removed member is dropped from the local tier of the other workers only
+    after the `local_timeout`. Without redis(Eg: locmem), the set is stored as a value on the cache.
+
+    Every removal bumps the room's version. A lookup reads the version before loading the members
+    from the db & the set is stored only if the version is unchanged, so a load racing a removal
+    can not add the removed users back.
+    """
+
+    LOADED_MARKER = "*"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._load_members_scripts = {}
+
+    @staticmethod
+    def get_local_key(room_id, user_pk):
+        """Key used on the local tier."""
+
+        return f"{room_id}:{user_pk}"
+
+    def get_room_key(self, room_id):
+        """Key of the room's member set on the shared tier, without the django cache prefix."""
+
+        return self.make_key(f"room:{room_id}")
+
+    def get_version_key(self, room_id):
+        """Key of the room's version on the shared tier, bumped on every removal."""
+
+        return self.make_key(f"room:{room_id}:version")
+
+    def get_load_members_script(self, client):
+        """Returns the registered `LOAD_MEMBERS_SCRIPT` of the client."""
+
+        if id(client) not in self._load_members_scripts:
+            self._load_members_scripts[id(client)] = client.register_script(LOAD_MEMBERS_SCRIPT)
+        return self._load_members_scripts[id(client)]
+
+    @staticmethod
+    def get_members_from_db(room_id):
+        """Returns the pks of the room's members."""
+
+        from apps.chat.models import CourseExpert, Room
+
+        members = set(Room.users.through.objects.filter(room_id=room_id).values_list("user_id", flat=True))
+        members.update(CourseExpert.objects.filter(course__room_id=room_id).values_list("user_id", flat=True))
+        return members
+
+    def is_member_on_redis(self, client, room_id, user_pk):
+        """Membership from the redis set, in a single round trip once the set is loaded."""
+
+        key = self.shared.make_key(self.get_room_key(room_id))
+        version_key = self.shared.make_key(self.get_version_key(room_id))
+        pipeline = client.pipeline(transaction=False)
+        pipeline.sismember(key, self.LOADED_MARKER)
+        pipeline.sismember(key, user_pk)
+        pipeline.get(version_key)
+        is_loaded, is_member, version = pipeline.execute()
+        if is_loaded:
+            return bool(is_member)
+
+        self.record("cache_miss")
+        members = self.get_members_from_db(room_id)
+        self.get_load_members_script(client)(
+            keys=[key, version_key], args=[version or 0, self.timeout, self.LOADED_MARKER, *members]
+        )
+        return user_pk in members
+
+    def is_member_on_cache(self, room_id, user_pk):
+        """Membership from the set stored as a value, used when the cache is not redis."""
+
+        members = self.shared.get(self.get_room_key(room_id))
+        if members is None:
+            self.record("cache_miss")
+            version = self.shared.get(self.get_version_key(room_id))
+            members = self.get_members_from_db(room_id)
+            if self.shared.get(self.get_version_key(room_id)) == version:
+                self.shared.set(self.get_room_key(room_id), members, self.timeout)
+        return user_pk in members
+
+    def is_member(self, room_id, user_pk):
+        """Returns if the user is a member of the room. Falls back to the db if redis is unavailable."""
+
+        local_key = self.get_local_key(room_id, user_pk)
+        if self.local.get(local_key, False):
+            self.record("cache_hit", tier="local")
+            return True
+
+        try:
+            client = get_redis_client(self.cache_alias)
+            if client is None:
+                is_member = self.is_member_on_cache(room_id, user_pk)
+            else:
+                is_member = self.is_member_on_redis(client, room_id, user_pk)
+            self.record("cache_hit", tier="shared")
+        except Exception as error:  # noqa
+            logger.warning(f"RoomMembershipCache: shared lookup failed: {error}")
+            is_member = user_pk in self.get_members_from_db(room_id)
+
+        if is_member:
+            self.local.set(local_key, True)
+        return is_member
+
+    def add_members(self, room_id, user_pks):
+        """Add the users to the room's member set. An unloaded set stays unloaded till the lookup."""
+
+        try:
+            client = get_redis_client(self.cache_alias)
+            if client is not None:
+                client.sadd(self.shared.make_key(self.get_room_key(room_id)), *user_pks)
+            elif (members := self.shared.get(self.get_room_key(room_id))) is not None:
+                self.shared.set(self.get_room_key(room_id), members | set(user_pks), self.timeout)
+        except Exception as error:  # noqa
+            logger.warning(f"RoomMembershipCache: unable to add the members of room {room_id}: {error}")
+
+    def remove_members(self, room_id, user_pks=()):
+        """
+        Remove the users from the room. The version is bumped & the whole set is dropped, it is
+        loaded again on the next lookup. A lookup which read the db before the removal does not
+        store its set, as the version has changed since.
+        """
+
+        for user_pk in user_pks:
+            self.local.delete(self.get_local_key(room_id, user_pk))
+        try:
+            client = get_redis_client(self.cache_alias)
+            if client is not None:
+                version_key = self.shared.make_key(self.get_version_key(room_id))
+                pipeline = client.pipeline()
+                pipeline.incr(version_key)
+                pipeline.expire(version_key, self.timeout)
+                pipeline.delete(self.shared.make_key(self.get_room_key(room_id)))
+                pipeline.execute()
+            else:
+                self.shared.set(self.get_version_key(room_id), uuid.uuid4().hex, self.timeout)
+                self.shared.delete(self.get_room_key(room_id))
+        except Exception as error:  # noqa
+            logger.warning(f"RoomMembershipCache: unable to remove the members of room {room_id}: {error}")
+
+
+token_cache = TokenCache(
+    name="chat:auth:token",
+    timeout=settings.AUTH_CACHE_CONFIG["token_ttl"],
+    stale_timeout=settings.AUTH_CACHE_CONFIG["token_stale_ttl"],
+    local_timeout=settings.AUTH_CACHE_CONFIG["token_local_ttl"],
+    local_max_size=settings.AUTH_CACHE_CONFIG["token_local_max_size"],
+)
+rejected_token_cache = RejectedTokenCache(
+    name="chat:auth:rejected",
+    timeout=settings.AUTH_CACHE_CONFIG["rejected_token_ttl"],
+    local_timeout=settings.AUTH_CACHE_CONFIG["rejected_token_ttl"],
+    local_max_size=settings.AUTH_CACHE_CONFIG["rejected_token_local_max_size"],
+)
+tenant_cache = IdentityCache(
+    lookup_field="tenant_id",
+    name="chat:identity:tenant",
+    timeout=settings.AUTH_CACHE_CONFIG["identity_ttl"],
+    local_timeout=settings.AUTH_CACHE_CONFIG["identity_local_ttl"],
+    local_max_size=settings.AUTH_CACHE_CONFIG["identity_local_max_size"],
+)
+user_cache = IdentityCache(
+    lookup_field="user_id",
+    name="chat:identity:user",
+    timeout=settings.AUTH_CACHE_CONFIG["identity_ttl"],
+    local_timeout=settings.AUTH_CACHE_CONFIG["identity_local_ttl"],
+    local_max_size=settings.AUTH_CACHE_CONFIG["identity_local_max_size"],
+)
+room_membership_cache = RoomMembershipCache(
+    name="chat:room:members",
+    timeout=settings.AUTH_CACHE_CONFIG["room_membership_ttl"],
+    local_timeout=settings.AUTH_CACHE_CONFIG["room_membership_local_ttl"],
+    local_max_size=settings.AUTH_CACHE_CONFIG["room_membership_local_max_size"],
+)
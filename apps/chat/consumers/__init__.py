@@ -1,3 +1,4 @@
 # flake8: noqa
 from .chat_consumer import ChatConsumer
+from .multi_room_consumer import MultiRoomChatConsumer
 from .ping_consumer import PingConsumer
@@ -1,13 +1,49 @@
+import asyncio
+import datetime
+
+import msgpack
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
+from apps.chat.buffers import message_buffer
+from apps.chat.caches import room_membership_cache
+from apps.chat.consumers.outbound import OutboundEventBatcher, OutboundQueue
 from apps.chat.models import Message, Room
-from apps.chat.serializers import MessageSerializer
+from apps.chat.presence import get_room_scope, get_tenant_scope, presence
+from apps.chat.serializers import serialize_message, serialize_sender
+from apps.chat.typing import get_typing_aggregator
+from apps.chat.unread import unread_counter
+
+# opt-in binary protocol, negotiated using the `Sec-WebSocket-Protocol` header
+MSGPACK_SUBPROTOCOL = "msgpack"
+
+# range of the `BigAutoField` ids, a larger cursor overflows the db parameter
+MAX_MESSAGE_ID = 2**63 - 1
 
 
 class ChatConsumer(AsyncJsonWebsocketConsumer):
-    """Consumer for Chat. Used to connect/disconnect & send/receive messages."""
+    """
+    Consumer for Chat. Used to connect/disconnect & send/receive messages.
+
+    The frames are JSON text by default. If the client offers the `MSGPACK_SUBPROTOCOL` in the
+    `Sec-WebSocket-Protocol`, the commands & events are MessagePack binary frames instead.
+
+    With `CHAT_CONFIG["coalesce_window_ms"]`, the group events are coalesced per connection into
+    `{"command": "events", "events": [...]}` frames, refer `OutboundEventBatcher`.
+
+    The group events are sent through a bounded `OutboundQueue`, a client which can not keep up is
+    closed with the `CHAT_CONFIG["slow_consumer_close_code"]` & is expected to resync the history.
+
+    The user is online in the room & the tenant while connected, the room is notified with the
+    `presence` events, refer `PresenceService`.
+
+    The `mark_read` command moves the user's read pointer of the room, the unread counts of the
+    rooms are served by the `UnreadCountsAPIView`, refer `UnreadCounter`.
+    """
 
     def __init__(self, *args, **kwargs):
         super().__init__(args, kwargs)
@@ -15,18 +51,62 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         self.room_group_name = None
         self.room_uuid = None
         self.user = None
+        self.is_msgpack = False
+        self.outbound = None
+        self.outbound_queue = None
+        self.is_online = False
+
+    async def accept(self, subprotocol=None):
+        """Accept the socket, with the MessagePack protocol if offered by the client."""
+
+        if subprotocol is None and MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", []):
+            subprotocol = MSGPACK_SUBPROTOCOL
+        self.is_msgpack = subprotocol == MSGPACK_SUBPROTOCOL
+        if settings.CHAT_CONFIG["coalesce_window_ms"] > 0:
+            self.outbound = OutboundEventBatcher(
+                self.send_events,
+                window=settings.CHAT_CONFIG["coalesce_window_ms"] / 1000,
+                max_batch_size=settings.CHAT_CONFIG["coalesce_max_batch_size"],
+            )
+        if settings.CHAT_CONFIG["send_queue_size"] > 0:
+            self.outbound_queue = OutboundQueue(
+                self.deliver_event, self.close_slow_consumer, max_size=settings.CHAT_CONFIG["send_queue_size"]
+            )
+        await super().accept(subprotocol)
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        """Decode the MessagePack frames, the text frames are handled as JSON."""
+
+        if self.is_msgpack and bytes_data is not None:
+            return await self.receive_json(msgpack.unpackb(bytes_data), **kwargs)
+        await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+
+    async def send_json(self, content, close=False):
+        """Encode the content as per the negotiated protocol & send it to the client."""
+
+        if self.is_msgpack:
+            return await self.send(bytes_data=msgpack.packb(content), close=close)
+        await super().send_json(content, close=close)
+
+    @staticmethod
+    def get_room_group_name(room):
+        """Channel layer group of the room."""
+
+        return f"chat_{room.uuid}"
 
     @database_sync_to_async
     def get_room_details(self, uuid):
-        """Get the room details using UUID."""
+        """Get the room details using UUID. None if the user is not a member of the room."""
 
-        # TODO: check if the user is in group.
-        return Room.objects.filter(uuid=uuid).first()
+        room = Room.objects.filter(uuid=uuid).first()
+        if not room or not room_membership_cache.is_member(room.id, self.user.pk):
+            return None
+        return room
 
     async def connect(self):
         """Verify and connect the user to the chat room."""
 
-        self.user = self.scope["user"][0]
+        self.user = self.scope["user"]
         if isinstance(self.user, AnonymousUser):
             return await self.close()
 
@@ -35,15 +115,22 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             return await self.close()
 
         self.room_uuid = self.room.uuid
-        self.room_group_name = f"chat_{self.room_uuid}"
+        self.room_group_name = self.get_room_group_name(self.room)
 
         # Join room group
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
+        await self.join_presence([self.room], with_tenant=True)
 
     async def disconnect(self, close_code=None):
         """Leave the room group."""
 
+        if self.is_online:
+            await self.leave_presence([self.room] if self.room else [], with_tenant=True)
+        if self.outbound_queue is not None:
+            self.outbound_queue.close()
+        if self.outbound:
+            self.outbound.close()
         if self.room_group_name:
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
@@ -52,57 +139,194 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
         match payload["command"]:
             case "fetch_messages":
-                await self.fetch_messages(payload)
+                await self.fetch_messages(self.room, payload)
             case "new_message":
-                await self.new_message(payload)
+                await self.new_message(self.room, payload)
+            case "fetch_presence":
+                await self.fetch_presence(self.room)
+            case "typing":
+                await self.typing(self.room, payload)
+            case "mark_read":
+                await self.mark_read(self.room, payload)
             case _:
                 await self.disconnect()
                 await self.close()
 
-    @database_sync_to_async
-    def get_last_10_messages(self):
-        """Get the last 10 messages for the currently connected room."""
+    async def send_room_json(self, room, content):
+        """Send an event of the room to the WebSocket."""
+
+        await self.send_json(content)
+
+    async def send_event(self, content):
+        """Send a group event to the WebSocket, through the `outbound_queue` if enabled."""
+
+        if self.outbound_queue is not None:
+            return await self.outbound_queue.put(content)
+        await self.deliver_event(content)
+
+    async def deliver_event(self, content):
+        """Send the group event now, through the `outbound` batcher if enabled."""
+
+        if self.outbound:
+            return await self.outbound.add(content)
+        await self.send_json(content)
+
+    async def close_slow_consumer(self):
+        """Close the client which can not keep up with its events, it should reconnect & resync."""
+
+        await self.close(code=settings.CHAT_CONFIG["slow_consumer_close_code"])
+
+    async def send_events(self, events):
+        """Send the coalesced events as a single frame, a lone event is sent as is."""
+
+        await self.send_json(events[0] if len(events) == 1 else {"command": "events", "events": events})
+
+    @staticmethod
+    def get_message_cursor(room, value):
+        """
+        Returns the `(created_at, id)` keyset of the cursor. The cursor can be the `id` / `uuid` of a
+        message in the room or an ISO 8601 timestamp, `id` is None for the timestamps.
+        """
+
+        # the ids, uuids & timestamps are all ascii, `int` would parse the other unicode digits
+        if not isinstance(value, (int, str)) or isinstance(value, bool) or not str(value).isascii():
+            raise ValueError(f"Invalid cursor: {value}")
+
+        if isinstance(value, int) or value.isdigit():
+            if not 0 < int(value) <= MAX_MESSAGE_ID:
+                raise ValueError(f"Invalid cursor: {value}")
+            message = Message.objects.filter(room_id=room.id).values("created_at", "id").get_or_none(id=value)
+        elif created_at := parse_datetime(value):
+            if timezone.is_naive(created_at):
+                created_at = timezone.make_aware(created_at, datetime.timezone.utc)
+            return created_at, None
+        else:
+            message = Message.objects.filter(room_id=room.id).values("created_at", "id").get_or_none(uuid=value)
+
+        if not message:
+            raise ValueError(f"Invalid cursor: {value}")
+        return message["created_at"], message["id"]
 
-        return Message.objects.filter(room__uuid=self.room_uuid)[:10]
+    @staticmethod
+    def get_page_size(payload):
+        """Returns the requested page size, bounded by `CHAT_CONFIG["messages_max_page_size"]`."""
+
+        try:
+            page_size = int(payload.get("limit") or settings.CHAT_CONFIG["messages_page_size"])
+        except (TypeError, ValueError):
+            page_size = settings.CHAT_CONFIG["messages_page_size"]
+        return max(1, min(page_size, settings.CHAT_CONFIG["messages_max_page_size"]))
 
     @database_sync_to_async
-    def get_serialized_messages(self, messages, is_many=True):
-        """Serialize the messages."""
+    def get_messages_page(self, room, payload):
+        """
+        Returns a page of the room's messages, newest first & if there are more messages in the
+        direction of the page. Only one of the `before`, `after` & `at`(jump to date) is considered.
+        """
 
-        context = {"scope_user": self.user}
+        page_size = self.get_page_size(payload)
+        queryset = Message.objects.filter(room_id=room.id).for_wire()
 
-        if is_many:
-            return MessageSerializer(messages, many=True, context=context).data
+        if payload.get("before"):
+            queryset = queryset.before(*self.get_message_cursor(room, payload["before"]))
+        elif payload.get("after"):
+            queryset = queryset.after(*self.get_message_cursor(room, payload["after"]))
+        elif payload.get("at"):
+            queryset = queryset.since(self.get_message_cursor(room, payload["at"])[0])
         else:
-            return MessageSerializer(messages, context=context).data
+            queryset = queryset.latest_first()
+
+        messages = list(queryset[: page_size + 1])
+        has_more = len(messages) > page_size
+        messages = messages[:page_size]
+        if not payload.get("before") and (payload.get("after") or payload.get("at")):
+            messages.reverse()
+        return messages, has_more
+
+    async def fetch_messages(self, room, payload):
+        """
+        Fetch the messages of the room. Pagination is based on the cursors -
+            > `before`  : older messages than the cursor
+            > `after`   : newer messages than the cursor
+            > `at`      : messages from the given time(jump to date)
+            > `limit`   : page size, bounded
+
+        The cursors in the response can be passed as the `before` / `after` of the next page.
+        """
 
-    async def fetch_messages(self, payload):
-        """Fetch older messages for the currently connected room."""
+        try:
+            messages, has_more = await self.get_messages_page(room, payload)
+        except ValueError as error:
+            return await self.send_room_json(room, {"command": "error", "detail": str(error)})
 
-        messages = await self.get_last_10_messages()
         content = {
             "command": "fetched_messages",
-            "messages": await self.get_serialized_messages(messages),
+            "messages": [serialize_message(message) for message in messages],
             "username": self.user.email,
+            "has_more": has_more,
+            "cursors": {
+                "before": messages[-1].id if messages else None,
+                "after": messages[0].id if messages else None,
+            },
         }
-        await self.send_json(content)
+        await self.send_room_json(room, content)
 
     @database_sync_to_async
-    def create_chat(self, msg):
+    def create_chat(self, room, msg):
         """Save the message sent on socket to db."""
 
-        return Message.objects.create(user=self.user, room=self.room, content=msg)
+        return Message.objects.create(user=self.user, room=room, content=msg)
+
+    async def buffer_chat(self, room, msg):
+        """
+        Write-behind version of the `create_chat`. The message is built with its `uuid` & timestamps
+        & queued to the `message_buffer`, the `id` is assigned only when it is persisted.
+        """
 
-    async def new_message(self, payload):
-        """Handle new message arrival."""
+        now = timezone.now()
+        message = Message(user=self.user, room=room, content=msg, created_at=now, modified_at=now)
+        await message_buffer.aadd(message)
+        return message
+
+    async def new_message(self, room, payload):
+        """Handle new message arrival. Persisted before the broadcast, unless the write-behind is enabled."""
 
         message = payload["message"]
-        message_obj = await self.create_chat(message)
-        serialized_message = await self.get_serialized_messages(message_obj, is_many=False)
+        if settings.CHAT_CONFIG["write_behind"]:
+            message_obj = await self.buffer_chat(room, message)
+        else:
+            message_obj = await self.create_chat(room, message)
+        serialized_message = serialize_message(message_obj)
 
         await self.channel_layer.group_send(
-            self.room_group_name, {"type": "chat.message", "message": serialized_message}
+            self.get_room_group_name(room),
+            {"type": "chat.message", "room": str(room.uuid), "message": serialized_message},
         )
+        await unread_counter.arecord_message(room.id, self.user.pk)
+
+    @database_sync_to_async
+    def update_read_pointer(self, room, payload):
+        """
+        Move the read pointer to the `message` cursor(`id` / `uuid` / timestamp), the latest message
+        of the room by default. Returns the messages still unread in the room.
+        """
+
+        if payload.get("message"):
+            last_read_at, last_read_message_id = self.get_message_cursor(room, payload["message"])
+        elif latest := Message.objects.filter(room_id=room.id).latest_first().values("created_at", "id").first():
+            last_read_at, last_read_message_id = latest["created_at"], latest["id"]
+        else:
+            last_read_at, last_read_message_id = timezone.now(), None
+        return unread_counter.mark_read(room.id, self.user.pk, last_read_at, last_read_message_id)
+
+    async def mark_read(self, room, payload):
+        """Mark the room read upto the `message`, the pointer only moves forward."""
+
+        try:
+            unread = await self.update_read_pointer(room, payload)
+        except ValueError as error:
+            return await self.send_room_json(room, {"command": "error", "detail": str(error)})
+        await self.send_room_json(room, {"command": "marked_read", "unread": unread})
 
     async def chat_message(self, event):
         """Receive message from room group."""
@@ -110,4 +334,65 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         message = event["message"]
 
         # Send message to WebSocket
-        await self.send_json({"command": "new_message", "message": message})
+        await self.send_event({"command": "new_message", "message": message})
+
+    def get_presence_scopes(self, rooms, with_tenant=False):
+        """Returns the presence scope => room of the rooms, the tenant's scope maps to None."""
+
+        scopes = {get_room_scope(room.id): room for room in rooms}
+        if with_tenant:
+            scopes[get_tenant_scope(self.user.tenant_id)] = None
+        return scopes
+
+    async def join_presence(self, rooms, with_tenant=False):
+        """Mark the user online in the rooms, the rooms in which the user just came online are notified."""
+
+        scopes = self.get_presence_scopes(rooms, with_tenant)
+        self.is_online = self.is_online or with_tenant
+        online_scopes = await presence.ajoin(self.channel_name, self.user.pk, list(scopes))
+        await self.broadcast_presence([scopes[scope] for scope in online_scopes if scopes[scope]], "online")
+
+    async def leave_presence(self, rooms, with_tenant=False):
+        """Remove the connection from the rooms, the rooms in which the user went offline are notified."""
+
+        scopes = self.get_presence_scopes(rooms, with_tenant)
+        self.is_online = self.is_online and not with_tenant
+        offline_scopes = await presence.aleave(self.channel_name, self.user.pk, list(scopes))
+        await self.broadcast_presence([scopes[scope] for scope in offline_scopes if scopes[scope]], "offline")
+
+    async def broadcast_presence(self, rooms, status):
+        """Send the user's presence to the groups of the rooms."""
+
+        user = serialize_sender(self.user)
+        await asyncio.gather(
+            *[
+                self.channel_layer.group_send(
+                    self.get_room_group_name(room),
+                    {"type": "chat.presence", "room": str(room.uuid), "user": user, "status": status},
+                )
+                for room in rooms
+            ]
+        )
+
+    async def fetch_presence(self, room):
+        """Send the pks of the room's online users."""
+
+        online = await presence.aget_online(get_room_scope(room.id))
+        await self.send_room_json(room, {"command": "fetched_presence", "online": online})
+
+    async def chat_presence(self, event):
+        """Receive a presence change from room group, dropped first if the client can not keep up."""
+
+        await self.send_event({"command": "presence", "user": event["user"], "status": event["status"]})
+
+    async def typing(self, room, payload):
+        """Typing signal of the user, throttled & aggregated per room before reaching the group."""
+
+        get_typing_aggregator(self.channel_layer).add(
+            self.get_room_group_name(room), str(room.uuid), self.user, payload.get("is_typing", True) is not False
+        )
+
+    async def chat_typing(self, event):
+        """Receive the users typing in the room, dropped first if the client can not keep up."""
+
+        await self.send_event({"command": "typing", "users": event["users"]})
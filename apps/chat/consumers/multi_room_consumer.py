@@ -0,0 +1,189 @@
+import asyncio
+import uuid
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+
+from apps.chat.caches import room_membership_cache
+from apps.chat.consumers.chat_consumer import ChatConsumer
+from apps.chat.models import Room
+
+
+class MultiRoomChatConsumer(ChatConsumer):
+    """
+    Multiplexed Chat consumer, a single connection for all the rooms of the user. The rooms are
+    joined & left using the commands, instead of a connection per room.
+
+    Commands -
+        > subscribe       : {"rooms": [<room uuid>, ...]}, only the rooms the user is a member of
+        > unsubscribe     : {"rooms": [<room uuid>, ...]}
+        > fetch_messages  : same as the `ChatConsumer`, along with the `room`
+        > new_message     : same as the `ChatConsumer`, along with the `room`
+        > fetch_presence  : same as the `ChatConsumer`, along with the `room`
+        > typing          : same as the `ChatConsumer`, along with the `room`
+        > mark_read       : same as the `ChatConsumer`, along with the `room`
+
+    Every event sent on the socket carries the `room`(uuid) it belongs to. The subscriptions are
+    bounded by `CHAT_CONFIG["max_room_subscriptions"]`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rooms = {}
+
+    async def connect(self):
+        """Verify the user, the rooms are subscribed after the connection."""
+
+        self.user = self.scope["user"]
+        if isinstance(self.user, AnonymousUser):
+            return await self.close()
+
+        await self.accept()
+        await self.join_presence([], with_tenant=True)
+
+    async def disconnect(self, close_code=None):
+        """Leave the groups of all the subscribed rooms."""
+
+        rooms, self.rooms = self.rooms, {}
+        await asyncio.gather(
+            *[
+                self.channel_layer.group_discard(self.get_room_group_name(room), self.channel_name)
+                for room in rooms.values()
+            ]
+        )
+        if rooms:
+            await self.leave_presence(rooms.values())
+        await super().disconnect(close_code)
+
+    async def receive_json(self, payload, **kwargs):
+        """Receive command from WebSocket."""
+
+        match payload["command"]:
+            case "subscribe":
+                await self.subscribe(payload)
+            case "unsubscribe":
+                await self.unsubscribe(payload)
+            case "fetch_messages":
+                if room := await self.get_subscribed_room(payload):
+                    await self.fetch_messages(room, payload)
+            case "new_message":
+                if room := await self.get_subscribed_room(payload):
+                    await self.new_message(room, payload)
+            case "fetch_presence":
+                if room := await self.get_subscribed_room(payload):
+                    await self.fetch_presence(room)
+            case "typing":
+                if room := await self.get_subscribed_room(payload):
+                    await self.typing(room, payload)
+            case "mark_read":
+                if room := await self.get_subscribed_room(payload):
+                    await self.mark_read(room, payload)
+            case _:
+                await self.disconnect()
+                await self.close()
+
+    async def send_room_json(self, room, content):
+        """Send an event of the room to the WebSocket, tagged with the room."""
+
+        await self.send_json({"room": str(room.uuid), **content})
+
+    async def send_error(self, detail, room_uuid=None):
+        """Send an error event which is not specific to a subscribed room."""
+
+        await self.send_json({"command": "error", "room": room_uuid, "detail": detail})
+
+    @staticmethod
+    def get_room_uuids(payload):
+        """Returns the normalized room uuids of the payload. Raises `ValueError` for the invalid ones."""
+
+        room_uuids = payload.get("rooms")
+        if not isinstance(room_uuids, list) or not all(isinstance(room_uuid, str) for room_uuid in room_uuids):
+            raise ValueError("`rooms` must be a list of room uuids.")
+        return list(dict.fromkeys(str(uuid.UUID(room_uuid)) for room_uuid in room_uuids))
+
+    async def get_subscribed_room(self, payload):
+        """Returns the subscribed room of the payload, an error is sent if not subscribed."""
+
+        room = self.rooms.get(str(payload.get("room")))
+        if not room:
+            await self.send_error("Not subscribed to the room.", payload.get("room"))
+        return room
+
+    @database_sync_to_async
+    def get_rooms(self, room_uuids):
+        """Returns the rooms of the uuids, which the user is a member of."""
+
+        return [
+            room
+            for room in Room.objects.filter(uuid__in=room_uuids)
+            if room_membership_cache.is_member(room.id, self.user.pk)
+        ]
+
+    async def subscribe(self, payload):
+        """Join the groups of the rooms. The rooms which are not found / not allowed are rejected."""
+
+        try:
+            room_uuids = [room_uuid for room_uuid in self.get_room_uuids(payload) if room_uuid not in self.rooms]
+        except ValueError as error:
+            return await self.send_error(str(error))
+
+        if len(self.rooms) + len(room_uuids) > settings.CHAT_CONFIG["max_room_subscriptions"]:
+            return await self.send_error(
+                f"Can not subscribe to more than {settings.CHAT_CONFIG['max_room_subscriptions']} rooms."
+            )
+
+        rooms = {str(room.uuid): room for room in await self.get_rooms(room_uuids)} if room_uuids else {}
+        await asyncio.gather(
+            *[
+                self.channel_layer.group_add(self.get_room_group_name(room), self.channel_name)
+                for room in rooms.values()
+            ]
+        )
+        self.rooms.update(rooms)
+        await self.join_presence(rooms.values())
+
+        content = {
+            "command": "subscribed",
+            "rooms": list(rooms),
+            "rejected": [room_uuid for room_uuid in room_uuids if room_uuid not in rooms],
+        }
+        await self.send_json(content)
+
+    async def unsubscribe(self, payload):
+        """Leave the groups of the rooms."""
+
+        try:
+            room_uuids = self.get_room_uuids(payload)
+        except ValueError as error:
+            return await self.send_error(str(error))
+
+        rooms = [self.rooms.pop(room_uuid) for room_uuid in room_uuids if room_uuid in self.rooms]
+        await asyncio.gather(
+            *[self.channel_layer.group_discard(self.get_room_group_name(room), self.channel_name) for room in rooms]
+        )
+        await self.leave_presence(rooms)
+        await self.send_json({"command": "unsubscribed", "rooms": [str(room.uuid) for room in rooms]})
+
+    async def chat_message(self, event):
+        """Receive message from a subscribed room's group. The ones in flight while unsubscribing are skipped."""
+
+        if event["room"] not in self.rooms:
+            return
+        await self.send_event({"command": "new_message", "room": event["room"], "message": event["message"]})
+
+    async def chat_presence(self, event):
+        """Receive a presence change from a subscribed room's group."""
+
+        if event["room"] not in self.rooms:
+            return
+        await self.send_event(
+            {"command": "presence", "room": event["room"], "user": event["user"], "status": event["status"]}
+        )
+
+    async def chat_typing(self, event):
+        """Receive the users typing in a subscribed room."""
+
+        if event["room"] not in self.rooms:
+            return
+        await self.send_event({"command": "typing", "room": event["room"], "users": event["users"]})
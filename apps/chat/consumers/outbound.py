@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import weakref
+from collections import deque
+
+from apps.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# buckets of the `chat_outbound_batch_size` histogram
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+# ephemeral events, dropped first when a client can not keep up
+DROPPABLE_EVENT_COMMANDS = {"presence", "typing"}
+
+
+class OutboundEventBatcher:
+    """
+    Coalesces the events sent to a single connection. The first event is sent immediately & opens
+    a window of `window` seconds, the events arriving within the window are sent together once it
+    ends or when `max_batch_size` events are pending. The window is kept open while the events keep
+    arriving, so an idle room gets the immediate delivery & a hot room a frame per window.
+
+    The `send_events` coroutine receives the list of the events to be sent as a single frame.
+
+    Metrics - chat_outbound_frames, chat_outbound_events, chat_outbound_batch_size: histogram
+    """
+
+    def __init__(self, send_events, window, max_batch_size):
+        self.send_events = send_events
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._window_task = None
+
+    async def send(self, events):
+        """Send the events as a single frame."""
+
+        metrics.increment("chat_outbound_frames")
+        metrics.increment("chat_outbound_events", len(events))
+        metrics.observe("chat_outbound_batch_size", len(events), buckets=BATCH_SIZE_BUCKETS)
+        await self.send_events(events)
+
+    async def add(self, event):
+        """Send the event now if no window is open, else queue it for the window's frame."""
+
+        if self._window_task is None:
+            self._window_task = asyncio.create_task(self.run_window())
+            return await self.send([event])
+
+        self._pending.append(event)
+        if len(self._pending) >= self.max_batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """Send the pending events."""
+
+        events, self._pending = self._pending, []
+        if events:
+            await self.send(events)
+
+    async def run_window(self):
+        """Flush at the end of every window, till a window ends without any events."""
+
+        try:
+            while True:
+                await asyncio.sleep(self.window)
+                if not self._pending:
+                    break
+                await self.flush()
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:  # noqa
+            logger.warning(f"OutboundEventBatcher: unable to send the events: {error}")
+        finally:
+            self._window_task = None
+
+    def close(self):
+        """Stop the window & drop the pending events, called once the connection is closed."""
+
+        if self._window_task:
+            self._window_task.cancel()
+        self._pending = []
+
+
+class OutboundQueue:
+    """
+    Bounded queue of the events to be sent to a single connection, drained in order by a writer
+    task. A client that reads slower than its events arrive can hold at most `max_size` events in
+    the worker's memory. Once the queue is full -
+
+        > the oldest droppable(presence / typing) event is dropped to make room
+        > a new droppable event is dropped, if there is nothing else to drop
+        > else the client is a slow consumer, the queue is closed & `on_overflow` is called. The
+          consumer closes the socket with a resync code, the client reconnects & fetches the history.
+
+    Metrics -
+        chat_send_queue_depth, chat_send_queue_max_depth: across the connections of the worker
+        chat_send_queue_dropped{command}, chat_slow_consumer_disconnects
+    """
+
+    def __init__(self, deliver, on_overflow, max_size):
+        self.deliver = deliver
+        self.on_overflow = on_overflow
+        self.max_size = max_size
+        self.is_closed = False
+        self._events = deque()
+        self._ready = asyncio.Event()
+        self._writer_task = None
+        _live_queues.add(self)
+
+    def __len__(self):
+        return len(self._events)
+
+    @staticmethod
+    def is_droppable(event):
+        """Returns if the event can be dropped under the pressure."""
+
+        return event.get("command") in DROPPABLE_EVENT_COMMANDS
+
+    def drop_oldest_droppable(self):
+        """Remove the oldest droppable event. Returns if an event was dropped."""
+
+        for index, event in enumerate(self._events):
+            if self.is_droppable(event):
+                del self._events[index]
+                metrics.increment("chat_send_queue_dropped", command=event["command"])
+                return True
+        return False
+
+    async def put(self, event):
+        """Queue the event, applying the overflow policy if the queue is full."""
+
+        if self.is_closed:
+            return
+
+        if len(self._events) >= self.max_size and not self.drop_oldest_droppable():
+            if self.is_droppable(event):
+                return metrics.increment("chat_send_queue_dropped", command=event["command"])
+
+            metrics.increment("chat_slow_consumer_disconnects")
+            self.close()
+            return await self.on_overflow()
+
+        self._events.append(event)
+        self._ready.set()
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self.run())
+
+    async def run(self):
+        """Writer loop, the next event is sent once the previous send is complete."""
+
+        try:
+            while not self.is_closed:
+                if not self._events:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                await self.deliver(self._events.popleft())
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:  # noqa
+            logger.warning(f"OutboundQueue: unable to send the event: {error}")
+        finally:
+            self._writer_task = None
+
+    def close(self):
+        """Stop the writer & drop the queued events."""
+
+        self.is_closed = True
+        if self._writer_task:
+            self._writer_task.cancel()
+        self._events.clear()
+
+
+_live_queues = weakref.WeakSet()
+
+
+def collect_send_queue_metrics():
+    """Collector for the `MetricsRegistry`. Depth of the queues of the open connections."""
+
+    depths = [len(outbound_queue) for outbound_queue in list(_live_queues) if not outbound_queue.is_closed]
+    return {"chat_send_queue_depth": sum(depths), "chat_send_queue_max_depth": max(depths, default=0)}
+
+
+metrics.register_collector(collect_send_queue_metrics)
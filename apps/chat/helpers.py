@@ -1,31 +1,77 @@
-import json
+import copy
+from functools import partial
 
+import httpx
 import jwt
 import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
-from jwt import PyJWKClient
 from rest_framework.exceptions import AuthenticationFailed
 
+from apps.chat.caches import (
+    get_token_expiry,
+    get_token_hash,
+    rejected_token_cache,
+    tenant_cache,
+    token_cache,
+    user_cache,
+)
 from apps.chat.models import Tenant, User
-from apps.common.idp_service import idp_get_request
+from apps.common.exceptions import IDPServiceUnavailable
+from apps.common.idp_service import aidp_get_request, idp_get_request, is_idp_unavailable
+from apps.common.keycloak_service import aget_keycloak_signing_key, get_keycloak_signing_key
+from apps.common.metrics import metrics
+from apps.common.single_flight import SingleFlight, adistributed_lock, distributed_lock
 from config.settings import IDP_CONFIG
 
+# jwt verification options for the KC tokens
+KEYCLOAK_DECODE_OPTIONS = {
+    "verify_signature": True,
+    "require": ["exp", "iss"],
+    "verify_exp": True,
+    "verify_iss": True,
+    "verify_aud": False,
+}
+
+# coalesces the concurrent verifications of the same token within the process
+token_flights = SingleFlight("chat:auth:verify")
+
 
 def get_tenant_from_idp_data(data):
-    """Return the Tenant obj. Get or create tenant."""
+    """Return the Tenant obj. Get or create tenant. Known tenants are served from the `tenant_cache`."""
+
+    if tenant := tenant_cache.get_instance(data["id"]):
+        return tenant
 
     try:
         tenant = Tenant.objects.get(tenant_id=data["id"])
     except Tenant.DoesNotExist:
         tenant = Tenant.objects.create(name=data["name"], tenant_id=data["id"])
-    return tenant
+    return tenant_cache.set_instance(tenant)
+
+
+async def aget_tenant_from_idp_data(data):
+    """Async version of the `get_tenant_from_idp_data`."""
+
+    if tenant := await tenant_cache.aget_instance(data["id"]):
+        return tenant
+
+    try:
+        tenant = await Tenant.objects.aget(tenant_id=data["id"])
+    except Tenant.DoesNotExist:
+        tenant = await Tenant.objects.acreate(name=data["name"], tenant_id=data["id"])
+    return await tenant_cache.aset_instance(tenant)
 
 
 def get_user_from_idp_data(data, tenant):
-    """Return the User obj. Get or create user."""
+    """Return the User obj. Get or create user. Known users are served from the `user_cache`."""
+
+    if user := user_cache.get_instance(data["id"]):
+        return user, None
 
     try:
-        user = User.objects.get(user_id=data["id"])
+        user = User.objects.select_related("tenant").get(user_id=data["id"])
     except User.DoesNotExist:
         user = User.objects.create_user(
             first_name=data["name"],
@@ -34,73 +80,262 @@ def get_user_from_idp_data(data, tenant):
             user_id=data["id"],
             tenant=tenant,
         )
-    return user, None
+    return user_cache.set_instance(user), None
 
 
-def validate_keycloak_token(issuer_url, token):
-    """Validate KC token."""
-
-    # jwt verification options
-    options = {
-        "verify_signature": True,
-        "require": ["exp", "iss"],
-        "verify_exp": True,
-        "verify_iss": True,
-        "verify_aud": False,
-    }
-    # Verify the JWT token.
+async def aget_user_from_idp_data(data, tenant):
+    """Async version of the `get_user_from_idp_data`."""
+
+    if user := await user_cache.aget_instance(data["id"]):
+        return user, None
+
     try:
-        import ssl
-
-        jwks_endpoint = get_jwks_uri(issuer_url)
-        # import urllib.request
-        # For now disabling SSL certificate verification for testing
-        """TO-DO-Need to get ssl certificate path here"""
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-
-        jwks_client = PyJWKClient(uri=jwks_endpoint, cache_keys=True, lifespan=1200, ssl_context=ssl_context)
-        jwk_set = jwks_client.get_jwk_set()
-        jwk_key = jwk_set.keys[0]
-        decoded_token = jwt.decode(
-            jwt=token, key=jwk_key.key, algorithms=["RS256"], options=options, issuer=issuer_url
+        user = await User.objects.select_related("tenant").aget(user_id=data["id"])
+    except User.DoesNotExist:
+        user = await sync_to_async(User.objects.create_user)(
+            first_name=data["name"],
+            last_name=data["surname"],
+            email=data["emailAddress"],
+            user_id=data["id"],
+            tenant=tenant,
         )
-        tenant_name = decoded_token["iss"].split("https://auth.techademy.com/realms/")[-1]
-        user_name = decoded_token["name"].split(" ")
-        tenant = get_tenant_from_idp_data(data={"id": decoded_token["B2B"], "name": tenant_name})
-        user_data = {
+    return await user_cache.aset_instance(user), None
+
+
+def get_user_from_identity(identity):
+    """Return the User obj for the identity resolved from the IDP / KC token."""
+
+    tenant = get_tenant_from_idp_data(identity["tenant"])
+    return get_user_from_idp_data(identity["user"], tenant)
+
+
+async def aget_user_from_identity(identity):
+    """Async version of the `get_user_from_identity`."""
+
+    tenant = await aget_tenant_from_idp_data(identity["tenant"])
+    return await aget_user_from_idp_data(identity["user"], tenant)
+
+
+def get_identity_from_keycloak_token(issuer_url, token, jwk_key):
+    """Decode the KC token using the signing key and return the identity of the token's user."""
+
+    decoded_token = jwt.decode(
+        jwt=token, key=jwk_key.key, algorithms=["RS256"], options=KEYCLOAK_DECODE_OPTIONS, issuer=issuer_url
+    )
+    tenant_name = decoded_token["iss"].split("https://auth.techademy.com/realms/")[-1]
+    user_name = decoded_token["name"].split(" ")
+    return {
+        "tenant": {"id": decoded_token["B2B"], "name": tenant_name},
+        "user": {
             "name": decoded_token["given_name"],
             "surname": user_name[-1] if len(user_name) > 1 else None,
             "emailAddress": decoded_token["email"],
             "id": decoded_token["sub"],
-        }
-        return get_user_from_idp_data(user_data, tenant)
+        },
+        "exp": decoded_token["exp"],
+    }
+
+
+def validate_keycloak_token(issuer_url, token):
+    """Validate KC token and return the identity of the token's user."""
+
+    # Verify the JWT token. The signing keys are cached per issuer, refer `KeycloakVerifier`.
+    try:
+        jwk_key = get_keycloak_signing_key(issuer_url, token)
+        return get_identity_from_keycloak_token(issuer_url, token, jwk_key)
+    except (requests.RequestException, httpx.HTTPError):
+        raise IDPServiceUnavailable()
     except Exception:
         raise AuthenticationFailed(_("Key cloak authentication failed."))
 
 
-def get_jwks_uri(issuer):
-    openid_config_url = f"{issuer}/.well-known/openid-configuration"
-    response = requests.get(openid_config_url, verify=False)
-    data = json.loads(response.content)
-    return data.get("jwks_uri")
+async def avalidate_keycloak_token(issuer_url, token):
+    """Async version of the `validate_keycloak_token`."""
+
+    try:
+        jwk_key = await aget_keycloak_signing_key(issuer_url, token)
+        return get_identity_from_keycloak_token(issuer_url, token, jwk_key)
+    except (requests.RequestException, httpx.HTTPError):
+        raise IDPServiceUnavailable()
+    except Exception:
+        raise AuthenticationFailed(_("Key cloak authentication failed."))
 
 
-def authenticate_user_from_token(token, host=None, issuer=None):
-    """Authenticate user from IDP / SSO / KC token and return the user."""
+def get_identity_from_idp_response(token, success, data):
+    """Return the identity of the token's user from the IDP `get_current_login_info` response."""
 
-    if issuer == "KC":
-        return validate_keycloak_token(issuer_url=host, token=token)
+    if success and data.get("user"):
+        if data["tenant"] is None:
+            data["tenant"] = {
+                "id": IDP_CONFIG["b2b_id"],
+                "name": IDP_CONFIG["b2b_name"],
+            }
+        return {"tenant": data["tenant"], "user": data["user"], "exp": get_token_expiry(token)}
+    elif not success and is_idp_unavailable(data):
+        raise IDPServiceUnavailable()
     else:
-        success, data = idp_get_request(url_path=IDP_CONFIG["get_current_login_info"], auth_token=token, host=host)
-        if success and data.get("user"):
-            if data["tenant"] is None:
-                data["tenant"] = {
-                    "id": IDP_CONFIG["b2b_id"],
-                    "name": IDP_CONFIG["b2b_name"],
-                }
-            tenant = get_tenant_from_idp_data(data["tenant"])
-            return get_user_from_idp_data(data["user"], tenant)
+        raise AuthenticationFailed(_("IDP authentication failed."))
+
+
+def validate_idp_token(token, host=None):
+    """Validate the IDP token using the IDP service and return the identity of the token's user."""
+
+    success, data = idp_get_request(url_path=IDP_CONFIG["get_current_login_info"], auth_token=token, host=host)
+    return get_identity_from_idp_response(token, success, data)
+
+
+async def avalidate_idp_token(token, host=None):
+    """Async version of the `validate_idp_token`."""
+
+    success, data = await aidp_get_request(url_path=IDP_CONFIG["get_current_login_info"], auth_token=token, host=host)
+    return get_identity_from_idp_response(token, success, data)
+
+
+def get_user_from_token_cache(token, host=None, issuer=None, allow_stale=False):
+    """Return the User obj for an already verified token. None if the token is not cached."""
+
+    if entry := token_cache.get_entry(token, host, issuer, allow_stale=allow_stale):
+        if user := user_cache.get_instance(entry["user_id"]):
+            return user
+        if user := User.objects.select_related("tenant").get_or_none(pk=entry["user"]):
+            return user_cache.set_instance(user)
+        token_cache.invalidate(token, host, issuer)
+    return None
+
+
+async def aget_user_from_token_cache(token, host=None, issuer=None, allow_stale=False):
+    """Async version of the `get_user_from_token_cache`."""
+
+    if entry := await token_cache.aget_entry(token, host, issuer, allow_stale=allow_stale):
+        if user := await user_cache.aget_instance(entry["user_id"]):
+            return user
+        if user := await User.objects.select_related("tenant").filter(pk=entry["user"]).afirst():
+            return await user_cache.aset_instance(user)
+        await token_cache.ainvalidate(token, host, issuer)
+    return None
+
+
+def get_stale_user_from_token_cache(token, host=None, issuer=None):
+    """
+    Fallback used when the IDP / KC is down. Returns the user of a previously verified token
+    that is not expired yet. Raises the `IDPServiceUnavailable` if there is no such entry.
+    """
+
+    if user := get_user_from_token_cache(token, host, issuer, allow_stale=True):
+        metrics.increment("auth_token_stale_fallback", issuer=issuer or "IDP")
+        return user
+    raise IDPServiceUnavailable()
+
+
+async def aget_stale_user_from_token_cache(token, host=None, issuer=None):
+    """Async version of the `get_stale_user_from_token_cache`."""
+
+    if user := await aget_user_from_token_cache(token, host, issuer, allow_stale=True):
+        metrics.increment("auth_token_stale_fallback", issuer=issuer or "IDP")
+        return user
+    raise IDPServiceUnavailable()
+
+
+def verify_token(token, host=None, issuer=None):
+    """
+    Verify the token with the IDP / KC, get or create the user & cache the result. During an IDP
+    outage, the stale entries are used. The rejections are cached, refer `RejectedTokenCache`.
+    """
+
+    try:
+        if issuer == "KC":
+            identity = validate_keycloak_token(issuer_url=host, token=token)
+        else:
+            identity = validate_idp_token(token=token, host=host)
+    except IDPServiceUnavailable:
+        return get_stale_user_from_token_cache(token, host, issuer)
+    except AuthenticationFailed as error:
+        rejected_token_cache.reject(token, host, issuer, error.detail)
+        raise
+
+    user, _auth = get_user_from_identity(identity)
+    token_cache.set_entry(token, host, issuer, user, exp=identity["exp"])
+    return user
+
+
+async def averify_token(token, host=None, issuer=None):
+    """Async version of the `verify_token`."""
+
+    try:
+        if issuer == "KC":
+            identity = await avalidate_keycloak_token(issuer_url=host, token=token)
         else:
-            raise AuthenticationFailed(_("IDP authentication failed."))
+            identity = await avalidate_idp_token(token=token, host=host)
+    except IDPServiceUnavailable:
+        return await aget_stale_user_from_token_cache(token, host, issuer)
+    except AuthenticationFailed as error:
+        await rejected_token_cache.areject(token, host, issuer, error.detail)
+        raise
+
+    user, _auth = await aget_user_from_identity(identity)
+    await token_cache.aset_entry(token, host, issuer, user, exp=identity["exp"])
+    return user
+
+
+def verify_token_with_lock(token, host=None, issuer=None):
+    """
+    `verify_token` under a cross process lock of the token. The processes that waited for the lock
+    are served from the token cache populated by the lock holder.
+    """
+
+    lock_name = f"chat:auth:verify:{get_token_hash(token, host, issuer)}"
+    lock_timeout = settings.AUTH_CACHE_CONFIG["single_flight_lock_timeout"]
+    with distributed_lock(lock_name, timeout=lock_timeout, blocking_timeout=lock_timeout):
+        if user := get_user_from_token_cache(token, host, issuer):
+            return user
+        if detail := rejected_token_cache.get_rejection(token, host, issuer):
+            raise AuthenticationFailed(detail)
+        return verify_token(token, host, issuer)
+
+
+async def averify_token_with_lock(token, host=None, issuer=None):
+    """Async version of the `verify_token_with_lock`."""
+
+    lock_name = f"chat:auth:verify:{get_token_hash(token, host, issuer)}"
+    lock_timeout = settings.AUTH_CACHE_CONFIG["single_flight_lock_timeout"]
+    async with adistributed_lock(lock_name, timeout=lock_timeout, blocking_timeout=lock_timeout):
+        if user := await aget_user_from_token_cache(token, host, issuer):
+            return user
+        if detail := await rejected_token_cache.aget_rejection(token, host, issuer):
+            raise AuthenticationFailed(detail)
+        return await averify_token(token, host, issuer)
+
+
+def authenticate_user_from_token(token, host=None, issuer=None):
+    """
+    Authenticate user from IDP / SSO / KC token and return the user. The verified tokens are
+    cached till their expiry, refer `TokenCache`.
+
+    Concurrent calls for the same token share a single verification, refer `token_flights`. With
+    `single_flight_distributed`, the verification is also coalesced across the processes.
+    """
+
+    if user := get_user_from_token_cache(token, host, issuer):
+        return user, None
+    if detail := rejected_token_cache.get_rejection(token, host, issuer):
+        raise AuthenticationFailed(detail)
+
+    verify = verify_token_with_lock if settings.AUTH_CACHE_CONFIG["single_flight_distributed"] else verify_token
+    user = token_flights.do(get_token_hash(token, host, issuer), partial(verify, token, host, issuer))
+    return copy.copy(user), None
+
+
+async def aauthenticate_user_from_token(token, host=None, issuer=None):
+    """
+    Async version of the `authenticate_user_from_token`. Used by the websocket middleware, the
+    outbound calls are made on the event loop instead of occupying a thread of the sync pool.
+    """
+
+    if user := await aget_user_from_token_cache(token, host, issuer):
+        return user, None
+    if detail := await rejected_token_cache.aget_rejection(token, host, issuer):
+        raise AuthenticationFailed(detail)
+
+    verify = averify_token_with_lock if settings.AUTH_CACHE_CONFIG["single_flight_distributed"] else averify_token
+    user = await token_flights.ado(get_token_hash(token, host, issuer), partial(verify, token, host, issuer))
+    return copy.copy(user), None
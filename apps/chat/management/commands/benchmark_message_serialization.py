@@ -0,0 +1,77 @@
+import time
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from apps.chat.models import Message, Room, Tenant, User
+from apps.chat.serializers import MessageSerializer, serialize_message
+from apps.common.management.commands.base import AppBaseCommand
+
+
+class Command(AppBaseCommand):
+    help = (
+        "Compares the per message cost of the `MessageSerializer` & the socket's `serialize_message`. "
+        "The sample data is created in a transaction & rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=200, help="Number of messages serialized per run.")
+        parser.add_argument("--senders", type=int, default=10, help="Number of distinct senders.")
+
+    def create_sample_data(self, messages_count, senders_count):
+        """Room with the messages from the senders. Returns the room & the user, who is reading it."""
+
+        tenant = Tenant.objects.create(name="benchmark", tenant_id="benchmark-tenant")
+        users = [
+            User.objects.create_user(
+                email=f"benchmark-{index}@example.com",
+                user_id=f"benchmark-user-{index}",
+                first_name=f"User {index}",
+                tenant=tenant,
+            )
+            for index in range(senders_count)
+        ]
+        room = Room.objects.create(name="benchmark-room")
+        room.users.add(*users)
+        Message.objects.bulk_create(
+            [
+                Message(room=room, user=users[index % senders_count], content="x" * 100)
+                for index in range(messages_count)
+            ]
+        )
+        return room, users[0]
+
+    def measure(self, label, messages_count, serialize):
+        """Run the serialization & print the cost per message."""
+
+        with CaptureQueriesContext(connection) as context:
+            started_at = time.perf_counter()
+            serialize()
+            duration = time.perf_counter() - started_at
+
+        self.print_styled_message(
+            f"{label:<20} {duration * 1000:>10.2f} ms total {duration * 1_000_000 / messages_count:>10.1f} us/message "
+            f"{len(context.captured_queries):>6} queries",
+            "SUCCESS",
+        )
+
+    def handle(self, *args, **options):
+        """Serialize the same page using both the serializers."""
+
+        messages_count, senders_count = options["messages"], options["senders"]
+        with transaction.atomic():
+            room, reader = self.create_sample_data(messages_count, senders_count)
+
+            self.measure(
+                "MessageSerializer",
+                messages_count,
+                lambda: MessageSerializer(
+                    list(Message.objects.filter(room=room)), many=True, context={"scope_user": reader}
+                ).data,
+            )
+            self.measure(
+                "serialize_message",
+                messages_count,
+                lambda: [serialize_message(message) for message in Message.objects.filter(room=room).for_wire()],
+            )
+            transaction.set_rollback(True)
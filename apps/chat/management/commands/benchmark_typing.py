@@ -0,0 +1,87 @@
+import asyncio
+import time
+import uuid
+
+from django.conf import settings
+
+from apps.chat.models import User
+from apps.chat.typing import TypingAggregator
+from apps.common.management.commands.base import AppBaseCommand
+
+
+class CountingChannelLayer:
+    """Channel layer which only counts the group sends."""
+
+    def __init__(self):
+        self.group_sends = 0
+
+    async def group_send(self, group, message):
+        self.group_sends += 1
+
+
+class Command(AppBaseCommand):
+    help = (
+        "Channel layer messages per second for the simultaneous typists, sending a group message per "
+        "keystroke vs the throttled `TypingAggregator`. Nothing is written to the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--typists", type=int, default=500, help="Number of simultaneous typists.")
+        parser.add_argument("--rooms", type=int, default=1, help="Number of rooms, the typists are spread across.")
+        parser.add_argument("--keystrokes", type=float, default=5, help="Keystrokes per second of a typist.")
+        parser.add_argument("--duration", type=float, default=5, help="Seconds to simulate.")
+        parser.add_argument("--burst", type=float, default=3, help="Seconds a typist types before a pause.")
+        parser.add_argument("--pause", type=float, default=3, help="Seconds a typist pauses between the bursts.")
+
+    async def simulate(self, typists, rooms, keystrokes, duration, burst, pause, throttled):
+        """
+        Every typist signals on every keystroke of its bursts, the bursts of the typists are staggered.
+        Returns the group sends made.
+        """
+
+        channel_layer = CountingChannelLayer()
+        # a throwaway key prefix, the typists on redis never reach the real rooms
+        aggregator = TypingAggregator(channel_layer, key_prefix=f"benchmark:typing:{uuid.uuid4().hex}")
+        users = [User(id=index + 1, first_name=f"User {index}") for index in range(typists)]
+        room_uuids = [str(uuid.uuid4()) for _ in range(rooms)]
+
+        async def type_keys(index, user):
+            room_uuid = room_uuids[index % rooms]
+            offset = index / typists * (burst + pause)
+            # spread the keystrokes of the typists across the interval
+            await asyncio.sleep(index / typists / keystrokes)
+            for keystroke in range(int(duration * keystrokes)):
+                is_pausing = (keystroke / keystrokes + offset) % (burst + pause) >= burst
+                if throttled and not is_pausing:
+                    aggregator.add(f"chat_{room_uuid}", room_uuid, user)
+                elif not is_pausing:
+                    await channel_layer.group_send(f"chat_{room_uuid}", {"type": "chat.typing", "user": user.id})
+                await asyncio.sleep(1 / keystrokes)
+
+        await asyncio.gather(*[type_keys(index, user) for index, user in enumerate(users)])
+        if throttled:
+            # let the typists expire, the last event clears the indicators
+            while aggregator._flush_task:
+                await asyncio.sleep(settings.CHAT_CONFIG["typing_interval"])
+        return channel_layer.group_sends
+
+    def handle(self, *args, **options):
+        """Simulate both the modes & print the channel layer messages per second."""
+
+        typists, rooms = options["typists"], options["rooms"]
+        keystrokes, duration = options["keystrokes"], options["duration"]
+        burst, pause = options["burst"], options["pause"]
+        self.print_styled_message(
+            f"{typists} typists in {rooms} room(s), {keystrokes} keystrokes/s for {duration}s in {burst}s bursts, "
+            f"interval {settings.CHAT_CONFIG['typing_interval']}s debounce {settings.CHAT_CONFIG['typing_debounce']}s",
+            "WARNING",
+        )
+        for label, throttled in (("per keystroke", False), ("throttled", True)):
+            started_at = time.perf_counter()
+            group_sends = asyncio.run(self.simulate(typists, rooms, keystrokes, duration, burst, pause, throttled))
+            elapsed = time.perf_counter() - started_at
+            self.print_styled_message(
+                f"{label:<16} {group_sends:>8} group sends {group_sends / duration:>10.1f} messages/s "
+                f"(wall {elapsed:.1f}s)",
+                "SUCCESS",
+            )
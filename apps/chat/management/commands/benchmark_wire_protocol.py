@@ -0,0 +1,99 @@
+import json
+import time
+
+import msgpack
+from django.db import transaction
+
+from apps.chat.models import Message, Room, Tenant, User
+from apps.chat.serializers import serialize_message
+from apps.common.management.commands.base import AppBaseCommand
+
+
+class Command(AppBaseCommand):
+    help = (
+        "Compares the encode/decode cost & the bytes on the wire of the JSON & the MessagePack socket "
+        "protocols, for the `fetched_messages` pages & the `new_message` events. The sample data is "
+        "created in a transaction & rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-sizes", type=int, nargs="+", default=[1, 10, 50, 100], help="Messages per page.")
+        parser.add_argument("--runs", type=int, default=1000, help="Number of times each page is encoded/decoded.")
+        parser.add_argument("--content-length", type=int, default=100, help="Length of the message content.")
+
+    def create_sample_data(self, messages_count, content_length):
+        """Room with the messages from a few senders."""
+
+        tenant = Tenant.objects.create(name="benchmark", tenant_id="benchmark-tenant")
+        users = [
+            User.objects.create_user(
+                email=f"benchmark-{index}@example.com",
+                user_id=f"benchmark-user-{index}",
+                first_name=f"User {index}",
+                tenant=tenant,
+            )
+            for index in range(10)
+        ]
+        room = Room.objects.create(name="benchmark-room")
+        Message.objects.bulk_create(
+            [
+                Message(room=room, user=users[index % len(users)], content="x" * content_length)
+                for index in range(messages_count)
+            ]
+        )
+        return room
+
+    @staticmethod
+    def time_per_run(runs, func):
+        """Returns the cost of a single call in micro seconds."""
+
+        started_at = time.perf_counter()
+        for _ in range(runs):
+            func()
+        return (time.perf_counter() - started_at) * 1_000_000 / runs
+
+    def measure(self, label, content, runs):
+        """Encode/decode the content with both the protocols & print the comparison."""
+
+        json_frame, msgpack_frame = json.dumps(content), msgpack.packb(content)
+        json_size, msgpack_size = len(json_frame.encode()), len(msgpack_frame)
+        results = {
+            "json": (
+                self.time_per_run(runs, lambda: json.dumps(content)),
+                self.time_per_run(runs, lambda: json.loads(json_frame)),
+                json_size,
+            ),
+            "msgpack": (
+                self.time_per_run(runs, lambda: msgpack.packb(content)),
+                self.time_per_run(runs, lambda: msgpack.unpackb(msgpack_frame)),
+                msgpack_size,
+            ),
+        }
+
+        for protocol, (encode, decode, size) in results.items():
+            self.print_styled_message(
+                f"{label:<24} {protocol:<8} encode {encode:>9.1f} us   decode {decode:>9.1f} us   {size:>8} bytes",
+                "SUCCESS",
+            )
+        self.print_styled_message(f"{'':<24} msgpack/json bytes {msgpack_size / json_size:.2%}", "WARNING")
+
+    def handle(self, *args, **options):
+        """Build the pages as sent by the `ChatConsumer` & measure both the protocols."""
+
+        page_sizes, runs = options["page_sizes"], options["runs"]
+        with transaction.atomic():
+            room = self.create_sample_data(max(page_sizes), options["content_length"])
+            messages = [serialize_message(message) for message in Message.objects.filter(room=room).for_wire()]
+
+            self.measure("new_message", {"command": "new_message", "message": messages[0]}, runs)
+            for page_size in page_sizes:
+                page = messages[:page_size]
+                content = {
+                    "command": "fetched_messages",
+                    "messages": page,
+                    "username": "benchmark-0@example.com",
+                    "has_more": True,
+                    "cursors": {"before": page[-1]["id"], "after": page[0]["id"]},
+                }
+                self.measure(f"fetched_messages({page_size})", content, runs)
+            transaction.set_rollback(True)
@@ -1,5 +1,6 @@
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import UserManager
+from django.db.models import Prefetch
 
 from apps.common.managers import BaseObjectManagerQuerySet
 
@@ -59,3 +60,59 @@ class CourseObjectManagerQuerySet(BaseObjectManagerQuerySet):
         """Return a queryset of only the tenant courses."""
 
         return self.filter(is_ccms=False)
+
+
+class MessageObjectManagerQuerySet(BaseObjectManagerQuerySet):
+    """
+    Custom QuerySet for Message Model. Keyset pagination on `(created_at, id)`, backed by the
+    `(room, created_at, id)` index. The cost of a page does not depend on how far back it is.
+
+    Usage on the model class -
+        objects = MessageObjectManagerQuerySet.as_manager()
+
+    Available methods -
+        get_or_none, for_wire, latest_first, before, after, since
+    """
+
+    def for_wire(self):
+        """
+        Loads only the fields used by the `serialize_message`. The senders are fetched in a single
+        batched query for the page, so a page costs 2 queries irrespective of its size.
+        """
+
+        from apps.chat.models import User
+        from apps.chat.serializers.message import MESSAGE_WIRE_FIELDS, SENDER_WIRE_FIELDS
+
+        return self.only(*MESSAGE_WIRE_FIELDS).prefetch_related(
+            Prefetch("user", queryset=User.objects.only(*SENDER_WIRE_FIELDS))
+        )
+
+    def latest_first(self):
+        """Newest messages first, `id` breaks the ties of the same `created_at`."""
+
+        return self.order_by("-created_at", "-id")
+
+    def before(self, created_at, pk=None):
+        """Messages older than the cursor, newest first."""
+
+        queryset = self.filter(created_at__lte=created_at)
+        if pk is None:
+            queryset = queryset.exclude(created_at=created_at)
+        else:
+            queryset = queryset.exclude(created_at=created_at, id__gte=pk)
+        return queryset.latest_first()
+
+    def after(self, created_at, pk=None):
+        """Messages newer than the cursor, oldest first."""
+
+        queryset = self.filter(created_at__gte=created_at)
+        if pk is None:
+            queryset = queryset.exclude(created_at=created_at)
+        else:
+            queryset = queryset.exclude(created_at=created_at, id__lte=pk)
+        return queryset.order_by("created_at", "id")
+
+    def since(self, created_at):
+        """Messages on or after the given time, oldest first. Used to jump to a date."""
+
+        return self.filter(created_at__gte=created_at).order_by("created_at", "id")
@@ -1,18 +1,49 @@
-from channels.db import database_sync_to_async
+from urllib.parse import parse_qsl
+
 from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import APIException
+
+from apps.chat.helpers import aauthenticate_user_from_token
+from apps.chat.tickets import aget_user_from_ws_ticket
+
 
-from apps.chat.helpers import authenticate_user_from_token
+def parse_query_string(query_string: bytes) -> dict:
+    """
+    Parse the websocket's query string. Empty values, values containing `=` & url
+    encoded values are handled. The last value is considered for repeated keys.
+    """
 
+    return dict(parse_qsl(query_string.decode(errors="replace"), keep_blank_values=True))
 
-@database_sync_to_async
-def get_user(token, host=None, issuer=None):
+
+async def get_user(token, host=None, issuer=None):
     """Get the user from the database or return AnonymousUser."""
 
-    return authenticate_user_from_token(token, host, issuer) or AnonymousUser()
+    if not token:
+        return AnonymousUser()
+
+    try:
+        user, _auth = await aauthenticate_user_from_token(token, host, issuer)
+    except APIException:
+        return AnonymousUser()
+    return user
+
+
+async def get_user_from_ticket(ticket):
+    """Get the user of the connection ticket or return AnonymousUser."""
+
+    return await aget_user_from_ws_ticket(ticket) or AnonymousUser()
 
 
 class AppWSAuthMiddleware:
-    """Custom Authentication Middleware"""
+    """
+    Custom Authentication Middleware. The authentication is async native, the handshakes don't
+    occupy the sync thread pool while waiting for the IDP / KC.
+
+    Clients can pass either -
+        > `ticket`  : a connection ticket from the `WSTicketAPIView`, verified locally
+        > `token`, `issuer-url` & `issuer` : the IDP / KC token, verified by the IDP / KC
+    """
 
     def __init__(self, app):
         self.app = app
@@ -20,18 +51,13 @@ class AppWSAuthMiddleware:
     async def __call__(self, scope, receive, send):
         """Include User in scope based on custom authentication. Using IDP token to get & validate user."""
 
-        request_data = dict(x.split("=") for x in scope["query_string"].decode().split("&"))
-        try:
-            idp_token = request_data.get("token")
-        except [ValueError, KeyError]:
-            idp_token = None
-        try:
-            host = request_data.get("issuer-url")
-        except [ValueError, KeyError]:
-            host = None
-        try:
-            issuer = request_data.get("issuer")
-        except [ValueError, KeyError]:
-            issuer = None
+        request_data = parse_query_string(scope.get("query_string", b""))
+        if ticket := request_data.get("ticket"):
+            scope["user"] = await get_user_from_ticket(ticket)
+            return await self.app(scope, receive, send)
+
+        idp_token = request_data.get("token")
+        host = request_data.get("issuer-url")
+        issuer = request_data.get("issuer")
         scope["user"] = await get_user(idp_token, host, issuer)
         return await self.app(scope, receive, send)
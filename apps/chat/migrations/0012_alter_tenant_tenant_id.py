@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 09:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_alter_course_image_alter_tenant_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tenant',
+            name='tenant_id',
+            field=models.CharField(db_index=True),
+        ),
+    ]
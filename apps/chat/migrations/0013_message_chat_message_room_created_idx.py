@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_alter_tenant_tenant_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'created_at', 'id'], name='chat_message_room_created_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.3 on 2026-10-18 10:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0014_room_chat_room_uuid_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomReadPointer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('last_read_at', models.DateTimeField()),
+                (
+                    'last_read_message',
+                    models.ForeignKey(
+                        default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to='chat.message'
+                    ),
+                ),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='chat.room')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'abstract': False,
+                'default_related_name': 'related_read_pointers',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='roomreadpointer',
+            constraint=models.UniqueConstraint(fields=('room', 'user'), name='chat_room_read_pointer_unique'),
+        ),
+    ]
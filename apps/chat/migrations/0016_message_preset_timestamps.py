@@ -0,0 +1,24 @@
+# Generated by Django 4.2.3 on 2026-10-18 10:40
+
+import apps.common.model_fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0015_roomreadpointer_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='created_at',
+            field=apps.common.model_fields.AppPresetDateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='modified_at',
+            field=apps.common.model_fields.AppPresetDateTimeField(auto_now=True),
+        ),
+    ]
@@ -2,7 +2,8 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.db.models import Q
 
-from apps.chat.managers import AppUserManagerQuerySet, CourseObjectManagerQuerySet
+from apps.chat.managers import AppUserManagerQuerySet, CourseObjectManagerQuerySet, MessageObjectManagerQuerySet
+from apps.common.model_fields import AppPresetDateTimeField
 from apps.common.models import COMMON_CHAR_FIELD_MAX_LENGTH, COMMON_NULLABLE_FIELD_CONFIG, BaseModel
 
 
@@ -24,7 +25,7 @@ class Tenant(BaseModel):
 
     # Fields
     name = models.CharField(max_length=COMMON_CHAR_FIELD_MAX_LENGTH)
-    tenant_id = models.CharField()
+    tenant_id = models.CharField(db_index=True)
     b2b_id = models.PositiveIntegerField(**COMMON_NULLABLE_FIELD_CONFIG)
     image = models.URLField(**COMMON_NULLABLE_FIELD_CONFIG, max_length=COMMON_CHAR_FIELD_MAX_LENGTH)
 
@@ -104,6 +105,7 @@ class Room(BaseModel):
 
     class Meta(BaseModel.Meta):
         default_related_name = "related_rooms"
+        indexes = [models.Index(fields=["uuid"], name="chat_room_uuid_idx")]
 
     name = models.CharField(max_length=COMMON_CHAR_FIELD_MAX_LENGTH, unique=True)
     users = models.ManyToManyField(User, blank=True)
@@ -126,22 +128,59 @@ class Message(BaseModel):
         Datetime    - created_at, modified_at
 
     App QuerySet Manager Methods -
-        get_or_none
+        get_or_none, for_wire, latest_first, before, after, since
     """
 
     class Meta(BaseModel.Meta):
         default_related_name = "related_messages"
+        indexes = [models.Index(fields=["room", "created_at", "id"], name="chat_message_room_created_idx")]
+
+    objects = MessageObjectManagerQuerySet.as_manager()
 
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
     content = models.TextField(max_length=500)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    # the write-behind messages are inserted with the timestamps of their broadcast, refer `apps.chat.buffers`
+    created_at = AppPresetDateTimeField(auto_now_add=True)
+    modified_at = AppPresetDateTimeField(auto_now=True)
+
     def __str__(self):
         """User and room name as string representation."""
 
         return f"Message({self.user} {self.room})"
 
 
+class RoomReadPointer(BaseModel):
+    """
+    Read pointer of a room's member, the last message read by the user in the room. The unread
+    counts are maintained on redis & reconciled with these, refer `apps.chat.unread`.
+
+    Model Fields -
+        PK          - id
+        FKs         - room, user, last_read_message
+        Fields      - uuid
+        Datetime    - last_read_at, created_at, modified_at
+
+    App QuerySet Manager Methods -
+        get_or_none
+    """
+
+    class Meta(BaseModel.Meta):
+        default_related_name = "related_read_pointers"
+        constraints = [models.UniqueConstraint(fields=["room", "user"], name="chat_room_read_pointer_unique")]
+
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    last_read_message = models.ForeignKey(Message, on_delete=models.SET_NULL, **COMMON_NULLABLE_FIELD_CONFIG)
+    last_read_at = models.DateTimeField()
+
+    def __str__(self):
+        """User and room name as string representation."""
+
+        return f"RoomReadPointer({self.user} {self.room})"
+
+
 class Course(BaseModel):
     """
     Model to store Course info from IIHT-B2B-MAIN.
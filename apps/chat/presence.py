@@ -0,0 +1,260 @@
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from apps.common.caches import get_redis_client
+from apps.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def get_room_scope(room_id):
+    """Presence scope of a room."""
+
+    return f"room:{room_id}"
+
+
+def get_tenant_scope(tenant_id):
+    """Presence scope of a tenant."""
+
+    return f"tenant:{tenant_id}"
+
+
+class PresenceService:
+    """
+    Online users per scope(room / tenant) on redis, shared by all the workers.
+
+        > scope       : sorted set of the online user pks, scored by the expiry of their presence
+        > connections : sorted set of the channel names of an user in a scope, scored by their expiry.
+                        The user is offline once no connection is left
+
+    The lookups are a single redis call irrespective of the room size - `ZCOUNT` for the counts
+    (pipelined across the scopes) & `ZRANGEBYSCORE` for the online users. The entries past their
+    expiry are ignored by the lookups & reaped on the heartbeat.
+
+    A heartbeat thread per worker refreshes the expiry of the worker's connections every
+    `heartbeat_interval` seconds in a single pipeline. The entries of a crashed worker are not
+    refreshed & are reaped after the `ttl`, even while the user's other connections are alive.
+
+    Best effort, the redis failures are logged & the presence is treated as empty. Requires the
+    redis cache, disabled otherwise(Eg: locmem).
+
+    Metrics - presence_connections, presence_heartbeat_duration_seconds: histogram, presence_failed{action}
+    """
+
+    def __init__(self, cache_alias="default"):
+        self.cache_alias = cache_alias
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._pid = None
+        metrics.register_collector(self.collect_metrics)
+
+    @property
+    def config(self):
+        """Returns the `PRESENCE_CONFIG`."""
+
+        return settings.PRESENCE_CONFIG
+
+    def get_scope_key(self, scope):
+        """Key of the scope's sorted set."""
+
+        return caches[self.cache_alias].make_key(f"presence:{scope}")
+
+    def get_connections_key(self, scope, user_pk):
+        """Key of the user's connections in the scope. Not the key of the earlier set, to avoid `WRONGTYPE`."""
+
+        return caches[self.cache_alias].make_key(f"presence:{scope}:connections:{user_pk}")
+
+    def start_heartbeat(self):
+        """Start the heartbeat thread, once in every process."""
+
+        pid = os.getpid()
+        with self._lock:
+            if self._pid != pid:
+                self._pid = pid
+                self._connections = {}
+                threading.Thread(target=self.run_heartbeat, daemon=True).start()
+
+    def track(self, channel_name, user_pk, scopes):
+        """Remember the scopes of the connection for the heartbeat."""
+
+        self.start_heartbeat()
+        with self._lock:
+            user_pk, tracked_scopes = self._connections.get(channel_name, (user_pk, set()))
+            self._connections[channel_name] = (user_pk, tracked_scopes | set(scopes))
+
+    def untrack(self, channel_name, scopes):
+        """Forget the scopes of the connection."""
+
+        with self._lock:
+            if channel_name not in self._connections:
+                return
+            user_pk, tracked_scopes = self._connections[channel_name]
+            if tracked_scopes := tracked_scopes - set(scopes):
+                self._connections[channel_name] = (user_pk, tracked_scopes)
+            else:
+                del self._connections[channel_name]
+
+    def join(self, channel_name, user_pk, scopes):
+        """Mark the user online in the scopes. Returns the scopes in which the user just came online."""
+
+        client = get_redis_client(self.cache_alias)
+        if client is None or not scopes:
+            return []
+
+        self.track(channel_name, user_pk, scopes)
+        now = time.time()
+        try:
+            pipeline = client.pipeline()
+            for scope in scopes:
+                scope_key, connections_key = self.get_scope_key(scope), self.get_connections_key(scope, user_pk)
+                pipeline.zscore(scope_key, user_pk)
+                pipeline.zadd(scope_key, {user_pk: now + self.config["ttl"]})
+                pipeline.expire(scope_key, self.config["ttl"])
+                pipeline.zadd(connections_key, {channel_name: now + self.config["ttl"]})
+                pipeline.expire(connections_key, self.config["ttl"])
+            results = pipeline.execute()
+        except Exception as error:  # noqa
+            metrics.increment("presence_failed", action="join")
+            logger.warning(f"PresenceService: unable to join {scopes}: {error}")
+            return []
+
+        # the previous score of each scope, the user was offline if missing or expired
+        previous_scores = results[::5]
+        return [scope for scope, score in zip(scopes, previous_scores) if not score or score <= now]
+
+    def leave(self, channel_name, user_pk, scopes):
+        """
+        Remove the connection from the scopes. Returns the scopes in which the user went offline, ie.
+        the user has no other connection in the scope.
+        """
+
+        client = get_redis_client(self.cache_alias)
+        if client is None or not scopes:
+            return []
+
+        self.untrack(channel_name, scopes)
+        try:
+            pipeline = client.pipeline()
+            for scope in scopes:
+                connections_key = self.get_connections_key(scope, user_pk)
+                pipeline.zrem(connections_key, channel_name)
+                pipeline.zremrangebyscore(connections_key, "-inf", time.time())
+                pipeline.zcard(connections_key)
+            remaining = pipeline.execute()[2::3]
+
+            # a connection joining in between is added back by its heartbeat
+            offline_scopes = [scope for scope, count in zip(scopes, remaining) if not count]
+            if offline_scopes:
+                pipeline = client.pipeline()
+                for scope in offline_scopes:
+                    pipeline.zrem(self.get_scope_key(scope), user_pk)
+                pipeline.execute()
+        except Exception as error:  # noqa
+            metrics.increment("presence_failed", action="leave")
+            logger.warning(f"PresenceService: unable to leave {scopes}: {error}")
+            return []
+        return offline_scopes
+
+    def heartbeat(self):
+        """
+        Refresh the expiry of the worker's connections & reap the expired entries of their scopes &
+        of the users' connections.
+        """
+
+        client = get_redis_client(self.cache_alias)
+        with self._lock:
+            connections = list(self._connections.items())
+        if client is None or not connections:
+            return
+
+        started_at, now = time.perf_counter(), time.time()
+        expires_at, ttl = now + self.config["ttl"], self.config["ttl"]
+        pipeline = client.pipeline(transaction=False)
+        scopes, connections_keys = set(), set()
+        for channel_name, (user_pk, tracked_scopes) in connections:
+            for scope in tracked_scopes:
+                connections_key = self.get_connections_key(scope, user_pk)
+                pipeline.zadd(self.get_scope_key(scope), {user_pk: expires_at})
+                pipeline.zadd(connections_key, {channel_name: expires_at})
+                pipeline.expire(connections_key, ttl)
+                scopes.add(scope)
+                connections_keys.add(connections_key)
+        for scope in scopes:
+            pipeline.zremrangebyscore(self.get_scope_key(scope), "-inf", now)
+            pipeline.expire(self.get_scope_key(scope), ttl)
+        for connections_key in connections_keys:
+            pipeline.zremrangebyscore(connections_key, "-inf", now)
+        pipeline.execute()
+        metrics.observe("presence_heartbeat_duration_seconds", time.perf_counter() - started_at)
+
+    def run_heartbeat(self):
+        """Heartbeat loop of the worker."""
+
+        while True:
+            time.sleep(self.config["heartbeat_interval"])
+            try:
+                self.heartbeat()
+            except Exception as error:  # noqa
+                metrics.increment("presence_failed", action="heartbeat")
+                logger.warning(f"PresenceService: heartbeat failed: {error}")
+
+    def count(self, scopes):
+        """Returns the online users count of the scopes, in a single round trip."""
+
+        client = get_redis_client(self.cache_alias)
+        if client is None or not scopes:
+            return {scope: 0 for scope in scopes}
+
+        try:
+            pipeline = client.pipeline(transaction=False)
+            for scope in scopes:
+                pipeline.zcount(self.get_scope_key(scope), f"({time.time()}", "+inf")
+            return dict(zip(scopes, pipeline.execute()))
+        except Exception as error:  # noqa
+            metrics.increment("presence_failed", action="count")
+            logger.warning(f"PresenceService: unable to count {scopes}: {error}")
+            return {scope: 0 for scope in scopes}
+
+    def get_online(self, scope):
+        """Returns the pks of the online users of the scope."""
+
+        client = get_redis_client(self.cache_alias)
+        if client is None:
+            return []
+
+        try:
+            user_pks = client.zrangebyscore(self.get_scope_key(scope), f"({time.time()}", "+inf")
+        except Exception as error:  # noqa
+            metrics.increment("presence_failed", action="get_online")
+            logger.warning(f"PresenceService: unable to get the online users of {scope}: {error}")
+            return []
+        return [int(user_pk) for user_pk in user_pks]
+
+    async def ajoin(self, channel_name, user_pk, scopes):
+        """Async version of the `join`."""
+
+        return await sync_to_async(self.join, thread_sensitive=False)(channel_name, user_pk, scopes)
+
+    async def aleave(self, channel_name, user_pk, scopes):
+        """Async version of the `leave`."""
+
+        return await sync_to_async(self.leave, thread_sensitive=False)(channel_name, user_pk, scopes)
+
+    async def aget_online(self, scope):
+        """Async version of the `get_online`."""
+
+        return await sync_to_async(self.get_online, thread_sensitive=False)(scope)
+
+    def collect_metrics(self):
+        """Collector for the `MetricsRegistry`."""
+
+        return {"presence_connections": len(self._connections)}
+
+
+presence = PresenceService()
@@ -1,6 +1,6 @@
 # flake8: noqa
 from .tenant import TenantSerializer, TenantOnboardSerializer
 from .user import UserListSerializer, UserOnboardSerializer, UserSerializer
-from .message import MessageSerializer
+from .message import MessageSerializer, serialize_message, serialize_sender
 from .room import RoomSerializer
 from .course import CourseListSerializer, CourseSerializer, CourseEnrollSerializer, CourseExpertSerializer
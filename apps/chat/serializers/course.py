@@ -58,8 +58,7 @@ class CourseEnrollSerializer(CourseSerializer):
                 tenant = user.tenant
                 course = Course.init_course(tenant, **self.validated_data)
                 room = course.chat_room()
-                if user not in room.users.all():
-                    room.users.add(user)
+                room.users.add(user)
                 if is_expert:
                     course.related_course_experts.get_or_create(user=user, tenant=tenant)
         return True
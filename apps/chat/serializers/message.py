@@ -1,4 +1,4 @@
-from apps.chat.models import Message
+from apps.chat.models import Message, User
 from apps.chat.serializers import UserListSerializer
 from apps.common.serializers import AppReadOnlyModelSerializer
 
@@ -12,3 +12,46 @@ class MessageSerializer(AppReadOnlyModelSerializer):
         model = Message
         exclude = []
         depth = 1
+
+
+def serialize_datetime(value):
+    """ISO 8601 representation, same as the DRF's `DateTimeField` in UTC."""
+
+    value = value.isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+
+# fields loaded for the `serialize_message`, refer `MessageObjectManagerQuerySet.for_wire`
+MESSAGE_WIRE_FIELDS = ["id", "uuid", "room", "user", "content", "created_at", "modified_at"]
+SENDER_WIRE_FIELDS = ["id", "uuid", "user_id", "first_name", "last_name", "image", "is_expert"]
+
+
+def serialize_sender(user: User) -> dict:
+    """Compact reference of the message's sender."""
+
+    return {
+        "id": user.id,
+        "uuid": str(user.uuid),
+        "user_id": user.user_id,
+        "name": f"{user.first_name} {user.last_name or ''}".strip(),
+        "image": user.image,
+        "is_expert": user.is_expert,
+    }
+
+
+def serialize_message(message: Message) -> dict:
+    """
+    Compact representation of the message sent on the socket. Built from the loaded fields only,
+    the `user` must be loaded(`for_wire`) so that there are no per message queries.
+    Unlike the `MessageSerializer`, the room & the sender's tenant / chat room are not nested.
+    """
+
+    return {
+        "id": message.id,
+        "uuid": str(message.uuid),
+        "room_id": message.room_id,
+        "content": message.content,
+        "created_at": serialize_datetime(message.created_at),
+        "modified_at": serialize_datetime(message.modified_at),
+        "sender": serialize_sender(message.user),
+    }
@@ -0,0 +1,86 @@
+from collections import defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from apps.chat.caches import room_membership_cache, tenant_cache, token_cache, user_cache
+from apps.chat.models import CourseExpert, Room, Tenant, User
+
+
+@receiver(post_save, sender=User)
+def invalidate_inactive_user_tokens(sender, instance, **kwargs):
+    """The cached tokens of a deactivated user must not authenticate anymore."""
+
+    if not instance.is_active:
+        token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_tokens(sender, instance, **kwargs):
+    """Remove the cached tokens of a deleted user."""
+
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_identity(sender, instance, **kwargs):
+    """Remove the stale user instance from the identity cache."""
+
+    user_cache.invalidate_instance(instance)
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+def invalidate_tenant_identity(sender, instance, **kwargs):
+    """Remove the stale tenant instance from the identity cache."""
+
+    tenant_cache.invalidate_instance(instance)
+
+
+@receiver(m2m_changed, sender=Room.users.through)
+def sync_room_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Apply the `room.users` / `user.related_rooms` changes to the membership cache, once committed.
+    The pks are not passed for the clear, so they are read before the clear.
+    """
+
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if action == "pre_clear":
+        pk_set = set((instance.related_rooms if reverse else instance.users).values_list("id", flat=True))
+
+    room_members = defaultdict(set)
+    for pk in pk_set:
+        room_id, user_pk = (pk, instance.pk) if reverse else (instance.pk, pk)
+        room_members[room_id].add(user_pk)
+
+    sync = room_membership_cache.add_members if action == "post_add" else room_membership_cache.remove_members
+    for room_id, user_pks in room_members.items():
+        transaction.on_commit(partial(sync, room_id, user_pks))
+
+
+@receiver(post_save, sender=CourseExpert)
+def add_course_expert_membership(sender, instance, created, **kwargs):
+    """The experts of a course are the members of the course's room."""
+
+    if created and (room_id := instance.course.room_id):
+        transaction.on_commit(partial(room_membership_cache.add_members, room_id, [instance.user_id]))
+
+
+@receiver(post_delete, sender=CourseExpert)
+def remove_course_expert_membership(sender, instance, **kwargs):
+    """Remove the expert from the course's room, the room's member set is loaded again."""
+
+    if room_id := instance.course.room_id:
+        transaction.on_commit(partial(room_membership_cache.remove_members, room_id, [instance.user_id]))
+
+
+@receiver(post_delete, sender=Room)
+def remove_room_membership(sender, instance, **kwargs):
+    """Drop the member set of the deleted room."""
+
+    transaction.on_commit(partial(room_membership_cache.remove_members, instance.pk))
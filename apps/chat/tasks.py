@@ -0,0 +1,10 @@
+from celery import shared_task
+
+from apps.chat.unread import unread_counter
+
+
+@shared_task
+def reconcile_unread_counts():
+    """Reset the unread counters of the rooms with new messages from the db, refer `UnreadCounter.reconcile`."""
+
+    return unread_counter.reconcile()
@@ -0,0 +1,159 @@
+import time
+import uuid
+from unittest import mock
+
+import jwt
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+
+from apps.chat import auth_backends
+from apps.chat.caches import rejected_token_cache, tenant_cache, token_cache, user_cache
+from apps.chat.helpers import authenticate_user_from_token, averify_token, verify_token
+from apps.common.exceptions import IDPServiceUnavailable
+
+IDP_LOGIN_INFO = {
+    "tenant": {"id": "tenant-1", "name": "Tenant"},
+    "user": {"id": "user-1", "name": "Test", "surname": "User", "emailAddress": "test.user@example.com"},
+}
+
+
+class RequestAuthenticationTestCase(TestCase):
+    """
+    The token of a request is validated only once across the middleware, DRF & the view. Only the
+    definitive rejections of the IDP are cached.
+    """
+
+    def setUp(self):
+        cache.clear()
+        for two_tier_cache in (token_cache, rejected_token_cache, tenant_cache, user_cache):
+            two_tier_cache.local.clear()
+        self.token = f"token-{uuid.uuid4()}"
+        self.url = reverse("chat:presence")
+        spy = mock.patch.object(
+            auth_backends, "authenticate_user_from_token", wraps=auth_backends.authenticate_user_from_token
+        )
+        self.authenticate_user_from_token = spy.start()
+        self.addCleanup(spy.stop)
+
+    @mock.patch("apps.chat.helpers.idp_get_request", return_value=(True, IDP_LOGIN_INFO))
+    def test_valid_token_is_validated_once(self, idp_get_request):
+        response = self.client.get(self.url, HTTP_TOKEN=self.token)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user.user_id, IDP_LOGIN_INFO["user"]["id"])
+        idp_get_request.assert_called_once()
+        self.authenticate_user_from_token.assert_called_once()
+
+    @mock.patch("apps.chat.helpers.idp_get_request", return_value=(False, {"data": None, "status_code": 401}))
+    def test_rejected_token_is_validated_once(self, idp_get_request):
+        response = self.client.get(self.url, HTTP_TOKEN=self.token)
+
+        self.assertEqual(response.status_code, 403)
+        idp_get_request.assert_called_once()
+        self.authenticate_user_from_token.assert_called_once()
+
+    @mock.patch("apps.chat.helpers.idp_get_request", return_value=(False, {"data": None, "status_code": 429}))
+    def test_throttled_token_is_not_cached_as_rejected(self, idp_get_request):
+        for _ in range(2):
+            response = self.client.get(self.url, HTTP_TOKEN=self.token)
+            self.assertEqual(response.status_code, 503)
+
+        self.assertEqual(idp_get_request.call_count, 2)
+
+
+IDP_UNAVAILABLE_RESPONSE = (False, {"data": None, "status_code": 503})
+
+
+class TokenCacheTestCase(TestCase):
+    """
+    A cached token never outlives its `exp` or its user. The stale entries are served only while
+    the IDP is down.
+    """
+
+    def setUp(self):
+        cache.clear()
+        for two_tier_cache in (token_cache, rejected_token_cache, tenant_cache, user_cache):
+            two_tier_cache.local.clear()
+        self.now = time.time()
+        patcher = mock.patch("time.time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_token(self, expires_in=60 * 60):
+        """An IDP token, only its `exp` is read without the IDP."""
+
+        return jwt.encode({"exp": int(self.now) + expires_in, "jti": uuid.uuid4().hex}, "secret", algorithm="HS256")
+
+    def verify(self, token, response=(True, IDP_LOGIN_INFO)):
+        """Verify the token against the given IDP response."""
+
+        with mock.patch("apps.chat.helpers.idp_get_request", return_value=response):
+            return verify_token(token)
+
+    def test_entry_is_capped_by_the_token_expiry(self):
+        token = self.get_token(expires_in=60)
+        user = self.verify(token)
+        self.assertEqual(token_cache.get_entry(token)["user"], user.pk)
+
+        self.now += 61
+        self.assertIsNone(token_cache.get_entry(token))
+        self.assertIsNone(token_cache.get_entry(token, allow_stale=True))
+
+    def test_stale_entry_is_served_only_while_the_idp_is_down(self):
+        token = self.get_token()
+        user = self.verify(token)
+
+        self.now += settings.AUTH_CACHE_CONFIG["token_ttl"] + 1
+        self.assertIsNone(token_cache.get_entry(token))
+        self.assertEqual(self.verify(token, IDP_UNAVAILABLE_RESPONSE), user)
+        with mock.patch("apps.chat.helpers.aidp_get_request", return_value=IDP_UNAVAILABLE_RESPONSE):
+            self.assertEqual(async_to_sync(averify_token)(token), user)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.verify(token, (False, {"data": None, "status_code": 401}))
+
+    def test_no_stale_entry_beyond_the_stale_ttl_or_expiry(self):
+        for expires_in, elapsed in ((60 * 60 * 24, "stale_ttl"), (10 * 60, "exp")):
+            with self.subTest(elapsed=elapsed):
+                token = self.get_token(expires_in)
+                self.verify(token)
+                if elapsed == "stale_ttl":
+                    self.now += settings.AUTH_CACHE_CONFIG["token_ttl"] + settings.AUTH_CACHE_CONFIG["token_stale_ttl"]
+                else:
+                    self.now += expires_in
+                token_cache.local.clear()
+                with self.assertRaises(IDPServiceUnavailable):
+                    self.verify(token, IDP_UNAVAILABLE_RESPONSE)
+
+    def test_rejection_is_cached(self):
+        token = self.get_token()
+        with self.assertRaises(AuthenticationFailed):
+            self.verify(token, (False, {"data": None, "status_code": 401}))
+
+        self.assertIsNotNone(rejected_token_cache.get_rejection(token))
+        with mock.patch("apps.chat.helpers.idp_get_request") as idp_get_request:
+            with self.assertRaises(AuthenticationFailed):
+                authenticate_user_from_token(token)
+        idp_get_request.assert_not_called()
+
+    def test_user_invalidation(self):
+        tokens = [self.get_token() for _ in range(2)]
+        user = [self.verify(token) for token in tokens][0]
+        self.assertTrue(all(token_cache.get_entry(token) for token in tokens))
+
+        token_cache.invalidate_user(user.pk)
+        self.assertFalse(any(token_cache.get_entry(token, allow_stale=True) for token in tokens))
+
+    def test_deactivated_user_is_invalidated(self):
+        token = self.get_token()
+        user = self.verify(token)
+
+        user.is_active = False
+        user.save()
+        self.assertIsNone(token_cache.get_entry(token, allow_stale=True))
+        with self.assertRaises(IDPServiceUnavailable):
+            self.verify(token, IDP_UNAVAILABLE_RESPONSE)
@@ -0,0 +1,74 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.chat.buffers import message_buffer
+from apps.chat.models import Message, Room, Tenant, User
+from apps.common.metrics import get_metric_key, metrics
+
+
+@override_settings(CHAT_CONFIG={**settings.CHAT_CONFIG, "write_behind_max_retries": 1})
+@mock.patch("apps.chat.buffers.time.sleep")
+@mock.patch("apps.chat.buffers.close_old_connections")
+class MessageWriteBufferTestCase(TestCase):
+    """A batch is a single `INSERT` with the broadcast timestamps, a bad row drops only itself."""
+
+    @classmethod
+    def setUpTestData(cls):
+        tenant = Tenant.objects.create(name="Tenant", tenant_id="tenant-1")
+        cls.user = User.objects.create_user(email="user@example.com", user_id="user-1", tenant=tenant)
+        cls.room = Room.objects.create(name="room")
+
+    def get_messages(self, count):
+        """Messages as queued by the consumer, broadcast a minute back."""
+
+        broadcast_at = timezone.now() - timedelta(minutes=1)
+        return [
+            Message(
+                room=self.room,
+                user=self.user,
+                content=f"message {index}",
+                created_at=broadcast_at,
+                modified_at=broadcast_at,
+            )
+            for index in range(count)
+        ]
+
+    def get_dropped_count(self):
+        """Messages dropped so far."""
+
+        return metrics.snapshot()["counters"].get(get_metric_key("chat_message_dropped"), 0)
+
+    def test_batch_is_a_single_insert_keeping_the_timestamps(self, *mocks):
+        messages = self.get_messages(3)
+        with CaptureQueriesContext(connection) as queries:
+            message_buffer.flush(messages)
+
+        statements = [query["sql"] for query in queries if "SAVEPOINT" not in query["sql"]]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith("INSERT"))
+
+        for message in messages:
+            persisted = Message.objects.get(uuid=message.uuid)
+            self.assertEqual((persisted.created_at, persisted.modified_at), (message.created_at, message.created_at))
+
+    def test_only_the_failing_rows_are_dropped(self, *mocks):
+        messages = self.get_messages(4)
+        messages[1].user_id = messages[3].user_id = None
+        dropped_count = self.get_dropped_count()
+
+        with self.assertLogs("apps.chat.buffers", "ERROR") as logs:
+            message_buffer.flush(messages)
+
+        self.assertEqual(
+            set(Message.objects.filter(room=self.room).values_list("uuid", flat=True)),
+            {messages[0].uuid, messages[2].uuid},
+        )
+        self.assertEqual(self.get_dropped_count() - dropped_count, 2)
+        self.assertIn(str(messages[1].uuid), logs.output[0])
+        self.assertIn(str(messages[3].uuid), logs.output[1])
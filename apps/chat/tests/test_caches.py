@@ -0,0 +1,114 @@
+import uuid
+from unittest import mock
+
+import fakeredis
+from django.core.cache import cache
+from django.test import TestCase
+
+from apps.chat.caches import room_membership_cache
+from apps.chat.models import Course, CourseExpert, Room, Tenant, User
+
+
+class RoomMembershipCacheTestMixin:
+    """
+    The membership cache follows the `Room.users` & `CourseExpert` changes. The lookups clear the
+    local tier, the answer is then of the shared tier, as seen by any other worker.
+    """
+
+    redis_client = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name="Tenant", tenant_id="tenant-1")
+        cls.users = [
+            User.objects.create_user(email=f"user{index}@example.com", user_id=f"user-{index}", tenant=cls.tenant)
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        room_membership_cache.local.clear()
+        patcher = mock.patch("apps.chat.caches.get_redis_client", return_value=self.redis_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room = Room.objects.create(name="room")
+            self.room.users.add(self.users[0])
+
+    def is_member(self, user):
+        """Membership of the user on the shared tier."""
+
+        room_membership_cache.local.clear()
+        return room_membership_cache.is_member(self.room.id, user.pk)
+
+    def test_lookup_is_loaded_once(self):
+        self.assertTrue(self.is_member(self.users[0]))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.is_member(self.users[0]))
+            self.assertFalse(self.is_member(self.users[1]))
+
+    def test_add(self):
+        self.assertFalse(self.is_member(self.users[1]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.users.add(self.users[1])
+        with self.assertNumQueries(0):
+            self.assertTrue(self.is_member(self.users[1]))
+
+    def test_reverse_add(self):
+        self.assertFalse(self.is_member(self.users[1]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[1].related_rooms.add(self.room)
+        self.assertTrue(self.is_member(self.users[1]))
+
+    def test_remove(self):
+        self.assertTrue(room_membership_cache.is_member(self.room.id, self.users[0].pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.users.remove(self.users[0])
+        self.assertFalse(room_membership_cache.is_member(self.room.id, self.users[0].pk))
+        self.assertFalse(self.is_member(self.users[0]))
+
+    def test_clear(self):
+        self.room.users.add(self.users[1])
+        self.assertTrue(self.is_member(self.users[1]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.users.clear()
+        self.assertFalse(self.is_member(self.users[0]))
+        self.assertFalse(self.is_member(self.users[1]))
+
+    def test_course_expert_save_and_delete(self):
+        course = Course.objects.create(tenant=self.tenant, name="Course", course_uuid=uuid.uuid4(), room=self.room)
+        self.assertFalse(self.is_member(self.users[2]))
+        with self.captureOnCommitCallbacks(execute=True):
+            expert = CourseExpert.objects.create(tenant=self.tenant, course=course, user=self.users[2])
+        self.assertTrue(self.is_member(self.users[2]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            expert.delete()
+        self.assertFalse(self.is_member(self.users[2]))
+
+    def test_load_racing_remove_does_not_restore_member(self):
+        get_members_from_db = room_membership_cache.get_members_from_db
+
+        def remove_after_read(room_id):
+            """The member is removed after the loader read the db, before it stores the set."""
+
+            members = get_members_from_db(room_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.room.users.remove(self.users[0])
+            return members
+
+        with mock.patch.object(room_membership_cache, "get_members_from_db", side_effect=remove_after_read):
+            self.assertTrue(self.is_member(self.users[0]))
+        self.assertFalse(self.is_member(self.users[0]))
+
+
+class RedisRoomMembershipCacheTestCase(RoomMembershipCacheTestMixin, TestCase):
+    """Member sets on redis."""
+
+    def setUp(self):
+        self.redis_client = fakeredis.FakeRedis()
+        super().setUp()
+
+
+class LocmemRoomMembershipCacheTestCase(RoomMembershipCacheTestMixin, TestCase):
+    """Member sets stored as values, without redis."""
@@ -0,0 +1,97 @@
+import datetime
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+
+from apps.chat.consumers import ChatConsumer
+from apps.chat.consumers.chat_consumer import MAX_MESSAGE_ID
+from apps.chat.models import Message, Room, Tenant, User
+
+
+class FetchMessagesQueryBudgetTestCase(TestCase):
+    """A `fetch_messages` page costs the same queries irrespective of its size & senders."""
+
+    @classmethod
+    def setUpTestData(cls):
+        tenant = Tenant.objects.create(name="Tenant", tenant_id="tenant-1")
+        cls.users = [
+            User.objects.create_user(email=f"user{index}@example.com", user_id=f"user-{index}", tenant=tenant)
+            for index in range(20)
+        ]
+        cls.room = Room.objects.create(name="room")
+        cls.room.users.add(*cls.users)
+        Message.objects.bulk_create(
+            [Message(room=cls.room, user=cls.users[index % 20], content=f"message {index}") for index in range(150)]
+        )
+
+    def fetch_messages(self, payload):
+        """Returns the content sent for the `fetch_messages` command. The db calls run on the test thread."""
+
+        consumer = ChatConsumer()
+        consumer.user = self.users[0]
+        with mock.patch.object(consumer, "send_room_json") as send_room_json:
+            async_to_sync(consumer.fetch_messages)(self.room, payload)
+        return send_room_json.call_args.args[1]
+
+    def test_page_costs_two_queries(self):
+        for page_size in (5, 50, 100):
+            with self.subTest(page_size=page_size), self.assertNumQueries(2):
+                content = self.fetch_messages({"limit": page_size})
+                self.assertEqual(len(content["messages"]), page_size)
+
+    def test_message_id_cursor_costs_one_more_query(self):
+        cursor = Message.objects.filter(room=self.room).latest_first()[10].id
+        for page_size in (5, 50, 100):
+            with self.subTest(page_size=page_size), self.assertNumQueries(3):
+                content = self.fetch_messages({"limit": page_size, "before": cursor})
+                self.assertEqual(len(content["messages"]), page_size)
+
+
+class MessageCursorTestCase(TestCase):
+    """The cursors are the ids / uuids of the room's messages or timestamps, anything else is rejected."""
+
+    @classmethod
+    def setUpTestData(cls):
+        tenant = Tenant.objects.create(name="Tenant", tenant_id="tenant-1")
+        user = User.objects.create_user(email="user@example.com", user_id="user-1", tenant=tenant)
+        cls.room = Room.objects.create(name="room")
+        cls.message = Message.objects.create(room=cls.room, user=user, content="message")
+        other_room = Room.objects.create(name="other room")
+        cls.other_message = Message.objects.create(room=other_room, user=user, content="message")
+
+    def test_valid_cursors(self):
+        keyset = (self.message.created_at, self.message.id)
+        for value in (self.message.id, str(self.message.id), str(self.message.uuid)):
+            with self.subTest(value=value):
+                self.assertEqual(ChatConsumer.get_message_cursor(self.room, value), keyset)
+
+        created_at, message_id = ChatConsumer.get_message_cursor(self.room, "2024-01-02T03:04:05")
+        self.assertEqual(created_at, datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc))
+        self.assertIsNone(message_id)
+
+    def test_invalid_cursors(self):
+        # the id of the message, in the arabic-indic & fullwidth digits
+        unicode_ids = ["".join(chr(zero + int(digit)) for digit in str(self.message.id)) for zero in (0x0660, 0xFF10)]
+        for value in (
+            *unicode_ids,
+            None,
+            True,
+            1.5,
+            [],
+            {},
+            0,
+            -1,
+            "0",
+            "-1",
+            MAX_MESSAGE_ID + 1,
+            str(MAX_MESSAGE_ID + 1),
+            "9" * 40,
+            "\u00b2",
+            "",
+            "cursor",
+            self.other_message.id,
+            str(self.other_message.uuid),
+        ):
+            with self.subTest(value=value), self.assertRaisesMessage(ValueError, "Invalid cursor"):
+                ChatConsumer.get_message_cursor(self.room, value)
@@ -0,0 +1,55 @@
+from unittest import mock
+
+import fakeredis
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from apps.chat.presence import PresenceService
+
+SCOPE = "room:1"
+USER_PK = 1
+
+
+@mock.patch.object(PresenceService, "start_heartbeat")
+class PresenceServiceTestCase(SimpleTestCase):
+    """An user goes offline once the last live connection leaves, the connections of a crashed worker expire."""
+
+    def setUp(self):
+        self.now = 1_000_000.0
+        redis_client = fakeredis.FakeRedis()
+        for patcher in (
+            mock.patch("apps.chat.presence.get_redis_client", return_value=redis_client),
+            mock.patch("apps.chat.presence.time.time", side_effect=lambda: self.now),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_worker(self):
+        """Presence service of a worker, without a collector of its own."""
+
+        with mock.patch("apps.chat.presence.metrics.register_collector"):
+            return PresenceService()
+
+    def test_offline_after_the_last_connection(self, start_heartbeat):
+        worker = self.get_worker()
+        self.assertEqual(worker.join("channel-1", USER_PK, [SCOPE]), [SCOPE])
+        self.assertEqual(worker.join("channel-2", USER_PK, [SCOPE]), [])
+
+        self.assertEqual(worker.leave("channel-1", USER_PK, [SCOPE]), [])
+        self.assertEqual(worker.get_online(SCOPE), [USER_PK])
+        self.assertEqual(worker.leave("channel-2", USER_PK, [SCOPE]), [SCOPE])
+        self.assertEqual(worker.get_online(SCOPE), [])
+
+    def test_connection_of_crashed_worker_expires(self, start_heartbeat):
+        crashed_worker, worker = self.get_worker(), self.get_worker()
+        crashed_worker.join("crashed-channel", USER_PK, [SCOPE])
+        worker.join("channel", USER_PK, [SCOPE])
+
+        # only the live worker keeps sending the heartbeats
+        for _ in range(4):
+            self.now += settings.PRESENCE_CONFIG["heartbeat_interval"]
+            worker.heartbeat()
+
+        self.assertEqual(worker.get_online(SCOPE), [USER_PK])
+        self.assertEqual(worker.leave("channel", USER_PK, [SCOPE]), [SCOPE])
+        self.assertEqual(worker.get_online(SCOPE), [])
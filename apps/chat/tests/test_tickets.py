@@ -0,0 +1,73 @@
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import TestCase
+
+from apps.chat.caches import user_cache
+from apps.chat.middleware import AppWSAuthMiddleware
+from apps.chat.models import Tenant, User
+from apps.chat.tickets import aget_user_from_ws_ticket, create_ws_ticket, verify_ws_ticket
+
+
+class WSTicketTestCase(TestCase):
+    """A ticket opens a single connection of its active user, within its tenant & expiry."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = Tenant.objects.create(name="Tenant", tenant_id="tenant-1")
+        cls.user = User.objects.create_user(email="user@example.com", user_id="user-1", tenant=cls.tenant)
+
+    def setUp(self):
+        cache.clear()
+        user_cache.local.clear()
+        self.ticket = create_ws_ticket(self.user)["ticket"]
+
+    def get_user(self, ticket):
+        """Returns the user of the ticket."""
+
+        return async_to_sync(aget_user_from_ws_ticket)(ticket)
+
+    def test_valid_ticket(self):
+        self.assertEqual(verify_ws_ticket(self.ticket)["user"], self.user.pk)
+        self.assertEqual(self.get_user(self.ticket), self.user)
+
+    def test_ticket_is_single_use(self):
+        self.assertEqual(self.get_user(self.ticket), self.user)
+        self.assertIsNone(self.get_user(self.ticket))
+        self.assertEqual(self.get_user(create_ws_ticket(self.user)["ticket"]), self.user)
+
+    def test_tampered_ticket(self):
+        payload, signature = self.ticket.rsplit(":", 1)
+        for ticket in ("", "ticket", f"{payload}:{signature[::-1]}", f"{payload[::-1]}:{signature}"):
+            with self.subTest(ticket=ticket):
+                self.assertIsNone(verify_ws_ticket(ticket))
+                self.assertIsNone(self.get_user(ticket))
+
+    def test_expired_ticket(self):
+        with mock.patch("time.time", return_value=time.time() + 3600):
+            self.assertIsNone(verify_ws_ticket(self.ticket))
+            self.assertIsNone(self.get_user(self.ticket))
+
+    def test_inactive_user(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(self.get_user(self.ticket))
+
+    def test_tenant_mismatch(self):
+        other_tenant = Tenant.objects.create(name="Other", tenant_id="tenant-2")
+        User.objects.filter(pk=self.user.pk).update(tenant=other_tenant)
+        self.assertIsNone(self.get_user(self.ticket))
+
+    def test_middleware_authenticates_ticket_once(self):
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        middleware = AppWSAuthMiddleware(app)
+        for _ in range(2):
+            async_to_sync(middleware)({"query_string": f"ticket={self.ticket}".encode()}, None, None)
+
+        self.assertEqual(scopes[0]["user"], self.user)
+        self.assertFalse(scopes[1]["user"].is_authenticated)
@@ -0,0 +1,89 @@
+from unittest import mock
+
+import fakeredis
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from apps.chat.models import User
+from apps.chat.typing import TypingAggregator
+
+ROOM_UUID = "room-uuid"
+
+
+class RecordingChannelLayer:
+    """Channel layer which records the typists of the group sends, failing the first `failures`."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+
+    async def group_send(self, group, message):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("channel layer unavailable")
+        self.sent.append(sorted(user["id"] for user in message["users"]))
+
+
+@override_settings(CHAT_CONFIG={**settings.CHAT_CONFIG, "typing_interval": 60, "typing_debounce": 0})
+class TypingAggregatorTestCase(SimpleTestCase):
+    """The flushes are made by the tests, the interval of the flush tasks is never reached."""
+
+    def setUp(self):
+        patcher = mock.patch("apps.chat.typing.get_redis_client", return_value=fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users = [User(id=index, first_name=f"User {index}") for index in (1, 2)]
+
+    def get_aggregator(self, channel_layer):
+        """Aggregator of a worker."""
+
+        return TypingAggregator(channel_layer, key_prefix="test:typing")
+
+    @staticmethod
+    def stop(*aggregators):
+        """Cancel the flush tasks."""
+
+        for aggregator in aggregators:
+            if aggregator._flush_task:
+                aggregator._flush_task.cancel()
+
+    async def test_typists_are_shared_across_workers(self):
+        layer_a, layer_b = RecordingChannelLayer(), RecordingChannelLayer()
+        worker_a, worker_b = self.get_aggregator(layer_a), self.get_aggregator(layer_b)
+
+        worker_a.add("group", ROOM_UUID, self.users[0])
+        worker_b.add("group", ROOM_UUID, self.users[1])
+        await worker_a.flush()
+        await worker_b.flush()
+        await worker_a.flush()
+        self.assertEqual(layer_a.sent, [[1], [1, 2]])
+        self.assertEqual(layer_b.sent, [[1, 2]])
+
+        # the user stopping on a worker does not clear the typists of the other
+        worker_a.add("group", ROOM_UUID, self.users[0], is_typing=False)
+        await worker_a.flush()
+        await worker_b.flush()
+        self.assertEqual(layer_a.sent[-1], [2])
+        self.assertEqual(layer_b.sent[-1], [2])
+        self.assertNotIn(ROOM_UUID, worker_a._rooms)
+        self.stop(worker_a, worker_b)
+
+    async def test_failed_send_is_sent_again(self):
+        channel_layer = RecordingChannelLayer(failures=1)
+        aggregator = self.get_aggregator(channel_layer)
+
+        aggregator.add("group", ROOM_UUID, self.users[0])
+        with self.assertLogs("apps.chat.typing", "WARNING"):
+            await aggregator.flush()
+        await aggregator.flush()
+        self.assertEqual(channel_layer.sent, [[1]])
+
+        channel_layer.failures = 1
+        aggregator.add("group", ROOM_UUID, self.users[0], is_typing=False)
+        with self.assertLogs("apps.chat.typing", "WARNING"):
+            await aggregator.flush()
+        self.assertIn(ROOM_UUID, aggregator._rooms)
+        await aggregator.flush()
+        self.assertEqual(channel_layer.sent, [[1], []])
+        self.assertNotIn(ROOM_UUID, aggregator._rooms)
+        self.stop(aggregator)
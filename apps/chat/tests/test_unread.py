@@ -0,0 +1,141 @@
+from contextlib import nullcontext
+from datetime import timedelta
+from unittest import mock
+
+import fakeredis
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.chat.models import Message, Room, RoomReadPointer, Tenant, User
+from apps.chat.unread import UnreadCounter
+
+
+class MoveReadPointerTestCase(TestCase):
+    """The read pointer only moves forward & survives a concurrent first `mark_read`."""
+
+    @classmethod
+    def setUpTestData(cls):
+        tenant = Tenant.objects.create(name="Tenant", tenant_id="tenant-1")
+        cls.user = User.objects.create_user(email="user@example.com", user_id="user-1", tenant=tenant)
+        cls.room = Room.objects.create(name="room")
+        cls.room.users.add(cls.user)
+        cls.messages = Message.objects.bulk_create(
+            [Message(room=cls.room, user=cls.user, content=f"message {index}") for index in range(3)]
+        )
+        cls.read_at = timezone.now()
+
+    def move(self, last_read_at, message):
+        """Moves the pointer of the user in the room to the message."""
+
+        return UnreadCounter.move_read_pointer(self.room.id, self.user.pk, last_read_at, message.id)
+
+    def test_pointer_only_moves_forward(self):
+        self.move(self.read_at, self.messages[1])
+        self.move(self.read_at, self.messages[0])
+        self.move(self.read_at - timedelta(seconds=1), self.messages[2])
+        pointer = RoomReadPointer.objects.get(room=self.room, user=self.user)
+        self.assertEqual((pointer.last_read_at, pointer.last_read_message_id), (self.read_at, self.messages[1].id))
+
+        self.move(self.read_at, self.messages[2])
+        pointer.refresh_from_db()
+        self.assertEqual(pointer.last_read_message_id, self.messages[2].id)
+
+    def test_concurrently_created_pointer_is_updated(self):
+        create = RoomReadPointer.objects.create
+
+        def create_concurrently(**kwargs):
+            """Another connection inserts an older pointer first, committed outside of our savepoint."""
+
+            create(**{**kwargs, "last_read_at": self.read_at, "last_read_message_id": self.messages[0].id})
+            raise IntegrityError("duplicate key value violates unique constraint")
+
+        with (
+            mock.patch.object(RoomReadPointer.objects, "create", side_effect=create_concurrently),
+            mock.patch("apps.chat.unread.transaction.atomic", nullcontext),
+        ):
+            pointer = self.move(self.read_at, self.messages[1])
+
+        self.assertEqual(pointer.last_read_message_id, self.messages[1].id)
+        self.assertEqual(RoomReadPointer.objects.filter(room=self.room, user=self.user).count(), 1)
+
+
+@override_settings(UNREAD_CONFIG={"ttl": 60, "reconcile_interval": 60, "reconcile_settle": 0})
+class UnreadCounterTestCase(TestCase):
+    """The counts on redis stay in line with the read pointers across `mark_read` & `reconcile`."""
+
+    @classmethod
+    def setUpTestData(cls):
+        tenant = Tenant.objects.create(name="Tenant", tenant_id="tenant-1")
+        cls.reader = User.objects.create_user(email="reader@example.com", user_id="user-1", tenant=tenant)
+        cls.sender = User.objects.create_user(email="sender@example.com", user_id="user-2", tenant=tenant)
+        cls.room = Room.objects.create(name="room")
+        cls.room.users.add(cls.reader, cls.sender)
+
+    def setUp(self):
+        self.counter = UnreadCounter()
+        patcher = mock.patch("apps.chat.unread.get_redis_client", return_value=fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, user, persist=True, record=True):
+        """A message of the user. Not persisted like a dropped write-behind one, not recorded like a failed call."""
+
+        if persist:
+            Message.objects.create(room=self.room, user=user, content="message")
+        if record:
+            self.counter.record_message(self.room.id, user.pk)
+
+    def mark_read(self, user):
+        """Mark the room read upto the latest message, returns the unread messages."""
+
+        latest = Message.objects.filter(room=self.room).latest_first().first()
+        return self.counter.mark_read(self.room.id, user.pk, latest.created_at, latest.id)
+
+    def unread(self, user):
+        """Unread count of the room on redis."""
+
+        return self.counter.get_counts(user.pk, [self.room.id])[self.room.id]
+
+    def test_reconcile_keeps_read_member_at_zero(self):
+        for persist, record in ((True, False), (False, True)):
+            with self.subTest(persist=persist, record=record):
+                self.send(self.sender)
+                self.unread(self.reader)
+                self.send(self.sender, persist=persist, record=record)
+                self.send(self.sender)
+                self.assertEqual(self.mark_read(self.reader), 0)
+                self.assertEqual(self.unread(self.reader), 0)
+
+                self.assertEqual(self.counter.reconcile(), 1)
+                self.assertEqual(self.unread(self.reader), 0)
+                self.send(self.sender)
+                self.assertEqual(self.unread(self.reader), 1)
+                self.mark_read(self.reader)
+
+    def test_message_recorded_while_marking_read_stays_unread(self):
+        self.send(self.sender)
+        self.unread(self.reader)
+        count_unread_in_db = self.counter.count_unread_in_db
+
+        def count_then_send(*args):
+            """New messages of the sender & the reader land right after the count."""
+
+            unread = count_unread_in_db(*args)
+            self.send(self.sender)
+            self.send(self.reader)
+            return unread
+
+        with mock.patch.object(self.counter, "count_unread_in_db", side_effect=count_then_send):
+            self.assertEqual(self.mark_read(self.reader), 0)
+        self.assertEqual(self.unread(self.reader), 1)
+
+    def test_buffered_message_is_marked_read_until_reconciled(self):
+        self.send(self.sender)
+        self.send(self.sender, persist=False)
+        self.assertEqual(self.mark_read(self.reader), 0)
+        self.assertEqual(self.unread(self.reader), 0)
+
+        Message.objects.create(room=self.room, user=self.sender, content="persisted by the write-behind")
+        self.counter.reconcile()
+        self.assertEqual(self.unread(self.reader), 1)
@@ -0,0 +1,94 @@
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from apps.chat.caches import user_cache
+from apps.chat.models import User
+from apps.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# namespaces the signature, a ticket can not be used as any other signed value of the app
+WS_TICKET_SALT = "apps.chat.ws-ticket"
+
+
+def create_ws_ticket(user):
+    """
+    Returns a short lived & single use websocket connection ticket for the authenticated user. The
+    ticket is a HMAC signed(`SECRET_KEY`) payload of the user, tenant, expiry & a nonce. Not encrypted,
+    only signed.
+    """
+
+    expires_at = int(time.time()) + settings.WS_TICKET_CONFIG["ttl"]
+    payload = {
+        "user": user.pk,
+        "user_id": user.user_id,
+        "tenant_id": user.tenant.tenant_id,
+        "exp": expires_at,
+        "nonce": uuid.uuid4().hex,
+    }
+    metrics.increment("ws_ticket_issued")
+    return {"ticket": signing.dumps(payload, salt=WS_TICKET_SALT), "expires_at": expires_at}
+
+
+def verify_ws_ticket(ticket):
+    """Returns the payload if the ticket is valid & not expired, else None. No I/O."""
+
+    try:
+        payload = signing.loads(ticket, salt=WS_TICKET_SALT, max_age=settings.WS_TICKET_CONFIG["ttl"])
+    except signing.BadSignature:  # `SignatureExpired` is a sub class
+        metrics.increment("ws_ticket_verified", result="invalid")
+        return None
+
+    if payload["exp"] <= time.time():
+        metrics.increment("ws_ticket_verified", result="expired")
+        return None
+
+    metrics.increment("ws_ticket_verified", result="valid")
+    return payload
+
+
+async def aredeem_ws_ticket(payload):
+    """
+    Marks the ticket as used with a `SET NX` of its nonce, kept for the ticket's `ttl`. Returns False
+    if the ticket was already used. Fails closed, a ticket is not accepted if the cache is down.
+    """
+
+    if not payload.get("nonce"):
+        metrics.increment("ws_ticket_verified", result="invalid")
+        return False
+
+    try:
+        is_redeemed = await cache.aadd(f"ws_ticket:{payload['nonce']}", 1, timeout=settings.WS_TICKET_CONFIG["ttl"])
+    except Exception as error:  # noqa
+        metrics.increment("ws_ticket_verified", result="failed")
+        logger.warning(f"Unable to redeem the websocket ticket of user {payload['user']}: {error}")
+        return False
+
+    if not is_redeemed:
+        metrics.increment("ws_ticket_verified", result="replayed")
+    return is_redeemed
+
+
+async def aget_user_from_ws_ticket(ticket):
+    """
+    Returns the active user of a valid & unused ticket, else None. The user is served from the
+    `user_cache`.
+    """
+
+    if not (payload := verify_ws_ticket(ticket)) or not await aredeem_ws_ticket(payload):
+        return None
+
+    user = await user_cache.aget_instance(payload["user_id"])
+    if not user:
+        user = await User.objects.select_related("tenant").filter(pk=payload["user"]).afirst()
+        if user:
+            await user_cache.aset_instance(user)
+
+    if not user or user.pk != payload["user"] or user.tenant.tenant_id != payload["tenant_id"] or not user.is_active:
+        return None
+    return user
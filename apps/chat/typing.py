@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from apps.common.caches import get_redis_client
+from apps.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_typist(user) -> dict:
+    """Compact reference of the typing user."""
+
+    return {"id": user.id, "name": f"{user.first_name} {user.last_name or ''}".strip()}
+
+
+class TypingAggregator:
+    """
+    Throttles the `typing` commands of the connections on an event loop, before they reach the
+    channel layer. Nothing is persisted.
+
+        > a typing signal of an user in a room is accepted once per `typing_debounce` seconds
+        > every `typing_interval` seconds, a single event per room is sent with all the users
+          typing, only if the typists changed since the last event of the room
+        > an user stops typing on `{"is_typing": false}` or `typing_ttl` seconds after the last signal
+
+    The typists of a room are shared by the workers on redis(a sorted set scored by the expiry &
+    a hash of the serialized users), the worker's changes are written & the rooms' typists read
+    in a single pipeline per flush. So every event is the complete list of the room's typists,
+    irrespective of the worker the typists are connected to. A worker sends the events of a room
+    while it has typists in the room, a room with typists on `N` workers gets at most `N` events
+    per interval. Without redis(Eg: locmem), the events have only the worker's typists. The event
+    of a room whose group send failed is sent again on the next flush.
+
+    Metrics - chat_typing_received, chat_typing_throttled, chat_typing_events, chat_typing_failed
+    """
+
+    def __init__(self, channel_layer, cache_alias="default", key_prefix="typing"):
+        self.channel_layer = channel_layer
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self._rooms = {}
+        self._last_accepted = {}
+        self._changes = []
+        self._flush_task = None
+
+    @property
+    def config(self):
+        """Returns the `CHAT_CONFIG`."""
+
+        return settings.CHAT_CONFIG
+
+    def add(self, group_name, room_uuid, user, is_typing=True):
+        """Record the typing signal of the user. Returns False if the signal is throttled."""
+
+        metrics.increment("chat_typing_received")
+        now = time.monotonic()
+        key = (room_uuid, user.pk)
+        if is_typing and now - self._last_accepted.get(key, float("-inf")) < self.config["typing_debounce"]:
+            metrics.increment("chat_typing_throttled")
+            return False
+
+        room = self._rooms.setdefault(room_uuid, {"group_name": group_name, "typists": {}, "sent": frozenset()})
+        if is_typing:
+            self._last_accepted[key] = now
+            room["typists"][user.pk] = (now + self.config["typing_ttl"], serialize_typist(user))
+            self._changes.append((room_uuid, user.pk, room["typists"][user.pk][1]))
+        else:
+            self._last_accepted.pop(key, None)
+            room["typists"].pop(user.pk, None)
+            self._changes.append((room_uuid, user.pk, None))
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self.run())
+        return True
+
+    def get_room_key(self, room_uuid):
+        """Key of the room's typists, scored by the expiry."""
+
+        return caches[self.cache_alias].make_key(f"{self.key_prefix}:{room_uuid}")
+
+    def get_users_key(self, room_uuid):
+        """Key of the serialized typists of the room."""
+
+        return caches[self.cache_alias].make_key(f"{self.key_prefix}:{room_uuid}:users")
+
+    def sync_typists(self, changes, room_uuids):
+        """
+        Write the changes & returns the room => typists of the rooms from redis, in a single pipeline.
+        None without redis.
+        """
+
+        client = get_redis_client(self.cache_alias)
+        if client is None:
+            return None
+
+        now, ttl = time.time(), self.config["typing_ttl"]
+        pipeline = client.pipeline(transaction=False)
+        for room_uuid, user_pk, typist in changes:
+            room_key, users_key = self.get_room_key(room_uuid), self.get_users_key(room_uuid)
+            if typist:
+                pipeline.zadd(room_key, {user_pk: now + ttl})
+                pipeline.hset(users_key, user_pk, json.dumps(typist))
+            else:
+                pipeline.zrem(room_key, user_pk)
+                pipeline.hdel(users_key, user_pk)
+            pipeline.expire(room_key, math.ceil(ttl))
+            pipeline.expire(users_key, math.ceil(ttl))
+        for room_uuid in room_uuids:
+            pipeline.zrangebyscore(self.get_room_key(room_uuid), f"({now}", "+inf")
+            pipeline.hgetall(self.get_users_key(room_uuid))
+        # 4 commands per change, followed by the 2 reads per room
+        write_count = 4 * len(changes)
+        results = pipeline.execute()[write_count:]
+
+        return {
+            room_uuid: {int(user_pk): json.loads(users[user_pk]) for user_pk in user_pks if user_pk in users}
+            for room_uuid, user_pks, users in zip(room_uuids, results[::2], results[1::2])
+        }
+
+    async def flush(self):
+        """Send an event to each room whose typists changed since its last event."""
+
+        changes, self._changes = self._changes, []
+        room_uuids = list(self._rooms)
+        try:
+            shared_typists = await sync_to_async(self.sync_typists, thread_sensitive=False)(changes, room_uuids)
+        except Exception as error:  # noqa
+            metrics.increment("chat_typing_failed")
+            logger.warning(f"TypingAggregator: unable to sync the typists of {len(room_uuids)} rooms: {error}")
+            shared_typists = None
+
+        now = time.monotonic()
+        self._last_accepted = {
+            key: accepted_at
+            for key, accepted_at in self._last_accepted.items()
+            if now - accepted_at < self.config["typing_debounce"]
+        }
+
+        group_sends = {}
+        for room_uuid in room_uuids:
+            room = self._rooms[room_uuid]
+            room["typists"] = {user_pk: typist for user_pk, typist in room["typists"].items() if typist[0] > now}
+            if shared_typists is None:
+                typists = {user_pk: user for user_pk, (_, user) in room["typists"].items()}
+            else:
+                typists = shared_typists[room_uuid]
+
+            if frozenset(typists) != room["sent"]:
+                room["sent"] = frozenset(typists)
+                event = {"type": "chat.typing", "room": room_uuid, "users": list(typists.values())}
+                group_sends[room_uuid] = self.channel_layer.group_send(room["group_name"], event)
+
+        metrics.increment("chat_typing_events", len(group_sends))
+        results = await asyncio.gather(*group_sends.values(), return_exceptions=True)
+        for room_uuid, result in zip(group_sends, results):
+            if isinstance(result, Exception):
+                # sent again on the next flush
+                self._rooms[room_uuid]["sent"] = None
+                metrics.increment("chat_typing_failed")
+                logger.warning(f"TypingAggregator: unable to send the typists of room {room_uuid}: {result}")
+
+        # the changes made while syncing & sending are sent on the next flush
+        pending_room_uuids = {room_uuid for room_uuid, _, _ in self._changes}
+        for room_uuid in room_uuids:
+            room = self._rooms[room_uuid]
+            if not room["typists"] and room["sent"] is not None and room_uuid not in pending_room_uuids:
+                del self._rooms[room_uuid]
+
+    async def run(self):
+        """Flush every `typing_interval`, stops once the worker has no typists."""
+
+        try:
+            while self._rooms:
+                await asyncio.sleep(self.config["typing_interval"])
+                try:
+                    await self.flush()
+                except Exception as error:  # noqa
+                    metrics.increment("chat_typing_failed")
+                    logger.warning(f"TypingAggregator: unable to flush the typists: {error}")
+        finally:
+            self._flush_task = None
+
+
+_aggregators = weakref.WeakKeyDictionary()
+_aggregators_lock = threading.Lock()
+
+
+def get_typing_aggregator(channel_layer) -> TypingAggregator:
+    """Returns the aggregator of the running event loop."""
+
+    loop = asyncio.get_running_loop()
+    with _aggregators_lock:
+        if loop not in _aggregators:
+            _aggregators[loop] = TypingAggregator(channel_layer)
+        return _aggregators[loop]
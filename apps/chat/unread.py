@@ -0,0 +1,327 @@
+import logging
+import time
+from collections import defaultdict
+from itertools import chain
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from apps.chat.models import CourseExpert, Message, Room, RoomReadPointer
+from apps.common.caches import get_redis_client
+from apps.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# counts the message only on the already loaded counters, a missing counter is loaded from the db on read
+RECORD_MESSAGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('INCR', KEYS[1])
+end
+if redis.call('HEXISTS', KEYS[2], ARGV[1]) == 1 then
+    redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+end
+redis.call('ZADD', KEYS[3], ARGV[2], ARGV[1])
+return 1
+"""
+
+# the read sequence from the snapshot taken before counting the unread messages on the db, along with the own
+# messages counted on it since the snapshot(bounded by the messages of the room since the snapshot)
+MARK_READ_SCRIPT = """
+local read = tonumber(ARGV[2]) - tonumber(ARGV[3])
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+local sequence = redis.call('GET', KEYS[2])
+if current and sequence and ARGV[4] ~= '' then
+    local own = math.min(tonumber(current) - tonumber(ARGV[4]), tonumber(sequence) - tonumber(ARGV[2]))
+    read = read + math.max(own, 0)
+end
+redis.call('HSET', KEYS[1], ARGV[1], read)
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return read
+"""
+
+
+class UnreadCounter:
+    """
+    Unread counts of the room members, without counting the messages on every read.
+
+        > room sequence : messages in the room, incremented on every new message
+        > read sequence : per user hash of room => room sequence as of the user's read pointer,
+                          the own messages are added to it, so they are never unread
+
+    unread = room sequence - read sequence. The counts of all the rooms of an user are a single
+    round trip(`MGET` + `HMGET`), a new message is a single script call & `mark_read` a snapshot
+    of the sequences + a script call.
+
+    The counters are loaded from the db(`RoomReadPointer`) when missing & expire after the `ttl`.
+    The rooms with new messages are marked dirty, `reconcile` resets their sequence from the db
+    once they are idle for `reconcile_settle` seconds, correcting the drift(Eg: a lost increment,
+    a write-behind message which was never persisted), the read sequences of their members are
+    dropped along with & reloaded from the read pointers. The read sequence of an user is also reset
+    on the `mark_read` & on the reload after the `ttl`. Without redis, the counts are from the db.
+
+    The `mark_read` takes the sequences before counting the unread messages on the db, so a message
+    recorded meanwhile is left unread & never marked read. A write-behind message which is not yet
+    persisted is not on the db though, it is marked read until its room is reconciled.
+
+    Metrics - unread_counter_loaded{counter}, unread_counter_reconciled, unread_counter_failed{action}
+    """
+
+    def __init__(self, cache_alias="default"):
+        self.cache_alias = cache_alias
+        self._record_message_scripts = {}
+        self._mark_read_scripts = {}
+
+    @property
+    def config(self):
+        """Returns the `UNREAD_CONFIG`."""
+
+        return settings.UNREAD_CONFIG
+
+    def make_key(self, key):
+        """Key on redis, along with the django cache prefix."""
+
+        return caches[self.cache_alias].make_key(f"unread:{key}")
+
+    def get_room_key(self, room_id):
+        """Key of the room sequence."""
+
+        return self.make_key(f"room:{room_id}")
+
+    def get_read_key(self, user_pk):
+        """Key of the user's read sequences."""
+
+        return self.make_key(f"read:{user_pk}")
+
+    def get_dirty_key(self):
+        """Key of the rooms to be reconciled, scored by their last message."""
+
+        return self.make_key("dirty")
+
+    def get_record_message_script(self, client):
+        """Returns the registered `RECORD_MESSAGE_SCRIPT` of the client."""
+
+        if id(client) not in self._record_message_scripts:
+            self._record_message_scripts[id(client)] = client.register_script(RECORD_MESSAGE_SCRIPT)
+        return self._record_message_scripts[id(client)]
+
+    def get_mark_read_script(self, client):
+        """Returns the registered `MARK_READ_SCRIPT` of the client."""
+
+        if id(client) not in self._mark_read_scripts:
+            self._mark_read_scripts[id(client)] = client.register_script(MARK_READ_SCRIPT)
+        return self._mark_read_scripts[id(client)]
+
+    @staticmethod
+    def get_members_from_db(room_ids):
+        """Returns the room => pks of the members, along with the experts of the course rooms."""
+
+        members = defaultdict(set)
+        for room_id, user_pk in chain(
+            Room.users.through.objects.filter(room_id__in=room_ids).values_list("room_id", "user_id"),
+            CourseExpert.objects.filter(course__room_id__in=room_ids).values_list("course__room_id", "user_id"),
+        ):
+            members[room_id].add(user_pk)
+        return members
+
+    @staticmethod
+    def count_unread_in_db(room_id, user_pk, pointer=None):
+        """Messages of the others in the room after the read pointer."""
+
+        queryset = Message.objects.filter(room_id=room_id).exclude(user_id=user_pk)
+        if pointer:
+            queryset = queryset.after(pointer.last_read_at, pointer.last_read_message_id)
+        return queryset.count()
+
+    def get_counts_from_db(self, user_pk, room_ids):
+        """Returns the unread counts of the rooms, counted on the db."""
+
+        pointers = {
+            pointer.room_id: pointer
+            for pointer in RoomReadPointer.objects.filter(user_id=user_pk, room_id__in=room_ids)
+        }
+        return {room_id: self.count_unread_in_db(room_id, user_pk, pointers.get(room_id)) for room_id in room_ids}
+
+    def load_room_sequences(self, client, room_ids):
+        """Load the missing room sequences from the db. Returns the room => sequence."""
+
+        counts = dict.fromkeys(room_ids, 0)
+        counts.update(
+            Message.objects.filter(room_id__in=room_ids).values_list("room_id").annotate(count=Count("id")).order_by()
+        )
+        pipeline = client.pipeline(transaction=False)
+        for room_id, count in counts.items():
+            pipeline.set(self.get_room_key(room_id), count, ex=self.config["ttl"], nx=True)
+        pipeline.execute()
+        metrics.increment("unread_counter_loaded", len(room_ids), counter="room")
+        return counts
+
+    def load_read_sequences(self, client, user_pk, room_sequences):
+        """Load the missing read sequences of the user from the db. Returns the room => sequence."""
+
+        unread_counts = self.get_counts_from_db(user_pk, list(room_sequences))
+        read_sequences = {room_id: room_sequences[room_id] - unread for room_id, unread in unread_counts.items()}
+        pipeline = client.pipeline(transaction=False)
+        pipeline.hset(self.get_read_key(user_pk), mapping=read_sequences)
+        pipeline.expire(self.get_read_key(user_pk), self.config["ttl"])
+        pipeline.execute()
+        metrics.increment("unread_counter_loaded", len(room_sequences), counter="read")
+        return read_sequences
+
+    def get_counts(self, user_pk, room_ids):
+        """Returns the unread counts of the user's rooms. A single redis call once the counters are loaded."""
+
+        room_ids = list(room_ids)
+        client = get_redis_client(self.cache_alias)
+        if client is None or not room_ids:
+            return self.get_counts_from_db(user_pk, room_ids)
+
+        try:
+            pipeline = client.pipeline(transaction=False)
+            pipeline.mget([self.get_room_key(room_id) for room_id in room_ids])
+            pipeline.hmget(self.get_read_key(user_pk), room_ids)
+            room_values, read_values = pipeline.execute()
+
+            room_sequences = {
+                room_id: int(value) for room_id, value in zip(room_ids, room_values) if value is not None
+            }
+            if missing := [room_id for room_id in room_ids if room_id not in room_sequences]:
+                room_sequences.update(self.load_room_sequences(client, missing))
+
+            read_sequences = {
+                room_id: int(value) for room_id, value in zip(room_ids, read_values) if value is not None
+            }
+            if missing := {room_id: room_sequences[room_id] for room_id in room_ids if room_id not in read_sequences}:
+                read_sequences.update(self.load_read_sequences(client, user_pk, missing))
+        except Exception as error:  # noqa
+            metrics.increment("unread_counter_failed", action="get_counts")
+            logger.warning(f"UnreadCounter: unable to get the counts of user {user_pk}: {error}")
+            return self.get_counts_from_db(user_pk, room_ids)
+
+        return {room_id: max(0, room_sequences[room_id] - read_sequences[room_id]) for room_id in room_ids}
+
+    def record_message(self, room_id, sender_pk):
+        """Count a new message of the room, the sender's own message is marked as read for the sender."""
+
+        client = get_redis_client(self.cache_alias)
+        if client is None:
+            return
+
+        try:
+            self.get_record_message_script(client)(
+                keys=[self.get_room_key(room_id), self.get_read_key(sender_pk), self.get_dirty_key()],
+                args=[room_id, time.time()],
+            )
+        except Exception as error:  # noqa
+            metrics.increment("unread_counter_failed", action="record_message")
+            logger.warning(f"UnreadCounter: unable to record the message of room {room_id}: {error}")
+
+    @staticmethod
+    def move_read_pointer(room_id, user_pk, last_read_at, last_read_message_id=None):
+        """
+        Move the read pointer forward to the message, creating it when missing. The pointer is moved
+        with a conditional `UPDATE`, so it never goes back on the concurrent calls of the user(Eg: two
+        tabs), and a pointer created concurrently fails the `INSERT` on the unique constraint & is
+        updated instead. Returns the pointer.
+        """
+
+        forward = Q(last_read_at__lt=last_read_at)
+        if last_read_message_id is not None:
+            forward |= Q(last_read_at=last_read_at) & (
+                Q(last_read_message__isnull=True) | Q(last_read_message_id__lt=last_read_message_id)
+            )
+        pointers = RoomReadPointer.objects.filter(room_id=room_id, user_id=user_pk)
+
+        for _ in range(2):
+            if pointers.filter(forward).update(
+                last_read_at=last_read_at, last_read_message_id=last_read_message_id, modified_at=timezone.now()
+            ):
+                break
+            if pointer := pointers.first():
+                return pointer
+            try:
+                with transaction.atomic():
+                    return RoomReadPointer.objects.create(
+                        room_id=room_id,
+                        user_id=user_pk,
+                        last_read_at=last_read_at,
+                        last_read_message_id=last_read_message_id,
+                    )
+            except IntegrityError:
+                continue
+        return pointers.get()
+
+    def mark_read(self, room_id, user_pk, last_read_at, last_read_message_id=None):
+        """
+        Move the user's read pointer of the room forward to the message. Returns the messages still
+        unread, ie. the ones after the pointer.
+        """
+
+        pointer = self.move_read_pointer(room_id, user_pk, last_read_at, last_read_message_id)
+        client = get_redis_client(self.cache_alias)
+        unread = None
+        if client is not None:
+            try:
+                pipeline = client.pipeline(transaction=False)
+                pipeline.get(self.get_room_key(room_id))
+                pipeline.hget(self.get_read_key(user_pk), room_id)
+                room_sequence, read_sequence = pipeline.execute()
+                if room_sequence is None:
+                    room_sequence = self.load_room_sequences(client, [room_id])[room_id]
+
+                unread = self.count_unread_in_db(room_id, user_pk, pointer)
+                self.get_mark_read_script(client)(
+                    keys=[self.get_read_key(user_pk), self.get_room_key(room_id)],
+                    args=[room_id, room_sequence, unread, read_sequence or "", self.config["ttl"]],
+                )
+            except Exception as error:  # noqa
+                metrics.increment("unread_counter_failed", action="mark_read")
+                logger.warning(f"UnreadCounter: unable to mark room {room_id} read for user {user_pk}: {error}")
+
+        if unread is None:
+            unread = self.count_unread_in_db(room_id, user_pk, pointer)
+        return unread
+
+    def reconcile(self):
+        """
+        Reset the sequences of the dirty rooms, idle for `reconcile_settle` seconds, from the db. The read
+        sequences of the members are dropped in the same transaction, they were taken against the old
+        sequence & are reloaded from the read pointers on the next read.
+        """
+
+        client = get_redis_client(self.cache_alias)
+        if client is None:
+            return 0
+
+        settled_at = time.time() - self.config["reconcile_settle"]
+        pipeline = client.pipeline()
+        pipeline.zrangebyscore(self.get_dirty_key(), "-inf", settled_at)
+        pipeline.zremrangebyscore(self.get_dirty_key(), "-inf", settled_at)
+        room_ids = [int(room_id) for room_id in pipeline.execute()[0]]
+        if not room_ids:
+            return 0
+
+        counts = dict.fromkeys(room_ids, 0)
+        counts.update(
+            Message.objects.filter(room_id__in=room_ids).values_list("room_id").annotate(count=Count("id")).order_by()
+        )
+        members = self.get_members_from_db(room_ids)
+        pipeline = client.pipeline()
+        for room_id, count in counts.items():
+            pipeline.set(self.get_room_key(room_id), count, ex=self.config["ttl"])
+            for user_pk in members[room_id]:
+                pipeline.hdel(self.get_read_key(user_pk), room_id)
+        pipeline.execute()
+        metrics.increment("unread_counter_reconciled", len(room_ids))
+        return len(room_ids)
+
+    async def arecord_message(self, room_id, sender_pk):
+        """Async version of the `record_message`."""
+
+        return await sync_to_async(self.record_message, thread_sensitive=False)(room_id, sender_pk)
+
+
+unread_counter = UnreadCounter()
@@ -6,8 +6,11 @@ from .views import (
     CourseEnrollApiView,
     CourseExpertApiView,
     CourseListAPIView,
+    PresenceAPIView,
+    UnreadCountsAPIView,
     UserListAPIView,
     UserOnboardAPIViewSet,
+    WSTicketAPIView,
 )
 
 V1_API_URL_PREFIX = "api/v1/chat"
@@ -23,4 +26,7 @@ urlpatterns = [
     path(f"{V1_API_URL_PREFIX}/course/cud/", CourseCUDApiView.as_view(), name="course_cud"),
     path(f"{V1_API_URL_PREFIX}/course/enroll/", CourseEnrollApiView.as_view(), name="course_enroll"),
     path(f"{V1_API_URL_PREFIX}/course/expert/onboard/", CourseExpertApiView.as_view(), name="course_expert"),
+    path(f"{V1_API_URL_PREFIX}/ws/ticket/", WSTicketAPIView.as_view(), name="ws_ticket"),
+    path(f"{V1_API_URL_PREFIX}/presence/", PresenceAPIView.as_view(), name="presence"),
+    path(f"{V1_API_URL_PREFIX}/unread/", UnreadCountsAPIView.as_view(), name="unread"),
 ] + router.urls
@@ -1,8 +1,14 @@
+import uuid
+
+from django.conf import settings
+from django.db.models import Q
 from rest_framework.permissions import IsAuthenticated
 
 from ..common.views.api import AppAPIView, AppModelCreatePIViewSet, AppModelListAPIViewSet
 from ..common.views.api.base import UserTenantMixin
-from .models import Course, User
+from .caches import room_membership_cache
+from .models import Course, CourseExpert, Room, User
+from .presence import get_room_scope, get_tenant_scope, presence
 from .serializers import (
     CourseEnrollSerializer,
     CourseExpertSerializer,
@@ -11,6 +17,8 @@ from .serializers import (
     UserListSerializer,
     UserOnboardSerializer,
 )
+from .tickets import create_ws_ticket
+from .unread import unread_counter
 
 
 class UserListAPIView(UserTenantMixin, AppModelListAPIViewSet):
@@ -98,3 +106,75 @@ class CourseExpertApiView(AppAPIView):
         serializer = self.get_valid_serializer()
         serializer.save()
         return self.send_response(data="Action performed successfully.")
+
+
+class WSTicketAPIView(AppAPIView):
+    """
+    Exchanges the authenticated request for a short lived & single use websocket connection ticket.
+    The ticket is passed as `?ticket=` while connecting & is verified without calling the IDP.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """Issue the ticket."""
+
+        return self.send_response(data=create_ws_ticket(self.get_user()))
+
+
+class PresenceAPIView(AppAPIView):
+    """
+    Online users count of the user's tenant & of the rooms passed as `?rooms=<uuid>,<uuid>`. Only
+    the rooms which the user is a member of are counted, the counts are a single redis call.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get_rooms(self):
+        """Returns the requested rooms, which the user is a member of."""
+
+        room_uuids = set()
+        for room_uuid in self.request.query_params.get("rooms", "").split(","):
+            try:
+                room_uuids.add(uuid.UUID(room_uuid.strip()))
+            except ValueError:
+                continue
+
+        user = self.get_user()
+        rooms = Room.objects.filter(uuid__in=list(room_uuids)[: settings.CHAT_CONFIG["max_room_subscriptions"]])
+        return [room for room in rooms if room_membership_cache.is_member(room.id, user.pk)]
+
+    def get(self, request, *args, **kwargs):
+        """Online counts."""
+
+        tenant_scope = get_tenant_scope(self.get_user().tenant_id)
+        rooms = {get_room_scope(room.id): room for room in self.get_rooms()}
+        counts = presence.count([tenant_scope, *rooms])
+        data = {
+            "tenant": counts[tenant_scope],
+            "rooms": {str(room.uuid): counts[scope] for scope, room in rooms.items()},
+        }
+        return self.send_response(data=data)
+
+
+class UnreadCountsAPIView(AppAPIView):
+    """
+    Unread messages count of all the rooms of the user, for the room list badges. The counts are
+    a single redis call irrespective of the number of rooms, refer `UnreadCounter`.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get_rooms(self):
+        """Returns the id & uuid of the rooms, which the user is a member of."""
+
+        user = self.get_user()
+        expert_rooms = CourseExpert.objects.filter(user_id=user.pk).values("course__room_id")
+        return Room.objects.filter(Q(users=user) | Q(id__in=expert_rooms)).distinct().values_list("id", "uuid")
+
+    def get(self, request, *args, **kwargs):
+        """Unread counts."""
+
+        rooms = dict(self.get_rooms())
+        counts = unread_counter.get_counts(self.get_user().pk, rooms)
+        return self.send_response(data={"rooms": {str(rooms[room_id]): count for room_id, count in counts.items()}})
@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+
+from apps.common.metrics import get_metric_key, metrics
+
+logger = logging.getLogger(__name__)
+
+# sentinel used to differentiate a cached `None` from a cache miss
+MISSING = object()
+
+
+def get_redis_client(cache_alias="default"):
+    """Returns the raw redis client of the django cache. None if the cache is not redis(Eg: locmem)."""
+
+    try:
+        from django_redis import get_redis_connection
+
+        return get_redis_connection(cache_alias)
+    except NotImplementedError:
+        return None
+
+
+class LocalTTLCache:
+    """
+    Thread safe, in-process LRU cache with per entry expiry. Used as the first tier
+    in front of the shared (redis) cache. Lookups do no I/O at all.
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Returns the value if present & not expired."""
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Set the value, the least recently used entries are evicted on overflow."""
+
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove the key if present."""
+
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove all the entries."""
+
+        with self._lock:
+            self._data.clear()
+
+
+class TwoTierCache:
+    """
+    A per-worker `LocalTTLCache` in front of the django cache(redis). Reads are served from the
+    local tier when possible, misses fall back to the shared tier and populate the local one.
+
+    The shared tier is treated as an optimization. If redis is unavailable, the error is logged
+    and the lookup is considered as a miss.
+
+    Metrics -
+        cache_hit{cache, tier}, cache_miss{cache}, cache_hit_ratio{cache}, cache_local_size{cache}
+    """
+
+    def __init__(self, name, timeout=300, local_timeout=60, local_max_size=1024, cache_alias="default"):
+        self.name = name
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+        self.local = LocalTTLCache(max_size=local_max_size, ttl=local_timeout)
+        metrics.register_collector(self.collect_metrics)
+
+    @property
+    def shared(self):
+        """Returns the django cache used as the shared tier."""
+
+        return caches[self.cache_alias]
+
+    def make_key(self, key):
+        """Key used on the shared tier."""
+
+        return f"{self.name}:{key}"
+
+    def record(self, name, **labels):
+        """DRY function to increment the metrics of this cache."""
+
+        metrics.increment(name, cache=self.name, **labels)
+
+    def get(self, key, default=None, track=True):
+        """
+        Returns the cached value from the local tier or from the shared tier. The `track` is
+        disabled for the book keeping lookups, which should not affect the hit ratio.
+        """
+
+        value = self.local.get(key, MISSING)
+        if value is not MISSING:
+            if track:
+                self.record("cache_hit", tier="local")
+            return value
+
+        try:
+            value = self.shared.get(self.make_key(key), MISSING)
+        except Exception as error:  # noqa
+            logger.warning(f"TwoTierCache({self.name}): shared get failed: {error}")
+            value = MISSING
+
+        if value is not MISSING:
+            if track:
+                self.record("cache_hit", tier="shared")
+            self.local.set(key, value)
+            return value
+
+        if track:
+            self.record("cache_miss")
+        return default
+
+    def set(self, key, value, timeout=None):
+        """Set the value on both the tiers. Non positive timeouts are ignored."""
+
+        timeout = self.timeout if timeout is None else timeout
+        if timeout <= 0:
+            return
+
+        self.local.set(key, value, ttl=timeout)
+        try:
+            self.shared.set(self.make_key(key), value, timeout)
+        except Exception as error:  # noqa
+            logger.warning(f"TwoTierCache({self.name}): shared set failed: {error}")
+
+    def delete(self, key):
+        """Remove the key from both the tiers."""
+
+        self.local.delete(key)
+        try:
+            self.shared.delete(self.make_key(key))
+        except Exception as error:  # noqa
+            logger.warning(f"TwoTierCache({self.name}): shared delete failed: {error}")
+
+    async def aget(self, key, default=None, track=True):
+        """
+        Async version of the `get`. The local hits don't leave the event loop, the shared tier is
+        called from a worker thread, so that it does not block the thread used by the ORM.
+        """
+
+        value = self.local.get(key, MISSING)
+        if value is not MISSING:
+            if track:
+                self.record("cache_hit", tier="local")
+            return value
+
+        return await sync_to_async(self.get, thread_sensitive=False)(key, default=default, track=track)
+
+    async def aset(self, key, value, timeout=None):
+        """Async version of the `set`."""
+
+        return await sync_to_async(self.set, thread_sensitive=False)(key, value, timeout=timeout)
+
+    async def adelete(self, key):
+        """Async version of the `delete`."""
+
+        return await sync_to_async(self.delete, thread_sensitive=False)(key)
+
+    def hit_ratio(self):
+        """Returns the hit ratio of this worker, both tiers are considered as hits."""
+
+        hits = metrics.get("cache_hit", cache=self.name, tier="local") + metrics.get(
+            "cache_hit", cache=self.name, tier="shared"
+        )
+        total = hits + metrics.get("cache_miss", cache=self.name)
+        return round(hits / total, 4) if total else 0.0
+
+    def collect_metrics(self):
+        """Collector for the `MetricsRegistry`."""
+
+        return {
+            get_metric_key("cache_hit_ratio", cache=self.name): self.hit_ratio(),
+            get_metric_key("cache_local_size", cache=self.name): len(self.local),
+        }
@@ -0,0 +1,148 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from apps.common.metrics import metrics
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for the outbound calls to a single dependency(host).
+
+    States -
+        closed      : calls are allowed, consecutive failures are counted
+        open        : calls are rejected without any I/O till the `recovery_timeout`
+        half_open   : `half_open_max_calls` probe calls are allowed, the first result
+                      decides if the circuit is closed again or re-opened
+
+    The allowed calls are made within the `guard`, so that a call never leaves the circuit without
+    a result(Eg: an unexpected error, a cancelled task holding the only probe slot).
+
+    Metrics -
+        circuit_breaker_state{breaker}: 0 - closed, 1 - half open, 2 - open
+        circuit_breaker_transition{breaker, state}, circuit_breaker_rejected{breaker}
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    STATE_GAUGE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._generation = 0
+        metrics.set_gauge("circuit_breaker_state", 0, breaker=self.name)
+
+    @property
+    def state(self):
+        """Returns the current state of the circuit."""
+
+        return self._state
+
+    def transition(self, state):
+        """Move the circuit to the given state. Called with the lock acquired."""
+
+        self._state = state
+        self._half_open_calls = 0
+        self._generation += 1
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+        if state == self.CLOSED:
+            self._failures = 0
+
+        metrics.increment("circuit_breaker_transition", breaker=self.name, state=state)
+        metrics.set_gauge("circuit_breaker_state", self.STATE_GAUGE_VALUES[state], breaker=self.name)
+
+    def allow_request(self):
+        """Returns if the call can be made. Every allowed call must record its success/failure."""
+
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self.transition(self.HALF_OPEN)
+
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+
+        metrics.increment("circuit_breaker_rejected", breaker=self.name)
+        return False
+
+    def record_success(self):
+        """The dependency responded properly."""
+
+        with self._lock:
+            if self._state != self.CLOSED:
+                self.transition(self.CLOSED)
+            self._failures = 0
+
+    def release(self, generation):
+        """Free the half open probe slot of a call that ended without a result, in the same state."""
+
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._generation == generation and self._half_open_calls:
+                self._half_open_calls -= 1
+
+    @contextmanager
+    def guard(self):
+        """
+        Wraps an allowed call. The errors escaping the block are recorded as failures, the slot of a
+        cancelled / interrupted call is released so that the next call can probe.
+        """
+
+        generation = self._generation
+        try:
+            yield
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release(generation)
+            raise
+
+    def record_failure(self):
+        """The dependency failed(timeout, connection error, 5xx)."""
+
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self.transition(self.OPEN)
+                return
+
+            self._failures += 1
+            if self._state == self.CLOSED and self._failures >= self.failure_threshold:
+                self.transition(self.OPEN)
+
+
+# the host can come from the client(`Issuer-Url`), the registry is bounded
+MAX_CIRCUIT_BREAKERS = 256
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name) -> CircuitBreaker:
+    """Returns the process wide breaker for the given name. Configured using `IDP_HTTP_CONFIG`."""
+
+    with _breakers_lock:
+        if name not in _breakers:
+            if len(_breakers) >= MAX_CIRCUIT_BREAKERS:
+                _breakers.pop(next(iter(_breakers)))
+            _breakers[name] = CircuitBreaker(
+                name=name,
+                failure_threshold=settings.IDP_HTTP_CONFIG["breaker_failure_threshold"],
+                recovery_timeout=settings.IDP_HTTP_CONFIG["breaker_recovery_timeout"],
+                half_open_max_calls=settings.IDP_HTTP_CONFIG["breaker_half_open_max_calls"],
+            )
+        return _breakers[name]
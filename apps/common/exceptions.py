@@ -13,3 +13,14 @@ class ObjectExpired(APIException):
     status_code = status.HTTP_410_GONE
     default_detail = _("The requested URL has expired.")
     default_code = "url_expired"
+
+
+class IDPServiceUnavailable(APIException):
+    """
+    The IDP is not reachable(timeout, 5xx, 429, open circuit). Unlike the `AuthenticationFailed`,
+    this does not say anything about the token itself.
+    """
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _("Identity service is temporarily unavailable.")
+    default_code = "idp_unavailable"
@@ -10,7 +10,9 @@ import typing
 from dateutil import tz
 from django.conf import settings
 from django.db import connection
-from requests import request
+
+from apps.common.http_client import get_async_http_client, get_http_session, http_clients
+from apps.common.http_recorder import outbound_recorder
 
 logger = logging.getLogger(__name__)
 
@@ -66,21 +68,73 @@ def random_letters(n=10):
     return "".join(secrets.choice(allowed_characters) for _ in range(n))
 
 
-def make_http_request(url: str, method="GET", headers={}, data={}, params={}, auth=None, **kwargs):  # noqa
+def make_http_request(url: str, method="GET", headers={}, data={}, params={}, auth=None, retry=True, **kwargs):  # noqa
     """
     Function that makes a third party http request to any given url based on the passed params.
     This is similar to triggerSimpleAjax/Axios function. This is defined here just to make things DRY.
+
+    The connections are pooled & kept alive, refer `apps.common.http_client`. The calls are
+    recorded by the `outbound_recorder`. With `retry=False`, a failed call is not retried.
     """
 
-    response = request(
-        method=method,
-        url=url,
-        headers=headers,
-        data=stringify(data),
-        params=params,
-        auth=auth,
-        **kwargs,
+    kwargs.setdefault("timeout", http_clients.get_timeout())
+    content = stringify(data)
+    started_at = time.perf_counter()
+    try:
+        response = get_http_session(retry).request(
+            method=method,
+            url=url,
+            headers=headers,
+            data=content,
+            params=params,
+            auth=auth,
+            **kwargs,
+        )
+    except Exception:
+        outbound_recorder.record(method, url, "error", time.perf_counter() - started_at, len(content or ""))
+        raise
+
+    outbound_recorder.record(
+        method, url, response.status_code, time.perf_counter() - started_at, len(content or ""), len(response.content)
     )
+    return get_http_response_output(response, url=url, method=method, headers=headers, data=data, params=params)
+
+
+async def amake_http_request(
+    url: str, method="GET", headers={}, data={}, params={}, auth=None, verify=True, retry=True, **kwargs  # noqa
+):
+    """
+    Async version of the `make_http_request`. Used from the async code(consumers, websocket middleware),
+    so that the outbound calls don't occupy a thread while waiting for the response.
+    """
+
+    content = stringify(data)
+    started_at = time.perf_counter()
+    try:
+        response = await get_async_http_client(verify, retry).request(
+            method=method,
+            url=url,
+            headers=headers,
+            content=content,
+            params=params,
+            auth=auth,
+            **kwargs,
+        )
+    except Exception:
+        outbound_recorder.record(method, url, "error", time.perf_counter() - started_at, len(content or ""))
+        raise
+
+    outbound_recorder.record(
+        method, url, response.status_code, time.perf_counter() - started_at, len(content or ""), len(response.content)
+    )
+    return get_http_response_output(response, url=url, method=method, headers=headers, data=data, params=params)
+
+
+def get_http_response_output(response, url, method, headers, data, params):
+    """
+    Returns the app's schema for the given `requests` / `httpx` response. Common for the
+    `make_http_request` & `amake_http_request`.
+    """
 
     try:
         response_data = response.json()
@@ -101,7 +155,6 @@ def make_http_request(url: str, method="GET", headers={}, data={}, params={}, au
         "method": method,
         "response_data": _output,
     }
-    # log_outbound_message(stringify(log), url, "make_http_request")
 
     if settings.DEBUG:
         logger.debug(f"make_http_request: {log}")
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from apps.common.metrics import get_metric_key, metrics
+
+
+class HTTPClientManager:
+    """
+    Process wide HTTP clients for the outbound calls. Connections are kept alive & reused across
+    the calls, so a warm call to the IDP / KC costs a single round trip instead of TCP + TLS.
+
+        > sync  : `requests.Session` with a connection pool per host. The idempotent methods are
+                  retried with backoff on connection errors & 502/503/504.
+        > async : `httpx.AsyncClient` per event loop & `verify`, the httpx connections are bound to
+                  the loop that opened them. Only the connection failures are retried.
+
+    The callers with their own failure policy & time budget(Eg: the IDP calls behind the circuit
+    breaker) use the clients with `retry=False`, a failed call is never attempted again.
+
+    Configured using the `HTTP_CLIENT_CONFIG`. The session is recreated in a forked child, the
+    pooled sockets must not be shared across the processes.
+
+    Metrics -
+        http_pool_requests{host}, http_pool_connections{host}, http_pool_reuse_ratio{host}
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._sessions_pid = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        metrics.register_collector(self.collect_metrics)
+
+    @property
+    def config(self):
+        """Returns the `HTTP_CLIENT_CONFIG`."""
+
+        return settings.HTTP_CLIENT_CONFIG
+
+    def get_timeout(self):
+        """Default `(connect, read)` timeout, used when the caller does not pass one."""
+
+        return self.config["connect_timeout"], self.config["timeout"]
+
+    def create_session(self, retry=True):
+        """Returns a new session with the pooled adapter mounted, retrying only if `retry`."""
+
+        max_retries = Retry(
+            total=self.config["retries"],
+            backoff_factor=self.config["retry_backoff_factor"],
+            status_forcelist=[502, 503, 504],
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # idempotent methods only
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.config["max_hosts"],
+            pool_maxsize=self.config["max_connections_per_host"],
+            max_retries=max_retries if retry else 0,
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get_session(self, retry=True) -> requests.Session:
+        """Returns the process wide session."""
+
+        pid = os.getpid()
+        with self._lock:
+            if self._sessions_pid != pid:
+                self._sessions = {}
+                self._sessions_pid = pid
+            if retry not in self._sessions:
+                self._sessions[retry] = self.create_session(retry)
+            return self._sessions[retry]
+
+    def create_async_client(self, verify, retry=True):
+        """
+        Returns a new async client with the keep alive limits. The limits are set on the transport,
+        httpx ignores the client's `limits` when a transport is passed.
+        """
+
+        connect_timeout, read_timeout = self.get_timeout()
+        return httpx.AsyncClient(
+            verify=verify,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(
+                verify=verify,
+                retries=self.config["retries"] if retry else 0,
+                limits=httpx.Limits(
+                    max_connections=self.config["max_connections_per_host"] * self.config["max_hosts"],
+                    max_keepalive_connections=self.config["max_connections_per_host"],
+                    keepalive_expiry=self.config["keepalive_expiry"],
+                ),
+            ),
+        )
+
+    def get_async_client(self, verify=True, retry=True) -> httpx.AsyncClient:
+        """Returns the async client of the running event loop. Dropped along with the loop."""
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            if (verify, retry) not in clients:
+                clients[(verify, retry)] = self.create_async_client(verify, retry)
+            return clients[(verify, retry)]
+
+    def collect_metrics(self):
+        """Collector for the `MetricsRegistry`. Reads the stats of the urllib3 pools."""
+
+        gauges = {}
+        adapters = {adapter for session in list(self._sessions.values()) for adapter in session.adapters.values()}
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                host = f"{pool.scheme}://{pool.host}:{pool.port}"
+                gauges[get_metric_key("http_pool_requests", host=host)] = pool.num_requests
+                gauges[get_metric_key("http_pool_connections", host=host)] = pool.num_connections
+                gauges[get_metric_key("http_pool_reuse_ratio", host=host)] = (
+                    round(1 - pool.num_connections / pool.num_requests, 4) if pool.num_requests else 0.0
+                )
+        return gauges
+
+
+http_clients = HTTPClientManager()
+
+
+def get_http_session(retry=True) -> requests.Session:
+    """Returns the process wide pooled `requests.Session`."""
+
+    return http_clients.get_session(retry)
+
+
+def get_async_http_client(verify=True, retry=True) -> httpx.AsyncClient:
+    """Returns the pooled `httpx.AsyncClient` of the running event loop."""
+
+    return http_clients.get_async_client(verify, retry)
@@ -0,0 +1,152 @@
+import logging
+import os
+import queue
+import random
+import re
+import threading
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connection
+
+from apps.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# path segments replaced by `{id}` in the path template, keeps the metric labels bounded
+ID_SEGMENT_PATTERN = re.compile(
+    r"^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|[0-9a-fA-F]{16,}|.*@.*)$"
+)
+
+
+def get_path_template(path):
+    """Returns the path with the ids replaced. Eg: `/api/users/42/` => `/api/users/{id}/`."""
+
+    return "/".join("{id}" if ID_SEGMENT_PATTERN.match(segment) else segment for segment in path.split("/"))
+
+
+class OutboundLogWriter:
+    """
+    Writes the sampled outbound calls as `Log` rows on a background thread. The callers only put
+    the row on a bounded queue, the rows are dropped when the queue is full.
+
+    Metrics - outbound_http_log_written, outbound_http_log_dropped
+    """
+
+    category = "outbound_http"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    @property
+    def config(self):
+        """Returns the `OUTBOUND_HTTP_CONFIG`."""
+
+        return settings.OUTBOUND_HTTP_CONFIG
+
+    def get_queue(self):
+        """Returns the queue, the writer thread is started on the first call in every process."""
+
+        pid = os.getpid()
+        with self._lock:
+            if self._queue is None or self._pid != pid:
+                self._queue = queue.Queue(maxsize=self.config["log_queue_size"])
+                self._pid = pid
+                threading.Thread(target=self.run, args=(self._queue,), daemon=True).start()
+            return self._queue
+
+    def enqueue(self, data):
+        """Queue the row without blocking."""
+
+        try:
+            self.get_queue().put_nowait(data)
+        except queue.Full:
+            metrics.increment("outbound_http_log_dropped")
+
+    def write(self, rows):
+        """Bulk create the rows."""
+
+        from apps.common.models.trackers import Log
+
+        Log.objects.bulk_create([Log(data=row, category=self.category) for row in rows])
+        metrics.increment("outbound_http_log_written", len(rows))
+
+    def run(self, rows_queue):
+        """Writer loop, flushes every `log_batch_size` rows or `log_flush_interval` seconds."""
+
+        while True:
+            rows = [rows_queue.get()]
+            try:
+                while len(rows) < self.config["log_batch_size"]:
+                    rows.append(rows_queue.get(timeout=self.config["log_flush_interval"]))
+            except queue.Empty:
+                pass
+
+            try:
+                self.write(rows)
+            except Exception as error:  # noqa
+                logger.warning(f"OutboundLogWriter: unable to write {len(rows)} rows: {error}")
+            finally:
+                connection.close()
+
+
+class OutboundCallRecorder:
+    """
+    Records the outbound http calls made using the `make_http_request` & `amake_http_request`.
+    Only in memory work is done on the caller, the sampled `Log` rows are written in the background.
+
+    Configured using the `OUTBOUND_HTTP_CONFIG`. The labels are - method, host, path(template).
+
+    Metrics -
+        outbound_http_requests{method, host, path, status}
+        outbound_http_duration_seconds{method, host, path}: histogram
+        outbound_http_request_bytes{host}, outbound_http_response_bytes{host}
+    """
+
+    def __init__(self):
+        self.log_writer = OutboundLogWriter()
+
+    @property
+    def config(self):
+        """Returns the `OUTBOUND_HTTP_CONFIG`."""
+
+        return settings.OUTBOUND_HTTP_CONFIG
+
+    @staticmethod
+    def is_sampled(rate):
+        """Returns if the call is part of the sample."""
+
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def record(self, method, url, status, duration, request_size=0, response_size=0):
+        """Record a call. The `status` is the response's status code or `error` if no response."""
+
+        if not self.is_sampled(self.config["sample_rate"]):
+            return
+
+        parsed_url = urlsplit(url)
+        host, path = parsed_url.netloc, get_path_template(parsed_url.path)
+        method = method.upper()
+
+        metrics.increment("outbound_http_requests", method=method, host=host, path=path, status=status)
+        metrics.observe("outbound_http_duration_seconds", duration, method=method, host=host, path=path)
+        metrics.increment("outbound_http_request_bytes", request_size, host=host)
+        metrics.increment("outbound_http_response_bytes", response_size, host=host)
+
+        if self.is_sampled(self.config["log_sample_rate"]):
+            self.log_writer.enqueue(
+                {
+                    "method": method,
+                    "host": host,
+                    "path": path,
+                    "status": status,
+                    "duration_ms": round(duration * 1000, 2),
+                    "request_bytes": request_size,
+                    "response_bytes": response_size,
+                }
+            )
+
+
+outbound_recorder = OutboundCallRecorder()
@@ -1,17 +1,32 @@
+import logging
+import threading
+import time
+from contextlib import suppress
+
+import httpx
+import jwt
+import requests
 from django.conf import settings
 from rest_framework import serializers
 from rest_framework.authentication import get_authorization_header
 
-from apps.common.helpers import make_http_request
+from apps.common.caches import TwoTierCache
+from apps.common.circuit_breaker import get_circuit_breaker
+from apps.common.helpers import amake_http_request, make_http_request
+from apps.common.metrics import metrics
+from apps.common.single_flight import SingleFlight, distributed_lock
 from config.settings import IDP_CONFIG
 
+logger = logging.getLogger(__name__)
+
 
 class IDPCommunicator:
     """
     Communicates with IDP services and returns the response. This is the one way class to communicate with the
     running IDP service.
 
-    IDP communicates using only two methods => `GET` & `POST`.
+    IDP communicates using only two methods => `GET` & `POST`. The async `aget` is used from the
+    consumers & the websocket middleware, it shares the pooled clients.
     """
 
     @staticmethod
@@ -31,36 +46,111 @@ class IDPCommunicator:
 
         return headers
 
+    @staticmethod
+    def get_timeout():
+        """`(connect, read)` timeout for the IDP calls in seconds."""
+
+        return settings.IDP_HTTP_CONFIG["connect_timeout"], settings.IDP_HTTP_CONFIG["timeout"]
+
+    @staticmethod
+    def get_unavailable_response(reason):
+        """Response used when the IDP is not reachable or the circuit is open. No status code."""
+
+        return {"data": None, "status_code": None, "reason": reason}
+
+    @staticmethod
+    def record_response(breaker, response):
+        """Only the 5xx responses are failures, 4xx means the IDP is up & rejected the request."""
+
+        if response["status_code"] >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    def request(self, host, url_path, **kwargs):
+        """
+        Make the request through the host's circuit breaker with bounded timeouts. Any other error
+        is also a failure of the circuit, refer `CircuitBreaker.guard`. The call is not retried, so
+        it is never waited beyond the timeout & every failure reaches the breaker.
+        """
+
+        breaker = get_circuit_breaker(host)
+        if not breaker.allow_request():
+            return self.get_unavailable_response("IDP circuit is open.")
+
+        with breaker.guard():
+            try:
+                response = make_http_request(
+                    url=f"{host}{url_path}", timeout=self.get_timeout(), retry=False, **kwargs
+                )
+            except requests.RequestException as error:
+                breaker.record_failure()
+                return self.get_unavailable_response(str(error))
+            return self.record_response(breaker, response)
+
+    async def arequest(self, host, url_path, **kwargs):
+        """Async version of the `request`."""
+
+        breaker = get_circuit_breaker(host)
+        if not breaker.allow_request():
+            return self.get_unavailable_response("IDP circuit is open.")
+
+        connect_timeout, read_timeout = self.get_timeout()
+        with breaker.guard():
+            try:
+                response = await amake_http_request(
+                    url=f"{host}{url_path}",
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                    retry=False,
+                    **kwargs,
+                )
+            except httpx.HTTPError as error:
+                breaker.record_failure()
+                return self.get_unavailable_response(str(error))
+            return self.record_response(breaker, response)
+
+    def get_request_kwargs(self, method, url_path, auth_token=None, params=None, data=None, host=None):
+        """Kwargs for the `request` & `arequest`. Common for the sync & async methods."""
+
+        kwargs = {
+            "host": host or self.get_host(),
+            "url_path": url_path,
+            "method": method,
+            "params": params or {},
+            "headers": self.get_headers(auth_token),
+        }
+        if method == "POST":
+            kwargs["data"] = data or {}
+        return kwargs
+
     def get(self, url_path, auth_token=None, params=None, host=None):
         """Make get request."""
 
-        if params is None:
-            params = {}
-        if not host:
-            host = self.get_host()
-        return make_http_request(
-            url=f"{host}{url_path}",
-            method="GET",
-            params=params,
-            headers=self.get_headers(auth_token),
-        )
+        return self.request(**self.get_request_kwargs("GET", url_path, auth_token, params, host=host))
+
+    async def aget(self, url_path, auth_token=None, params=None, host=None):
+        """Async version of the `get`."""
+
+        return await self.arequest(**self.get_request_kwargs("GET", url_path, auth_token, params, host=host))
 
     def post(self, url_path, data=None, auth_token=None, params=None, host=None):
         """Make post request."""
 
-        if data is None:
-            data = {}
-        if params is None:
-            params = {}
-        if not host:
-            host = self.get_host()
-        return make_http_request(
-            url=f"{host}{url_path}",
-            method="POST",
-            data=data,
-            params=params,
-            headers=self.get_headers(auth_token),
-        )
+        return self.request(**self.get_request_kwargs("POST", url_path, auth_token, params, data, host))
+
+
+# statuses by which the IDP rejects the token itself, the only failures cached as rejections
+IDP_TOKEN_REJECTION_STATUS_CODES = {401, 403}
+
+
+def is_idp_unavailable(response):
+    """
+    Returns if the failed IDP response does not say anything about the token. Anything other than
+    the `IDP_TOKEN_REJECTION_STATUS_CODES` is treated as an outage(circuit open, timeout, 5xx, 429).
+    """
+
+    return response.get("status_code") not in IDP_TOKEN_REJECTION_STATUS_CODES
 
 
 def idp_post_request(url_path, data=None, auth_token=None, params=None, host=None):
@@ -81,22 +171,153 @@ def idp_get_request(url_path, auth_token=None, params=None, host=None):
     return False, response
 
 
-def idp_admin_auth_token(raise_drf_error=True, field=None):
-    """Returns the IDP admin auth token."""
+async def aidp_get_request(url_path, auth_token=None, params=None, host=None):
+    """Async version of the `idp_get_request`."""
+
+    response = await IDPCommunicator().aget(url_path=url_path, auth_token=auth_token, params=params, host=host)
+    if response.get("status_code") == 200:
+        return True, response["data"]
+    return False, response
+
+
+class IDPAdminToken:
+    """
+    Cache of the IDP admin access token, so that the admin workflows don't login on every call.
+    Shared across the workers using the redis tier of the `TwoTierCache`.
+
+        > fresh     : the cached token is used
+        > due       : within `refresh_ahead` of the expiry, the token is refreshed on a background
+                      thread(one per worker) while all the callers keep using the current token
+        > expired   : refreshed synchronously. Concurrent callers share a single login, coalesced within
+                      the process & across the workers using a redis lock
+        > rejected  : `get_token(stale_token=...)` forces a refresh unless another caller has
+                      already replaced the rejected token. The callers are expected to pass the
+                      token rejected by the IDP(401), the admin calls are not wrapped here
+
+    Metrics - idp_admin_token_login{success}
+    """
+
+    key = "admin"
+
+    def __init__(self):
+        self.config = settings.IDP_ADMIN_TOKEN_CONFIG
+        self.cache = TwoTierCache(
+            name="idp:admin:token",
+            timeout=self.config["default_ttl"],
+            local_timeout=self.config["local_ttl"],
+            local_max_size=4,
+        )
+        self.flights = SingleFlight("idp:admin:token")
+        self._lock = threading.Lock()
+        self._is_refreshing = False
+
+    @staticmethod
+    def get_expires_in(data):
+        """Seconds in which the token expires. From the response, else from the token's `exp`."""
+
+        if expires_in := data.get("expireInSeconds"):
+            return int(expires_in)
+        with suppress(jwt.PyJWTError):
+            if exp := jwt.decode(data["accessToken"], options={"verify_signature": False}).get("exp"):
+                return int(exp - time.time())
+        return None
+
+    def login(self):
+        """Login using the admin credentials & cache the token. Returns `(success, entry / response)`."""
+
+        success, data = idp_post_request(
+            url_path=IDP_CONFIG["authenticate_url"],
+            data={
+                "userNameOrEmailAddress": settings.IDP_ADMIN_EMAIL,
+                "password": settings.IDP_ADMIN_PASSWORD,
+                "rememberClient": True,
+                # "tenancyName": settings.IDP_ADMIN_TENANCY_NAME,  # For Super Admin it's not required.
+            },
+        )
+        metrics.increment("idp_admin_token_login", success=success)
+        if not success:
+            return False, data
+
+        expires_in = self.get_expires_in(data) or self.config["default_ttl"]
+        now = time.time()
+        entry = {
+            "token": data["accessToken"],
+            "exp": now + expires_in,
+            "refresh_at": now + max(expires_in - self.config["refresh_ahead"], 0),
+        }
+        self.cache.set(self.key, entry, timeout=expires_in)
+        return True, entry
+
+    def refresh(self, stale_token=None):
+        """
+        Returns the token refreshed by this or a concurrent caller. The `stale_token` is never
+        returned, even if it is not due yet(Eg: revoked by the IDP).
+        """
+
+        def _refresh():
+            lock_timeout = self.config["lock_timeout"]
+            with distributed_lock("idp:admin:token:refresh", timeout=lock_timeout, blocking_timeout=lock_timeout):
+                # the token might have been refreshed by another worker while waiting for the lock
+                self.cache.local.delete(self.key)
+                entry = self.cache.get(self.key, track=False)
+                if entry and time.time() < entry["refresh_at"] and entry["token"] != stale_token:
+                    return True, entry
+                return self.login()
+
+        return self.flights.do(stale_token or self.key, _refresh)
+
+    def refresh_in_background(self):
+        """Refresh the token on a daemon thread, the current token is used till then."""
+
+        with self._lock:
+            if self._is_refreshing:
+                return
+            self._is_refreshing = True
+
+        def _refresh():
+            try:
+                self.refresh()
+            except Exception as error:  # noqa
+                logger.warning(f"IDPAdminToken: background refresh failed: {error}")
+            finally:
+                self._is_refreshing = False
+
+        threading.Thread(target=_refresh, daemon=True).start()
+
+    def get_token(self, stale_token=None):
+        """Returns `(success, token / failed response)`. Pass the `stale_token` to force a refresh."""
+
+        if stale_token:
+            success, entry = self.refresh(stale_token=stale_token)
+            return success, entry["token"] if success else entry
+
+        entry = self.cache.get(self.key)
+        now = time.time()
+        if entry and now < entry["exp"]:
+            if now >= entry["refresh_at"]:
+                self.refresh_in_background()
+            return True, entry["token"]
+
+        success, entry = self.refresh()
+        return success, entry["token"] if success else entry
+
+    def invalidate(self):
+        """Remove the cached token. Eg: on change of the admin credentials."""
+
+        self.cache.delete(self.key)
+
+
+idp_admin_token = IDPAdminToken()
+
+
+def idp_admin_auth_token(raise_drf_error=True, field=None, stale_token=None):
+    """Returns the IDP admin auth token. Cached till its expiry, refer `IDPAdminToken`."""
 
-    success, data = idp_post_request(
-        url_path=IDP_CONFIG["authenticate_url"],
-        data={
-            "userNameOrEmailAddress": settings.IDP_ADMIN_EMAIL,
-            "password": settings.IDP_ADMIN_PASSWORD,
-            "rememberClient": True,
-            # "tenancyName": settings.IDP_ADMIN_TENANCY_NAME,  # For Super Admin it's not required.
-        },
-    )
+    success, data = idp_admin_token.get_token(stale_token=stale_token)
     if not success and raise_drf_error:
         assert field
         raise serializers.ValidationError({field: "IDP Authentication failed!"})
-    return data["accessToken"]
+    return data if success else None
 
 
 def get_auth_token(request):
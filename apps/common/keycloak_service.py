@@ -0,0 +1,279 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from django.conf import settings
+
+from apps.common.http_client import get_async_http_client, get_http_session
+from apps.common.metrics import metrics
+from apps.common.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# coalesces the concurrent async key set fetches of an issuer, the sync ones are serialized by the lock
+jwks_flights = SingleFlight("keycloak:jwks")
+
+
+def get_ssl_verify():
+    """`verify` of the KC calls, the CA bundle path if configured, else `KEYCLOAK_CONFIG["verify_ssl"]`."""
+
+    return settings.KEYCLOAK_CONFIG["ca_bundle"] or settings.KEYCLOAK_CONFIG["verify_ssl"]
+
+
+def get_jwks_uri(issuer):
+    """Returns the `jwks_uri` from the OpenID discovery document of the given issuer."""
+
+    openid_config_url = f"{issuer}/.well-known/openid-configuration"
+    response = get_http_session().get(
+        openid_config_url, verify=get_ssl_verify(), timeout=settings.KEYCLOAK_CONFIG["http_timeout"]
+    )
+    response.raise_for_status()
+    return response.json().get("jwks_uri")
+
+
+def get_jwk_set(jwks_uri):
+    """Fetches the JWK set from the given uri."""
+
+    response = get_http_session().get(
+        jwks_uri, verify=get_ssl_verify(), timeout=settings.KEYCLOAK_CONFIG["http_timeout"]
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def aget_jwks_uri(issuer):
+    """Async version of the `get_jwks_uri`."""
+
+    response = await get_async_http_client(verify=get_ssl_verify()).get(
+        f"{issuer}/.well-known/openid-configuration", timeout=settings.KEYCLOAK_CONFIG["http_timeout"]
+    )
+    response.raise_for_status()
+    return response.json().get("jwks_uri")
+
+
+async def aget_jwk_set(jwks_uri):
+    """Async version of the `get_jwk_set`."""
+
+    response = await get_async_http_client(verify=get_ssl_verify()).get(
+        jwks_uri, timeout=settings.KEYCLOAK_CONFIG["http_timeout"]
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+class KeycloakVerifier:
+    """
+    Holds the OpenID discovery document and the signing keys(by `kid`) of a single KC issuer.
+
+    Steady state lookups are served from memory. The key set is refreshed:
+        > in the background, once the keys are older than `jwks_ttl - jwks_refresh_ahead`
+        > synchronously, once the keys are expired
+        > synchronously, when a token is signed with an unknown `kid` (key rotation). These
+          forced refetches are rate limited by `jwks_min_refetch_interval`.
+    """
+
+    def __init__(self, issuer_url):
+        self.issuer_url = issuer_url
+        self.config = settings.KEYCLOAK_CONFIG
+
+        self._lock = threading.Lock()
+        self._jwks_uri = None
+        self._jwks_uri_expires_at = 0.0
+        self._keys = {}
+        self._keys_expires_at = 0.0
+        self._last_fetched_at = 0.0
+        self._is_refreshing = False
+
+    def increment(self, name):
+        """Record a metric labelled with the issuer."""
+
+        metrics.increment(name, issuer=self.issuer_url)
+
+    def get_cached_jwks_uri(self):
+        """Returns the cached `jwks_uri`, None once the discovery document's ttl is crossed."""
+
+        if self._jwks_uri and time.monotonic() < self._jwks_uri_expires_at:
+            self.increment("keycloak_discovery_hit")
+            return self._jwks_uri
+
+        self.increment("keycloak_discovery_miss")
+        return None
+
+    def set_jwks_uri(self, jwks_uri):
+        """Store the `jwks_uri` from the discovery document."""
+
+        self._jwks_uri = jwks_uri
+        self._jwks_uri_expires_at = time.monotonic() + self.config["discovery_ttl"]
+        return jwks_uri
+
+    def get_jwks_uri(self):
+        """Returns the `jwks_uri`, the discovery document is fetched only after the ttl."""
+
+        return self.get_cached_jwks_uri() or self.set_jwks_uri(get_jwks_uri(self.issuer_url))
+
+    async def aget_jwks_uri(self):
+        """Async version of the `get_jwks_uri`."""
+
+        return self.get_cached_jwks_uri() or self.set_jwks_uri(await aget_jwks_uri(self.issuer_url))
+
+    def load_jwk_set(self, data):
+        """Parse & store the fetched JWK set. Only the signing keys are considered."""
+
+        keys = {}
+        for key in jwt.PyJWKSet.from_dict(data).keys:
+            if key.public_key_use in [None, "sig"]:
+                keys[key.key_id] = key
+
+        now = time.monotonic()
+        self._keys = keys
+        self._last_fetched_at = now
+        self._keys_expires_at = now + self.config["jwks_ttl"]
+
+    def should_refresh(self, force=False):
+        """Returns if the key set has to be fetched. When `force` is set, the refetch is rate limited."""
+
+        now = time.monotonic()
+        if force:
+            return now - self._last_fetched_at >= self.config["jwks_min_refetch_interval"]
+        # some other thread might have already refreshed the keys
+        return now >= self._keys_expires_at - self.config["jwks_refresh_ahead"]
+
+    def refresh(self, force=False):
+        """Fetch the key set."""
+
+        with self._lock:
+            if not self.should_refresh(force):
+                return
+
+            self.increment("keycloak_jwks_fetch")
+            self.load_jwk_set(get_jwk_set(self.get_jwks_uri()))
+
+    async def afetch(self):
+        """Fetch & load the key set."""
+
+        self.increment("keycloak_jwks_fetch")
+        self.load_jwk_set(await aget_jwk_set(await self.aget_jwks_uri()))
+
+    async def arefresh(self, force=False):
+        """Async version of the `refresh`. Concurrent coroutines share a single fetch, refer `jwks_flights`."""
+
+        if not self.should_refresh(force):
+            return
+
+        await jwks_flights.ado(self.issuer_url, self.afetch)
+
+    def refresh_in_background(self):
+        """Refresh the keys on a daemon thread, the current keys are used till then."""
+
+        with self._lock:
+            if self._is_refreshing:
+                return
+            self._is_refreshing = True
+
+        def _refresh():
+            try:
+                self.refresh()
+            except Exception as error:  # noqa
+                logger.warning(f"KeycloakVerifier: background refresh failed for {self.issuer_url}: {error}")
+            finally:
+                self._is_refreshing = False
+
+        threading.Thread(target=_refresh, daemon=True).start()
+
+    def lookup(self, kid):
+        """Returns the cached key for the `kid`. When the token has no `kid`, the only key is used."""
+
+        if time.monotonic() >= self._keys_expires_at:
+            return None
+        if kid is None:
+            return next(iter(self._keys.values())) if len(self._keys) == 1 else None
+        return self._keys.get(kid)
+
+    def get_cached_signing_key(self, kid):
+        """Returns the key from memory. Schedules a background refresh when the keys are about to expire."""
+
+        if key := self.lookup(kid):
+            self.increment("keycloak_jwks_hit")
+            if time.monotonic() >= self._keys_expires_at - self.config["jwks_refresh_ahead"]:
+                self.refresh_in_background()
+            return key
+
+        self.increment("keycloak_jwks_miss")
+        return None
+
+    def get_refreshed_signing_key(self, kid):
+        """Returns the key after the key set is refetched. Raises if the `kid` is still unknown."""
+
+        if key := self.lookup(kid):
+            return key
+
+        raise jwt.InvalidTokenError(f"Unable to find a signing key that matches: {kid}")
+
+    def get_signing_key(self, token):
+        """Returns the `PyJWK` used to sign the given token."""
+
+        kid = jwt.get_unverified_header(token).get("kid")
+        if key := self.get_cached_signing_key(kid):
+            return key
+
+        self.refresh(force=time.monotonic() < self._keys_expires_at)
+        return self.get_refreshed_signing_key(kid)
+
+    async def aget_signing_key(self, token):
+        """Async version of the `get_signing_key`."""
+
+        kid = jwt.get_unverified_header(token).get("kid")
+        if key := self.get_cached_signing_key(kid):
+            return key
+
+        await self.arefresh(force=time.monotonic() < self._keys_expires_at)
+        return self.get_refreshed_signing_key(kid)
+
+
+class KeycloakVerifierRegistry:
+    """
+    Process wide registry of the `KeycloakVerifier` per issuer. The issuer comes from the
+    client, so the registry is bounded and the least recently used issuer is evicted.
+    """
+
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._verifiers = OrderedDict()
+
+    def get(self, issuer_url) -> KeycloakVerifier:
+        """Returns the verifier for the issuer. Created on the first call."""
+
+        with self._lock:
+            verifier = self._verifiers.get(issuer_url)
+            if verifier:
+                self._verifiers.move_to_end(issuer_url)
+                return verifier
+
+            verifier = self._verifiers[issuer_url] = KeycloakVerifier(issuer_url)
+            while len(self._verifiers) > self.max_size:
+                self._verifiers.popitem(last=False)
+            return verifier
+
+    def clear(self):
+        """Drop all the cached verifiers."""
+
+        with self._lock:
+            self._verifiers.clear()
+
+
+keycloak_verifiers = KeycloakVerifierRegistry()
+
+
+def get_keycloak_signing_key(issuer_url, token):
+    """Returns the signing key for the given KC token from the process wide registry."""
+
+    return keycloak_verifiers.get(issuer_url).get_signing_key(token)
+
+
+async def aget_keycloak_signing_key(issuer_url, token):
+    """Async version of the `get_keycloak_signing_key`."""
+
+    return await keycloak_verifiers.get(issuer_url).aget_signing_key(token)
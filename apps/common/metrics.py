@@ -0,0 +1,140 @@
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+# upper bounds(seconds) of the latency histogram buckets
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# label value of the series recorded once a metric has `max_series_per_metric` series
+OVERFLOW_LABEL_VALUE = "other"
+
+
+def get_metric_key(name: str, **labels) -> str:
+    """
+    Returns the flat key for the given metric name and labels. The format is similar
+    to the prometheus exposition format. Eg: `keycloak_jwks_hit{issuer="..."}`.
+    """
+
+    if not labels:
+        return name
+
+    _labels = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return f"{name}{{{_labels}}}"
+
+
+class MetricsRegistry:
+    """
+    In-process registry for the app's performance counters. Every worker process has its own
+    registry, the values are not shared across the workers.
+
+    Usage -
+        from apps.common.metrics import metrics
+        metrics.increment("keycloak_jwks_hit", issuer=issuer_url)
+
+    Some labels come from the clients(Eg: the host of the `Issuer-Url`), so the series of a metric
+    are bounded by `METRICS_CONFIG["max_series_per_metric"]`. Beyond it, the new label sets are
+    recorded in the series with all the labels as `other`.
+
+    Available methods -
+        increment, set_gauge, observe, get, register_collector, snapshot, reset
+
+    Metrics - metrics_series_overflow{metric}
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._histograms = {}
+        self._series = defaultdict(set)
+        self._collectors = []
+
+    def get_series_key(self, name: str, labels: dict) -> str:
+        """Returns the key of the series, the overflow series if the metric is full. Called with the lock acquired."""
+
+        key = get_metric_key(name, **labels)
+        series = self._series[name]
+        if not labels or key in series:
+            return key
+
+        if len(series) >= settings.METRICS_CONFIG["max_series_per_metric"]:
+            self._counters[get_metric_key("metrics_series_overflow", metric=name)] += 1
+            key = get_metric_key(name, **dict.fromkeys(labels, OVERFLOW_LABEL_VALUE))
+        series.add(key)
+        return key
+
+    def increment(self, name: str, value: int = 1, **labels):
+        """Increment the counter identified by `name` & `labels`."""
+
+        with self._lock:
+            self._counters[self.get_series_key(name, labels)] += value
+
+    def set_gauge(self, name: str, value, **labels):
+        """Set the current value of the gauge identified by `name` & `labels`."""
+
+        with self._lock:
+            self._gauges[self.get_series_key(name, labels)] = value
+
+    def observe(self, name: str, value, buckets=DEFAULT_LATENCY_BUCKETS, **labels):
+        """
+        Record the value in the histogram identified by `name` & `labels`. The buckets are
+        cumulative like prometheus, `le` => number of values less than or equal to the bound.
+        """
+
+        with self._lock:
+            key = self.get_series_key(name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": dict.fromkeys(buckets, 0), "sum": 0, "count": 0}
+            for bound in histogram["buckets"]:
+                if value <= bound:
+                    histogram["buckets"][bound] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def get(self, name: str, **labels):
+        """Returns the current value of a counter or gauge. Used for hit ratios and debugging."""
+
+        key = get_metric_key(name, **labels)
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0))
+
+    def register_collector(self, collector):
+        """
+        Register a callable that returns a dict of gauges `{key: value}`. Collectors are called
+        only while taking a snapshot, so the hot paths don't pay for the computation.
+        """
+
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        """Returns a copy of all the metrics recorded by this worker."""
+
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {
+                key: {**histogram, "buckets": dict(histogram["buckets"])}
+                for key, histogram in self._histograms.items()
+            }
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            gauges.update(collector())
+
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def reset(self):
+        """Clear all the recorded values. Collectors are retained."""
+
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self._series.clear()
+
+
+metrics = MetricsRegistry()
@@ -27,7 +27,10 @@ class AppAuthMiddleware:
         self.request = None
 
     def __call__(self, request):
-        """Custom authentication for user."""
+        """
+        Custom authentication for user. The result is memoized on the request by the
+        `AppIDPTokenModelBackend` and re-used by DRF, the token is validated only once.
+        """
 
         user = authenticate(request)
 
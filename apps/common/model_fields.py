@@ -101,6 +101,21 @@ class AppSingleChoiceField(BaseField, models.CharField):
         return None in [*self.options, self.get_default_option()]
 
 
+class AppPresetDateTimeField(BaseField, models.DateTimeField):
+    """
+    `auto_now` / `auto_now_add` DateTimeField, which keeps the value already set on a new instance.
+    Used for the rows inserted with their timestamps assigned beforehand, like the write-behind
+    messages. Updates are timestamped as usual.
+    """
+
+    def pre_save(self, model_instance, add):
+        """Overridden to keep the preset value on insert."""
+
+        if add and (value := getattr(model_instance, self.attname)) is not None:
+            return value
+        return super().pre_save(model_instance, add)
+
+
 class AppPhoneNumberField(BaseField, PhoneNumberField):
     """Applications version of the PhoneNumberField. To define app's functions."""
 
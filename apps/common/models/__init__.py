@@ -6,3 +6,4 @@ from .base import (
     BaseModel,
     FileOnlyModel,
 )
+from .trackers import Log
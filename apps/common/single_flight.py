@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+
+from apps.common.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """An in-flight call of the `SingleFlight.do`."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces the concurrent calls for the same key within the process. The first caller(leader)
+    makes the call, the others wait & receive its result / exception.
+
+    Threads are coalesced using `do` & coroutines of the same event loop using `ado`.
+
+    Metrics - single_flight_leader{flight}, single_flight_shared{flight}
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+
+    def do(self, key, fn):
+        """Returns the result of `fn()`, shared with the concurrent callers of the same key."""
+
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            metrics.increment("single_flight_shared", flight=self.name)
+            call.event.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        metrics.increment("single_flight_leader", flight=self.name)
+        try:
+            call.result = fn()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+    def on_task_done(self, task_key, task):
+        """Remove the finished task. The exception is retrieved, in case all the waiters are cancelled."""
+
+        with self._lock:
+            self._tasks.pop(task_key, None)
+        if not task.cancelled():
+            task.exception()
+
+    async def ado(self, key, coro_fn):
+        """
+        Async version of the `do`. The call runs as a separate task, so cancelling one of the
+        waiters(Eg: a closed websocket) does not cancel the call for the others.
+        """
+
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            is_leader = task is None
+            if is_leader:
+                task = self._tasks[task_key] = loop.create_task(coro_fn())
+                task.add_done_callback(partial(self.on_task_done, task_key))
+
+        metrics.increment("single_flight_leader" if is_leader else "single_flight_shared", flight=self.name)
+        return await asyncio.shield(task)
+
+
+def get_distributed_lock(name, timeout=10, blocking_timeout=5, cache_alias="default"):
+    """Returns the redis lock for the name. None if the cache does not support locks(Eg: locmem)."""
+
+    lock_factory = getattr(caches[cache_alias], "lock", None)
+    if lock_factory is None:
+        return None
+    # acquired & released from different threads when used via `sync_to_async`
+    return lock_factory(f"lock:{name}", timeout=timeout, blocking_timeout=blocking_timeout, thread_local=False)
+
+
+def acquire_lock(lock):
+    """Returns if the lock is acquired. Failures are logged & treated as not acquired."""
+
+    if lock is None:
+        return False
+    try:
+        return lock.acquire()
+    except Exception as error:  # noqa
+        logger.warning(f"distributed_lock: unable to acquire {lock.name}: {error}")
+        return False
+
+
+def release_lock(lock):
+    """Release the acquired lock. Failures(Eg: lock expired) are logged."""
+
+    try:
+        lock.release()
+    except Exception as error:  # noqa
+        logger.warning(f"distributed_lock: unable to release {lock.name}: {error}")
+
+
+@contextmanager
+def distributed_lock(name, **kwargs):
+    """
+    Cross process lock on the redis cache. Yields if the lock is acquired. The caller proceeds even
+    when the lock is not acquired(`blocking_timeout` crossed, redis down, cache without lock support),
+    so the lock only reduces the duplicate work & never blocks beyond the `blocking_timeout`.
+    """
+
+    lock = get_distributed_lock(name, **kwargs)
+    acquired = acquire_lock(lock)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release_lock(lock)
+
+
+@asynccontextmanager
+async def adistributed_lock(name, **kwargs):
+    """Async version of the `distributed_lock`. The blocking redis calls are made on a thread."""
+
+    lock = get_distributed_lock(name, **kwargs)
+    acquired = await sync_to_async(acquire_lock, thread_sensitive=False)(lock)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            await sync_to_async(release_lock, thread_sensitive=False)(lock)
@@ -0,0 +1,43 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from apps.common.circuit_breaker import CircuitBreaker
+
+
+class CircuitBreakerGuardTestCase(SimpleTestCase):
+    """A call within the `guard` never leaves the circuit without a result or its probe slot."""
+
+    def get_half_open_breaker(self):
+        """Breaker which is open & allows its single probe right away."""
+
+        breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        return breaker
+
+    def test_error_is_recorded_as_failure(self):
+        breaker = CircuitBreaker("test", failure_threshold=1)
+        with self.assertRaises(KeyError), breaker.guard():
+            raise KeyError("unexpected")
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_cancelled_probe_releases_its_slot(self):
+        breaker = self.get_half_open_breaker()
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+
+        with self.assertRaises(asyncio.CancelledError), breaker.guard():
+            raise asyncio.CancelledError()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+
+    def test_release_after_a_transition_is_ignored(self):
+        breaker = self.get_half_open_breaker()
+        self.assertTrue(breaker.allow_request())
+        with self.assertRaises(KeyboardInterrupt), breaker.guard():
+            # another call re-opens & the circuit is half open again, with its probe taken
+            breaker.record_failure()
+            self.assertTrue(breaker.allow_request())
+            raise KeyboardInterrupt()
+        self.assertFalse(breaker.allow_request())
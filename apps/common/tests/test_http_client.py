@@ -0,0 +1,44 @@
+import asyncio
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.common.http_client import HTTPClientManager
+
+HTTP_CLIENT_CONFIG = {
+    "timeout": 10,
+    "connect_timeout": 5,
+    "max_hosts": 4,
+    "max_connections_per_host": 3,
+    "keepalive_expiry": 7,
+    "retries": 2,
+    "retry_backoff_factor": 0.2,
+}
+
+
+@override_settings(HTTP_CLIENT_CONFIG=HTTP_CLIENT_CONFIG)
+class HTTPClientManagerTestCase(SimpleTestCase):
+    """The pooled clients are configured from the `HTTP_CLIENT_CONFIG`."""
+
+    def get_async_client(self, **kwargs):
+        async def _get_async_client():
+            return HTTPClientManager().get_async_client(**kwargs)
+
+        return asyncio.run(_get_async_client())
+
+    def test_async_pool_limits(self):
+        pool = self.get_async_client()._transport._pool
+
+        self.assertEqual(pool._max_connections, 12)
+        self.assertEqual(pool._max_keepalive_connections, 3)
+        self.assertEqual(pool._keepalive_expiry, 7)
+        self.assertEqual(pool._retries, 2)
+
+    def test_async_client_without_retries(self):
+        self.assertEqual(self.get_async_client(retry=False)._transport._pool._retries, 0)
+
+    def test_session_retries(self):
+        manager = HTTPClientManager()
+
+        self.assertEqual(manager.get_session().get_adapter("https://idp").max_retries.total, 2)
+        self.assertEqual(manager.get_session(retry=False).get_adapter("https://idp").max_retries.total, 0)
+        self.assertIsNot(manager.get_session(), manager.get_session(retry=False))
@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase, override_settings
+
+from apps.common.metrics import MetricsRegistry, get_metric_key
+
+
+@override_settings(METRICS_CONFIG={"api_key": "", "max_series_per_metric": 2})
+class MetricsRegistryTestCase(SimpleTestCase):
+    """The series of a metric are bounded, the labels can come from the clients."""
+
+    def test_series_beyond_the_limit_are_recorded_as_other(self):
+        registry = MetricsRegistry()
+        for host in ("a", "b", "c", "d", "a"):
+            registry.increment("outbound_http_requests", host=host)
+            registry.observe("outbound_http_duration_seconds", 0.1, host=host)
+
+        snapshot = registry.snapshot()
+        self.assertEqual(
+            snapshot["counters"],
+            {
+                get_metric_key("outbound_http_requests", host="a"): 2,
+                get_metric_key("outbound_http_requests", host="b"): 1,
+                get_metric_key("outbound_http_requests", host="other"): 2,
+                get_metric_key("metrics_series_overflow", metric="outbound_http_requests"): 2,
+                get_metric_key("metrics_series_overflow", metric="outbound_http_duration_seconds"): 2,
+            },
+        )
+        self.assertEqual(len(snapshot["histograms"]), 3)
@@ -7,4 +7,5 @@ API_URL_PREFIX = "api"
 
 urlpatterns = [
     path(f"{API_URL_PREFIX}/server/status/", api.ServerStatusAPIView.as_view()),
+    path(f"{API_URL_PREFIX}/server/metrics/", api.MetricsAPIView.as_view()),
 ]
@@ -8,4 +8,5 @@ from .generic import (
     AppModelUpdateAPIViewSet,
     get_upload_api_view,
 )
+from .metrics import MetricsAPIView
 from .status import ServerStatusAPIView
@@ -0,0 +1,35 @@
+import os
+from secrets import compare_digest
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+from apps.common.metrics import metrics
+
+from .base import AppAPIView
+
+
+class IsMetricsScraper(BasePermission):
+    """Allows the staff users & the scrapers passing the `METRICS_CONFIG["api_key"]` in the `Metrics-Key` header."""
+
+    def has_permission(self, request, view):
+        """Check the key or the user."""
+
+        api_key = settings.METRICS_CONFIG["api_key"]
+        if api_key and compare_digest(request.headers.get("Metrics-Key", ""), api_key):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+class MetricsAPIView(AppAPIView):
+    """
+    Returns the counters, gauges & histograms recorded by the worker process that serves the
+    request. Every worker has its own registry, refer `MetricsRegistry`.
+    """
+
+    permission_classes = [IsMetricsScraper]
+
+    def get(self, *args, **kwargs):
+        """Send the snapshot of the registry."""
+
+        return self.send_response(data={"pid": os.getpid(), **metrics.snapshot()})
@@ -34,4 +34,9 @@ def is_beat_debug():
     return settings.APP_SWITCHES["CELERY_BEAT_DEBUG_MODE"]
 
 
-app.conf.beat_schedule = {}
+app.conf.beat_schedule = {
+    "reconcile_unread_counts": {
+        "task": "apps.chat.tasks.reconcile_unread_counts",
+        "schedule": 60 if is_beat_debug() else settings.UNREAD_CONFIG["reconcile_interval"],
+    },
+}
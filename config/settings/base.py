@@ -82,6 +82,160 @@ IDP_CONFIG = {
     "b2b_name": env.str("IDP_ADMIN_TENANCY_NAME", default=""),
 }
 
+# Outbound HTTP Client Configuration
+# ------------------------------------------------------------------------------
+HTTP_CLIENT_CONFIG = {
+    # default seconds, when the caller does not pass a timeout
+    "timeout": env.float("HTTP_CLIENT_TIMEOUT", default=10),
+    "connect_timeout": env.float("HTTP_CLIENT_CONNECT_TIMEOUT", default=5),
+    # number of hosts for which the pools are kept & the kept alive connections per host
+    "max_hosts": env.int("HTTP_CLIENT_MAX_HOSTS", default=16),
+    "max_connections_per_host": env.int("HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST", default=20),
+    "keepalive_expiry": env.float("HTTP_CLIENT_KEEPALIVE_EXPIRY", default=60),
+    # retries of the idempotent methods, sleeps `backoff_factor * 2 ** (retry - 1)` in between
+    "retries": env.int("HTTP_CLIENT_RETRIES", default=2),
+    "retry_backoff_factor": env.float("HTTP_CLIENT_RETRY_BACKOFF_FACTOR", default=0.2),
+}
+
+# Outbound HTTP Instrumentation Configuration
+# ------------------------------------------------------------------------------
+OUTBOUND_HTTP_CONFIG = {
+    # fraction of the calls recorded in the metrics & of those, written as `Log` rows
+    "sample_rate": env.float("OUTBOUND_HTTP_SAMPLE_RATE", default=1.0),
+    "log_sample_rate": env.float("OUTBOUND_HTTP_LOG_SAMPLE_RATE", default=0.0),
+    # the `Log` rows are written in batches on a background thread, dropped beyond the queue size
+    "log_queue_size": env.int("OUTBOUND_HTTP_LOG_QUEUE_SIZE", default=1000),
+    "log_batch_size": env.int("OUTBOUND_HTTP_LOG_BATCH_SIZE", default=100),
+    "log_flush_interval": env.float("OUTBOUND_HTTP_LOG_FLUSH_INTERVAL", default=5),
+}
+
+# Metrics API Configuration
+# ------------------------------------------------------------------------------
+METRICS_CONFIG = {
+    # passed in the `Metrics-Key` header by the scrapers, staff users can access without it
+    "api_key": env.str("METRICS_API_KEY", default=""),
+    # label sets per metric, bounds the memory as some labels come from the clients(Eg: `Issuer-Url`)
+    "max_series_per_metric": env.int("METRICS_MAX_SERIES_PER_METRIC", default=200),
+}
+
+# IDP Outbound HTTP Configuration
+# ------------------------------------------------------------------------------
+IDP_HTTP_CONFIG = {
+    # seconds, the IDP calls are never waited beyond these, they are not retried
+    "timeout": env.float("IDP_HTTP_TIMEOUT", default=5),
+    "connect_timeout": env.float("IDP_HTTP_CONNECT_TIMEOUT", default=3),
+    # consecutive failures(timeout, connection error, 5xx) after which the circuit is opened
+    "breaker_failure_threshold": env.int("IDP_BREAKER_FAILURE_THRESHOLD", default=5),
+    # seconds after which an open circuit allows probe calls
+    "breaker_recovery_timeout": env.int("IDP_BREAKER_RECOVERY_TIMEOUT", default=30),
+    "breaker_half_open_max_calls": env.int("IDP_BREAKER_HALF_OPEN_MAX_CALLS", default=1),
+}
+
+# IDP Admin Token Configuration
+# ------------------------------------------------------------------------------
+IDP_ADMIN_TOKEN_CONFIG = {
+    # seconds, used when the login response does not have the expiry
+    "default_ttl": env.int("IDP_ADMIN_TOKEN_DEFAULT_TTL", default=60 * 60),
+    # the token is refreshed in the background when it is this close to expiry
+    "refresh_ahead": env.int("IDP_ADMIN_TOKEN_REFRESH_AHEAD", default=5 * 60),
+    "local_ttl": env.int("IDP_ADMIN_TOKEN_LOCAL_TTL", default=60),
+    "lock_timeout": env.int("IDP_ADMIN_TOKEN_LOCK_TIMEOUT", default=10),
+}
+
+# KeyCloak Token Validation Configuration
+# ------------------------------------------------------------------------------
+KEYCLOAK_CONFIG = {
+    # seconds for which the discovery document & signing keys of an issuer are cached
+    "discovery_ttl": env.int("KEYCLOAK_DISCOVERY_TTL", default=24 * 60 * 60),
+    "jwks_ttl": env.int("KEYCLOAK_JWKS_TTL", default=20 * 60),
+    # keys are refreshed in the background when they are this close to expiry
+    "jwks_refresh_ahead": env.int("KEYCLOAK_JWKS_REFRESH_AHEAD", default=2 * 60),
+    # min seconds between refetches triggered by an unknown `kid`
+    "jwks_min_refetch_interval": env.int("KEYCLOAK_JWKS_MIN_REFETCH_INTERVAL", default=30),
+    "http_timeout": env.float("KEYCLOAK_HTTP_TIMEOUT", default=5),
+    # ssl verification of the discovery & key set calls, disabled by default. A CA bundle path enables it
+    "verify_ssl": env.bool("KEYCLOAK_VERIFY_SSL", default=False),
+    "ca_bundle": env.str("KEYCLOAK_CA_BUNDLE", default=""),
+}
+
+# Authentication Caches Configuration
+# ------------------------------------------------------------------------------
+AUTH_CACHE_CONFIG = {
+    # verified token => user, capped by the token's `exp`
+    "token_ttl": env.int("AUTH_TOKEN_CACHE_TTL", default=5 * 60),
+    "token_local_ttl": env.int("AUTH_TOKEN_CACHE_LOCAL_TTL", default=60),
+    "token_local_max_size": env.int("AUTH_TOKEN_CACHE_LOCAL_MAX_SIZE", default=10000),
+    # seconds beyond the `token_ttl` for which the entry is used only when the IDP is down
+    "token_stale_ttl": env.int("AUTH_TOKEN_CACHE_STALE_TTL", default=30 * 60),
+    # rejected token => failure detail, kept short lived
+    "rejected_token_ttl": env.int("AUTH_REJECTED_TOKEN_CACHE_TTL", default=60),
+    "rejected_token_local_max_size": env.int("AUTH_REJECTED_TOKEN_CACHE_LOCAL_MAX_SIZE", default=10000),
+    # concurrent verifications of a token are coalesced in the process, optionally across processes
+    "single_flight_distributed": env.bool("AUTH_SINGLE_FLIGHT_DISTRIBUTED", default=False),
+    "single_flight_lock_timeout": env.int("AUTH_SINGLE_FLIGHT_LOCK_TIMEOUT", default=10),
+    # idp tenant / user id => model instance, invalidated on save
+    "identity_ttl": env.int("AUTH_IDENTITY_CACHE_TTL", default=60 * 60),
+    "identity_local_ttl": env.int("AUTH_IDENTITY_CACHE_LOCAL_TTL", default=60),
+    "identity_local_max_size": env.int("AUTH_IDENTITY_CACHE_LOCAL_MAX_SIZE", default=10000),
+    # room => member user pks, a removed member is dropped from the other workers after the local ttl
+    "room_membership_ttl": env.int("AUTH_ROOM_MEMBERSHIP_CACHE_TTL", default=60 * 60),
+    "room_membership_local_ttl": env.int("AUTH_ROOM_MEMBERSHIP_CACHE_LOCAL_TTL", default=30),
+    "room_membership_local_max_size": env.int("AUTH_ROOM_MEMBERSHIP_CACHE_LOCAL_MAX_SIZE", default=10000),
+}
+
+# Chat Configuration
+# ------------------------------------------------------------------------------
+CHAT_CONFIG = {
+    # number of messages sent per `fetch_messages` page, the client can ask up to the max
+    "messages_page_size": env.int("CHAT_MESSAGES_PAGE_SIZE", default=10),
+    "messages_max_page_size": env.int("CHAT_MESSAGES_MAX_PAGE_SIZE", default=100),
+    # rooms a single multiplexed(`ws/chat/`) connection can subscribe to
+    "max_room_subscriptions": env.int("CHAT_MAX_ROOM_SUBSCRIPTIONS", default=100),
+    # group events arriving within the window are sent as a single `events` frame, 0 to disable
+    "coalesce_window_ms": env.int("CHAT_COALESCE_WINDOW_MS", default=0),
+    "coalesce_max_batch_size": env.int("CHAT_COALESCE_MAX_BATCH_SIZE", default=50),
+    # group events queued per connection, a client which can not keep up is closed with the resync code
+    "send_queue_size": env.int("CHAT_SEND_QUEUE_SIZE", default=500),
+    "slow_consumer_close_code": env.int("CHAT_SLOW_CONSUMER_CLOSE_CODE", default=4008),
+    # typing signals are accepted once per debounce per user & room, sent as an event per room per interval
+    "typing_interval": env.float("CHAT_TYPING_INTERVAL", default=1),
+    "typing_debounce": env.float("CHAT_TYPING_DEBOUNCE", default=2),
+    "typing_ttl": env.float("CHAT_TYPING_TTL", default=5),
+    # write-behind: the new messages are broadcast first & persisted in batches by a writer thread
+    "write_behind": env.bool("CHAT_WRITE_BEHIND", default=False),
+    "write_behind_batch_size": env.int("CHAT_WRITE_BEHIND_BATCH_SIZE", default=100),
+    "write_behind_flush_interval": env.float("CHAT_WRITE_BEHIND_FLUSH_INTERVAL", default=0.5),
+    "write_behind_queue_size": env.int("CHAT_WRITE_BEHIND_QUEUE_SIZE", default=10000),
+    "write_behind_max_retries": env.int("CHAT_WRITE_BEHIND_MAX_RETRIES", default=3),
+    "write_behind_shutdown_timeout": env.float("CHAT_WRITE_BEHIND_SHUTDOWN_TIMEOUT", default=10),
+}
+
+# Presence Configuration
+# ------------------------------------------------------------------------------
+PRESENCE_CONFIG = {
+    # seconds an user stays online without a heartbeat, eg: the worker crashed
+    "ttl": env.int("PRESENCE_TTL", default=90),
+    "heartbeat_interval": env.int("PRESENCE_HEARTBEAT_INTERVAL", default=30),
+}
+
+# Unread Counts Configuration
+# ------------------------------------------------------------------------------
+UNREAD_CONFIG = {
+    # seconds for which the counters of an idle room/user are kept on redis, reloaded from the db after
+    "ttl": env.int("UNREAD_TTL", default=60 * 60 * 24 * 7),
+    # seconds between the reconciliations of the room counters with the db
+    "reconcile_interval": env.int("UNREAD_RECONCILE_INTERVAL", default=60),
+    # seconds a room is idle before its reconciliation, covers the write-behind of the messages
+    "reconcile_settle": env.int("UNREAD_RECONCILE_SETTLE", default=30),
+}
+
+# Websocket Connection Ticket Configuration
+# ------------------------------------------------------------------------------
+WS_TICKET_CONFIG = {
+    # seconds for which a ticket can be used to open a websocket connection, a ticket opens only one
+    "ttl": env.int("WS_TICKET_TTL", default=60),
+}
+
 # DATABASES & ROUTER Settings for multi-tenant applications
 # ------------------------------------------------------------------------------
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -141,6 +295,9 @@ CHANNEL_LAYERS = {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
             "hosts": [env.str("REDIS_URL")],
+            # messages held per channel, the group sends to a full channel are dropped
+            "capacity": env.int("CHANNEL_LAYER_CAPACITY", default=100),
+            "expiry": env.int("CHANNEL_LAYER_EXPIRY", default=60),
         },
     },
 }
@@ -205,6 +362,11 @@ TEMP_ROOT = f"{MEDIA_ROOT}/temp"
 # AUTHENTICATION
 # ------------------------------------------------------------------------------
 AUTH_USER_MODEL = "chat.User"  # custom app user model
+AUTHENTICATION_BACKENDS = [
+    # token based, shares the per request result with the DRF backend
+    "apps.chat.auth_backends.AppIDPTokenModelBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
 
 # PASSWORDS
 # ------------------------------------------------------------------------------